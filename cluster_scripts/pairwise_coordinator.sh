@@ -5,9 +5,15 @@
 #SBATCH --mem=4G
 #SBATCH -o /scratch/summit/benheil@xsede.org/logs/build_network_coordinator-%j.out
 
+OUT_DIR='/scratch/summit/benheil@xsede.org/indices/data/combined_networks'
 
-for SPLIT in {0..15};
+# Index COCI and pack the heading pairs into work units that fit in memory
+sbatch -W run_build_pairwise.sh plan
+
+N_UNITS=`python -c "import json; print(len(json.load(open('$OUT_DIR/work_units.json'))['work_units']))"`
+
+for UNIT in `seq 0 $((N_UNITS - 1))`;
 do
-    sbatch -W run_build_pairwise.sh $SPLIT &
+    sbatch -W run_build_pairwise.sh $UNIT &
 done
 wait
@@ -1,5 +1,6 @@
 #!/bin/bash
-# Run the build_pairwise_networks script across a sixteenth of the headings
+# Run the build_pairwise_networks script on a single work unit, or plan the work units
+# if the argument is 'plan'
 
 #SBATCH --job-name build_pairwise_networks
 #SBATCH -p shas
@@ -19,11 +20,19 @@ fi
 
 echo $1
 
+if [ "$1" = "plan" ]
+then
+    UNIT_ARG="--plan_only"
+else
+    UNIT_ARG="--work_unit $1"
+fi
+
 python indices/build_pairwise_networks.py \
     --data_dir '/scratch/summit/benheil@xsede.org/indices/data/coci' \
     --metadata_dir '/scratch/summit/benheil@xsede.org/indices/data/pubmed/efetch' \
     --out_dir '/scratch/summit/benheil@xsede.org/indices/data/combined_networks' \
-    $1 \
+    --memory_budget_gb 64 \
+    $UNIT_ARG \
     "Anatomy" "Histocytochemistry" "Immunochemistry" "Molecular Biology" "Proteomics" \
     "Metabolomics" "Human Genetics" "Genetics Population"                             \
     "Genetic Research" "Food Microbiology" "Soil Microbiology" "Water Microbiology"   \
@@ -1 +1,13 @@
-from indices.algos import *
+import importlib
+
+
+def __getattr__(name):
+    # The algorithms are only imported once they're used, so importing a single
+    # submodule of the package doesn't pull in networkx
+    if name.startswith("__"):
+        raise AttributeError(f"module 'indices' has no attribute '{name}'")
+    algos = importlib.import_module("indices.algos")
+    try:
+        return getattr(algos, name)
+    except AttributeError:
+        raise AttributeError(f"module 'indices' has no attribute '{name}'") from None
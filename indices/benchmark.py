@@ -0,0 +1,274 @@
+"""
+Time the stages of the pipeline on synthetic citation graphs
+
+Each (stage, graph size, degree distribution) case runs in a fresh process so its peak
+memory usage isn't polluted by earlier cases. The results are written to a JSON file
+so runs with different engines or code versions can be compared without the cluster.
+"""
+import argparse
+import json
+import os
+import pickle as pkl
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict
+
+import networkx as nx
+import numpy as np
+
+import algos
+import pagerank
+from condense import condense_pair, load_heading_metadata
+from journals import aggregate_journals
+from profiling import get_peak_rss_mb, reset_peak_rss
+from shuffle_graph import shuffle_graph
+from split_pairwise_network import split_network
+from synthetic import (
+    DEGREE_DISTRIBUTIONS,
+    assign_headings,
+    make_citation_edges,
+    make_citation_graph,
+    write_coci_files,
+    write_pubmed_xml,
+)
+from utils import build_graphs, calculate_percentiles
+
+STAGES = [
+    "build_graphs",
+    "shuffle_graph",
+    "split_pairwise_network",
+    "pagerank",
+    "disruption_idx",
+    "calculate_percentiles",
+    "condense_pair",
+]
+
+
+def krylov_pagerank(graph: nx.DiGraph, solver: str) -> dict:
+    """Calculate PageRank with one of pagerank.py's fallback solvers on its own"""
+    nodes, indptr, indices = pagerank.graph_to_csr(graph)
+    y, _, converged = pagerank.solve_linear(
+        pagerank.build_transition_matrix(indptr, indices), max_iter=1000, solver=solver
+    )
+    if not converged:
+        raise nx.ExceededMaxIterations(f"{solver} failed to converge")
+    return dict(zip(nodes, (y / y.sum()).tolist()))
+
+
+# The PageRank implementations to compare. All of them take a graph and return a dict
+# mapping nodes to their PageRank
+PAGERANK_ENGINES: Dict[str, Callable[[nx.DiGraph], dict]] = {
+    "networkx": nx.pagerank,
+    "csr": pagerank.pagerank,
+    "component": partial(pagerank.pagerank, by_component=True),
+}
+for solver in pagerank.FALLBACK_SOLVERS:
+    PAGERANK_ENGINES[solver] = partial(krylov_pagerank, solver=solver)
+# These were removed in networkx 3.0, when nx.pagerank became the scipy version
+for engine_name in ["pagerank_scipy", "pagerank_numpy"]:
+    if hasattr(nx, engine_name):
+        PAGERANK_ENGINES[engine_name] = getattr(nx, engine_name)
+
+
+def make_shuffled_metrics(true_vals: dict, n_shuffles: int = 100, seed: int = 0):
+    """Create fake shuffled metric values in the format `calculate_percentiles` expects"""
+    rng = np.random.default_rng(seed)
+    dois = list(true_vals.keys())
+    vals = np.array([true_vals[doi] for doi in dois])
+    shuffled = rng.permuted(np.tile(vals, (n_shuffles, 1)), axis=1)
+    shuffled.sort(axis=0)
+    return {doi: shuffled[:, i].tolist() for i, doi in enumerate(dois)}
+
+
+def write_condense_inputs(root: str, graph: nx.DiGraph, n_shuffles: int = 100):
+    """
+    Write the true and shuffled PageRanks and the metadata for a pair of synthetic
+    headings in the layout `condense_pair` reads
+    """
+    heading_to_dois = assign_headings(graph.number_of_nodes())
+    os.makedirs(f"{root}/output/shuffle_results")
+    for heading, other_heading in [
+        ("synthetic_a", "synthetic_b"),
+        ("synthetic_b", "synthetic_a"),
+    ]:
+        split_heading = f"{heading}-{other_heading}"
+        true_vals = nx.pagerank(graph.subgraph(heading_to_dois[heading]))
+        with open(f"{root}/output/{split_heading}-pagerank.pkl", "wb") as out_file:
+            pkl.dump(true_vals, out_file)
+
+        doi_to_shuffled_metrics = make_shuffled_metrics(true_vals, n_shuffles)
+        for i in range(n_shuffles):
+            shuffle_path = (
+                f"{root}/output/shuffle_results/{split_heading}-{i}-pagerank.pkl"
+            )
+            with open(shuffle_path, "wb") as out_file:
+                pkl.dump(
+                    {doi: vals[i] for doi, vals in doi_to_shuffled_metrics.items()},
+                    out_file,
+                )
+
+    write_pubmed_xml(
+        f"{root}/data/pubmed/efetch/synthetic_a.xml.xz", heading_to_dois["synthetic_a"]
+    )
+
+
+def run_case(
+    stage: str, n_nodes: int, mean_degree: float, distribution: str, engine: str
+) -> dict:
+    """
+    Set up the inputs for one stage, then time it
+
+    Arguments
+    ---------
+    stage: The pipeline stage to benchmark
+    n_nodes: The number of nodes in the synthetic graph
+    mean_degree: The average out degree of the synthetic graph
+    distribution: The distribution the out degrees are drawn from
+    engine: The PageRank engine to use (only used by the pagerank stage)
+
+    Returns
+    -------
+    result: The wall time and memory usage of the stage
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if stage == "build_graphs":
+            citing, cited = make_citation_edges(n_nodes, mean_degree, distribution)
+            write_coci_files(
+                tmp_dir, citing, cited, edges_per_file=len(citing) // 4 + 1
+            )
+            heading_to_dois = assign_headings(n_nodes)
+
+            def run():
+                return build_graphs(tmp_dir, heading_to_dois)
+
+        else:
+            graph = make_citation_graph(n_nodes, mean_degree, distribution)
+
+        if stage == "shuffle_graph":
+
+            def run():
+                return shuffle_graph(graph, seed=0)
+
+        elif stage == "split_pairwise_network":
+            heading_to_dois = assign_headings(n_nodes)
+
+            def run():
+                return split_network(graph, *heading_to_dois.values())
+
+        elif stage == "pagerank":
+
+            def run():
+                return PAGERANK_ENGINES[engine](graph)
+
+        elif stage == "disruption_idx":
+
+            def run():
+                return algos.all_nodes_disruption_index(graph)
+
+        elif stage == "calculate_percentiles":
+            true_vals = nx.pagerank(graph)
+            doi_to_shuffled_metrics = make_shuffled_metrics(true_vals)
+
+            def run():
+                return calculate_percentiles(true_vals, doi_to_shuffled_metrics)
+
+        elif stage == "condense_pair":
+            write_condense_inputs(tmp_dir, graph)
+            # Parse the metadata once so the timing matches a cluster rerun, which
+            # loads the cached pickle of it
+            load_heading_metadata(tmp_dir, "synthetic_a")
+
+            def run():
+                df = condense_pair(tmp_dir, "synthetic_a", "synthetic_b")
+                return aggregate_journals(df)
+
+        setup_rss_mb = get_peak_rss_mb()
+        reset_peak_rss()
+        start = time.perf_counter()
+        run()
+        wall_time = time.perf_counter() - start
+        peak_rss_mb = get_peak_rss_mb()
+
+    return {
+        "stage": stage,
+        "engine": engine if stage == "pagerank" else None,
+        "n_nodes": n_nodes,
+        "mean_degree": mean_degree,
+        "distribution": distribution,
+        "wall_time_s": wall_time,
+        "setup_rss_mb": setup_rss_mb,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--out_file",
+        help="The JSON file to write the benchmark results to",
+        default="benchmark_results.json",
+    )
+    parser.add_argument(
+        "--stages",
+        help="The pipeline stages to benchmark",
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+    )
+    parser.add_argument(
+        "--sizes",
+        help="The number of nodes in each synthetic graph",
+        nargs="+",
+        type=int,
+        default=[1000, 10000],
+    )
+    parser.add_argument(
+        "--distributions",
+        help="The out degree distributions to generate graphs with",
+        nargs="+",
+        choices=DEGREE_DISTRIBUTIONS,
+        default=["powerlaw"],
+    )
+    parser.add_argument(
+        "--mean_degree",
+        help="The average number of citations per paper",
+        type=float,
+        default=10,
+    )
+    parser.add_argument(
+        "--engines",
+        help="The PageRank engines to compare",
+        nargs="+",
+        choices=list(PAGERANK_ENGINES.keys()),
+        default=list(PAGERANK_ENGINES.keys()),
+    )
+    parser.add_argument(
+        "--repeats", help="The number of times to run each case", type=int, default=1
+    )
+    args = parser.parse_args()
+
+    results = []
+    for stage in args.stages:
+        engines = args.engines if stage == "pagerank" else [None]
+        for engine in engines:
+            for n_nodes in args.sizes:
+                for distribution in args.distributions:
+                    for repeat in range(args.repeats):
+                        # A new process per case keeps peak memory measurements separate
+                        with ProcessPoolExecutor(max_workers=1) as executor:
+                            result = executor.submit(
+                                run_case,
+                                stage,
+                                n_nodes,
+                                args.mean_degree,
+                                distribution,
+                                engine,
+                            ).result()
+                        result["repeat"] = repeat
+                        print(json.dumps(result))
+                        results.append(result)
+
+    with open(args.out_file, "w") as out_file:
+        json.dump(results, out_file, indent=2)
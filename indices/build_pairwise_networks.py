@@ -1,17 +1,44 @@
-import itertools
-import pickle as pkl
-import os
+"""
+Build the citation networks for every pair of MeSH headings
 
-import argparse
+Pairs are packed into work units whose networks fit within a memory budget. Each work
+unit reads only the COCI files containing its pairs' citations and writes each network
+as soon as its last file has been read. The units can either be run one after another
+in a single process or spread across cluster jobs with --work_unit.
+
+With --group, all of the headings share one network rather than getting one per pair,
+and split_pairwise_network.py splits it (and its shuffles) into every heading's subgraph.
 
-from utils import build_graphs, parse_mesh_headings
+With --union_graph, COCI is instead read once into a single graph containing every
+citation between papers in the selected headings, and each pair's network is extracted
+from it. The union graph is saved in the output directory and reused by later jobs.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import pickle as pkl
+import sys
+
+from pairwise import (
+    BYTES_PER_EDGE,
+    build_doi_masks,
+    build_pair_graphs,
+    extract_pair_graph,
+    heading_pair_masks,
+    load_coci_index,
+    load_union_graph,
+    pack_work_units,
+    route_pairs,
+    union_pair_edges,
+)
+from profiling import add_profiling_args, configure_profiling, profile_phase
+from utils import parse_mesh_headings
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "fragment", help="Which sixteenth of the headings to process", type=int
-    )
     parser.add_argument(
         "--data_dir",
         help="The directory containing coci citations",
@@ -39,8 +66,46 @@ if __name__ == "__main__":
         nargs="+",
         help="The MeSH headings to make pairwise networks from",
     )
+    parser.add_argument(
+        "--memory_budget_gb",
+        help="The amount of memory the networks in a work unit can use together",
+        type=float,
+        default=64,
+    )
+    parser.add_argument(
+        "--bytes_per_edge",
+        help="The estimated memory used by each edge of a network",
+        type=float,
+        default=BYTES_PER_EDGE,
+    )
+    parser.add_argument(
+        "--work_unit",
+        help="Process only this work unit instead of all of them",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--plan_only",
+        help="Write the work unit plan to the output directory and exit without "
+        "building networks",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--group",
+        help="Build one network for all of the headings together instead of one for "
+        "each pair",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--union_graph",
+        help="Read COCI once into a graph of all selected headings' citations and "
+        "extract each pair's network from it",
+        action="store_true",
+    )
+    add_profiling_args(parser)
 
     args = parser.parse_args()
+    configure_profiling(args)
 
     headings = []
     for heading in args.headings_to_process:
@@ -56,40 +121,103 @@ if __name__ == "__main__":
         )
 
     headings_to_process = set(headings)
-    heading_to_dois = parse_mesh_headings(args.metadata_dir, headings_to_process)
-
-    heading_pairs = list(
-        itertools.combinations(sorted(list(heading_to_dois.keys())), 2)
-    )
-    start_idx = round(len(heading_pairs) * args.fragment / 16)
-    end_idx = round(len(heading_pairs) * (args.fragment + 1) / 16)
-    heading_pairs = heading_pairs[start_idx:end_idx]
+    with profile_phase("load"):
+        heading_to_dois = parse_mesh_headings(args.metadata_dir, headings_to_process)
+
+    if args.group:
+        heading_pairs = [tuple(sorted(heading_to_dois.keys()))]
+    else:
+        heading_pairs = list(
+            itertools.combinations(sorted(list(heading_to_dois.keys())), 2)
+        )
 
-    paired_headings = {}
-    for heading1, heading2 in heading_pairs:
-        first_dois = heading_to_dois[heading1]
-        second_dois = heading_to_dois[heading2]
-        combined_dois = first_dois.union(second_dois)
+    heading_to_bit, doi_to_mask = build_doi_masks(heading_to_dois)
+    # This is a 20GB object so let's go ahead and deallocate the memory
+    del heading_to_dois
 
-        out_file_path = os.path.join(args.out_dir, f"{heading1}+{heading2}" + ".pkl")
+    suffix = "-first_degree" if args.include_first_degree else ""
+
+    file_paths = sorted(glob.glob(f"{args.data_dir}/*"))
+    pair_to_mask = heading_pair_masks(heading_pairs, heading_to_bit)
+    if args.union_graph:
+        with profile_phase("index"):
+            union = load_union_graph(
+                os.path.join(args.out_dir, f"union_graph{suffix}.pkl"),
+                file_paths,
+                heading_to_bit,
+                doi_to_mask,
+                args.include_first_degree,
+            )
+        pair_to_edges = union_pair_edges(union, pair_to_mask, args.include_first_degree)
+    else:
+        with profile_phase("index"):
+            file_to_mask_counts = load_coci_index(
+                os.path.join(args.out_dir, "coci_index.pkl"),
+                file_paths,
+                heading_to_bit,
+                doi_to_mask,
+            )
+        pair_to_edges, pair_to_files = route_pairs(
+            file_to_mask_counts, pair_to_mask, args.include_first_degree
+        )
 
+    # Every pair is packed (even the finished ones) so the work unit numbering stays
+    # the same between jobs
+    pair_to_bytes = {
+        pair: edges * args.bytes_per_edge for pair, edges in pair_to_edges.items()
+    }
+    work_units = pack_work_units(pair_to_bytes, args.memory_budget_gb * 1024**3)
+
+    print(f"{len(work_units)} work units")
+    # Cluster jobs running single work units don't need to rewrite the plan
+    if args.work_unit is None:
+        with open(os.path.join(args.out_dir, "work_units.json"), "w") as out_file:
+            json.dump(
+                {
+                    "memory_budget_gb": args.memory_budget_gb,
+                    "work_units": work_units,
+                    "pair_to_edges": pair_to_edges,
+                },
+                out_file,
+                indent=2,
+            )
+    if args.plan_only:
+        sys.exit(0)
+
+    if args.work_unit is not None:
+        if args.work_unit >= len(work_units):
+            print(f"Work unit {args.work_unit} doesn't exist, nothing to do")
+            sys.exit(0)
+        work_units = [work_units[args.work_unit]]
+
+    def save_graph(pair, graph):
+        out_file_path = os.path.join(args.out_dir, pair + suffix + ".pkl")
+        with profile_phase("save", pair=pair):
+            with open(out_file_path, "wb") as out_file:
+                pkl.dump(graph, out_file)
+
+    for work_unit in work_units:
         # Don't need to track heading pairs that we've already built networks for
-        if os.path.exists(out_file_path):
+        remaining_pairs = [
+            pair
+            for pair in work_unit
+            if not os.path.exists(os.path.join(args.out_dir, pair + suffix + ".pkl"))
+        ]
+
+        if args.union_graph:
+            for pair in remaining_pairs:
+                with profile_phase("compute", pair=pair):
+                    graph = extract_pair_graph(
+                        union, pair_to_mask[pair], args.include_first_degree
+                    )
+                save_graph(pair, graph)
             continue
 
-        paired_headings[f"{heading1}+{heading2}"] = combined_dois
-
-    # This is a 20GB object so let's go ahead and deallocate the memory
-    del heading_to_dois
-
-    heading_to_graph = build_graphs(
-        args.data_dir, paired_headings, args.include_first_degree
-    )
-
-    for heading in heading_to_graph.keys():
-        graph = heading_to_graph[heading]
-        if args.include_first_degree:
-            heading += "-first_degree"
-        out_file_path = os.path.join(args.out_dir, heading + ".pkl")
-        with open(out_file_path, "wb") as out_file:
-            pkl.dump(graph, out_file)
+        with profile_phase("compute", n_pairs=len(remaining_pairs)):
+            build_pair_graphs(
+                {pair: pair_to_mask[pair] for pair in remaining_pairs},
+                {pair: pair_to_files[pair] for pair in remaining_pairs},
+                doi_to_mask,
+                save_graph,
+                args.include_first_degree,
+            )
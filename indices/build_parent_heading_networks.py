@@ -0,0 +1,137 @@
+"""
+Build the networks of broader MeSH headings out of their child headings' networks
+
+Instead of downloading a parent heading's metadata and rebuilding its network from
+COCI, the networks built by build_single_heading_networks.py for its children are
+combined, and only the citations between different children are looked up. Every
+child's network has to be built first. With --allow_partial, parents missing some of
+them are built from the rest, but saved under a -partial name with the missing children
+recorded in the graph's "missing_children" attribute, so they can't be mistaken for
+full networks.
+"""
+import argparse
+import glob
+import os
+import pickle as pkl
+
+from hierarchy import clean_heading, compose_parent_graphs
+from mesh_tree import load_mesh_tree
+from utils import parse_mesh_headings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "mesh_file", help="File containing mesh descriptors in ascii format"
+    )
+    parser.add_argument(
+        "parent_headings",
+        nargs="+",
+        help="The MeSH headings to build networks for, as they appear in the tree",
+    )
+    parser.add_argument(
+        "--data_dir",
+        help="The directory containing coci citations",
+        default="data/coci",
+    )
+    parser.add_argument(
+        "--metadata_dir",
+        help="The directory containing the child headings' metadata from "
+        "download_article_metadata",
+        default="data/pubmed/efetch",
+    )
+    parser.add_argument(
+        "--network_dir",
+        help="The directory containing the child headings' networks",
+        default="data/networks",
+    )
+    parser.add_argument(
+        "--out_dir",
+        help="The location to save the resulting networks to",
+        default="data/networks",
+    )
+    parser.add_argument(
+        "--include_first_degree",
+        help="Compose the networks that include citations where only one of the two "
+        "articles belongs to the heading",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--allow_partial",
+        help="Build parents whose children's networks aren't all built from the ones "
+        "that are, saving them as <parent>-partial.pkl instead of raising an error",
+        action="store_true",
+    )
+    args = parser.parse_args()
+
+    suffix = "-first_degree" if args.include_first_degree else ""
+    tree = load_mesh_tree(args.mesh_file)
+
+    parent_to_children = {}
+    parent_to_missing = {}
+    for heading in args.parent_headings:
+        positions = tree.positions(heading)
+        if len(positions) == 0:
+            parser.error(f"{heading} is not in {args.mesh_file}")
+
+        children = []
+        missing = []
+        for position in positions:
+            for child in tree.children(position):
+                child_heading = clean_heading(tree.heading(child))
+                if child_heading in children or child_heading in missing:
+                    continue
+                network_path = os.path.join(
+                    args.network_dir, child_heading + suffix + ".pkl"
+                )
+                if os.path.exists(network_path):
+                    children.append(child_heading)
+                else:
+                    missing.append(child_heading)
+        if len(missing) > 0:
+            parent_to_missing[clean_heading(heading)] = missing
+        if len(children) == 0:
+            print(f"None of the children of {heading} have networks")
+            continue
+        parent_to_children[clean_heading(heading)] = children
+
+    if len(parent_to_missing) > 0:
+        missing_message = "; ".join(
+            f"{parent} is missing {', '.join(missing)}"
+            for parent, missing in parent_to_missing.items()
+        )
+        if not args.allow_partial:
+            parser.error(
+                f"Some child networks haven't been built ({missing_message}). Build "
+                "them first, or use --allow_partial"
+            )
+        print(f"Building partial networks: {missing_message}")
+
+    all_children = {
+        child for children in parent_to_children.values() for child in children
+    }
+    child_to_graph = {}
+    for child in all_children:
+        with open(os.path.join(args.network_dir, child + suffix + ".pkl"), "rb") as f:
+            child_to_graph[child] = pkl.load(f)
+
+    child_to_dois = {}
+    if not args.include_first_degree:
+        child_to_dois = parse_mesh_headings(args.metadata_dir, all_children)
+
+    parent_to_graph = compose_parent_graphs(
+        parent_to_children,
+        child_to_graph,
+        child_to_dois,
+        sorted(glob.glob(f"{args.data_dir}/*")),
+        args.include_first_degree,
+    )
+
+    for parent, graph in parent_to_graph.items():
+        out_name = parent + suffix
+        if parent in parent_to_missing:
+            graph.graph["missing_children"] = parent_to_missing[parent]
+            out_name += "-partial"
+        out_file_path = os.path.join(args.out_dir, out_name + ".pkl")
+        with open(out_file_path, "wb") as out_file:
+            pkl.dump(graph, out_file)
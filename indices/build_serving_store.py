@@ -0,0 +1,24 @@
+"""
+Pack the condensed dataframes from store_percentile_dataframes.py into a single SQLite
+file that the web app can query without loading whole pairs into memory
+"""
+import argparse
+
+from serving import build_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--base_dir",
+        help="The directory containing the percentiles and journals dataframes",
+        default="viz_dataframes",
+    )
+    parser.add_argument(
+        "--store_path",
+        help="Where to write the store. Defaults to serving.sqlite in base_dir, which "
+        "is where the app looks for it",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    build_store(args.base_dir, args.store_path)
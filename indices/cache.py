@@ -0,0 +1,225 @@
+"""
+An LRU cache for the dataframes loaded by the app, bounded by memory rather than entries
+
+Each entry records the modification times of the files it was loaded from. If any of
+them change (or files appear or disappear), the entry is treated as stale and reloaded
+on the next lookup. Cached dataframes are shared between callers, so they shouldn't be
+modified in place.
+"""
+import functools
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+# The default cache size in megabytes, which can be overridden with INDICES_CACHE_MB
+DEFAULT_CACHE_MB = 1024
+
+
+def get_size(value: Any) -> int:
+    """Estimate the memory used by a cached value in bytes"""
+    # Only check for dataframes if pandas has been loaded by something else
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+def file_fingerprint(paths: Iterable[str]) -> Tuple[Tuple[str, int, int], ...]:
+    """Record the modification time and size of each of the files that exist"""
+    fingerprint = []
+    for path in sorted(set(paths)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+class ByteLRUCache:
+    """
+    A least recently used cache that evicts entries once their total size passes a limit
+
+    Arguments
+    ---------
+    max_bytes: The total size the cached values are allowed to use. Values larger than
+               this are returned to the caller but never stored
+    on_evict: A function to call with each value that's evicted, invalidated, or
+              replaced, for values holding resources that need to be released
+    """
+
+    def __init__(self, max_bytes: int, on_evict: Callable[[Any], None] = None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, fingerprint: Hashable = None) -> Tuple[bool, Any]:
+        """
+        Look up a value, treating it as missing if its fingerprint has changed
+
+        Returns
+        -------
+        found: Whether a current value was in the cache
+        value: The cached value, or None if it wasn't found
+        """
+        released = []
+        with self._lock:
+            if key in self._entries:
+                entry_fingerprint, value, size = self._entries[key]
+                if entry_fingerprint == fingerprint:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.current_bytes -= size
+                self.invalidations += 1
+                released.append(value)
+            self.misses += 1
+        self._release(released)
+        return False, None
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        fingerprint: Hashable = None,
+        size: int = None,
+    ) -> bool:
+        """
+        Store a value, evicting the least recently used entries to make room
+
+        Arguments
+        ---------
+        key: The key to store the value under
+        value: The value to store
+        fingerprint: The fingerprint `get` has to be called with to find the value
+        size: The value's size in bytes, estimated with `get_size` if not given
+
+        Returns
+        -------
+        stored: Whether the value was small enough to store
+        """
+        if size is None:
+            size = get_size(value)
+        released = []
+        with self._lock:
+            if key in self._entries:
+                _, old_value, old_size = self._entries.pop(key)
+                self.current_bytes -= old_size
+                released.append(old_value)
+            if size <= self.max_bytes:
+                self._entries[key] = (fingerprint, value, size)
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, (_, evicted, evicted_size) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted_size
+                    self.evictions += 1
+                    released.append(evicted)
+        self._release(released)
+        return size <= self.max_bytes
+
+    def _release(self, values: List[Any]):
+        if self.on_evict is not None:
+            for value in values:
+                self.on_evict(value)
+
+    def resize(self, max_bytes: int):
+        """Change the size limit, evicting the least recently used entries that don't fit"""
+        released = []
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+                released.append(evicted)
+        self._release(released)
+
+    def clear(self):
+        """Remove every entry and reset the statistics"""
+        with self._lock:
+            released = [value for _, value, _ in self._entries.values()]
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+        self._release(released)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache's hit, miss, eviction, and invalidation counts and its size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+FRAME_CACHE = ByteLRUCache(
+    int(float(os.environ.get("INDICES_CACHE_MB", DEFAULT_CACHE_MB)) * 1024**2)
+)
+
+
+def cached_by_files(
+    get_paths: Callable[..., Iterable[str]], cache: ByteLRUCache = None
+) -> Callable:
+    """
+    Cache a loading function's results until the files it reads change
+
+    Arguments
+    ---------
+    get_paths: A function taking the same arguments as the decorated function and
+               returning the paths of the files it reads
+    cache: The cache to store results in, defaults to the shared FRAME_CACHE
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (
+                func.__module__,
+                func.__qualname__,
+                args,
+                tuple(sorted(kwargs.items())),
+            )
+            fingerprint = file_fingerprint(get_paths(*args, **kwargs))
+            return cached_call(
+                key, fingerprint, lambda: func(*args, **kwargs), cache=cache
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def cached_call(
+    key: Hashable,
+    fingerprint: Hashable,
+    load: Callable[[], Any],
+    cache: ByteLRUCache = None,
+) -> Any:
+    """
+    Get a cached value, calling `load` to replace it if it's missing or its fingerprint
+    has changed. This is what `cached_by_files` does, for loaders whose fingerprint
+    isn't just the files they read
+    """
+    target_cache = FRAME_CACHE if cache is None else cache
+    found, value = target_cache.get(key, fingerprint)
+    if not found:
+        value = load()
+        target_cache.put(key, value, fingerprint)
+    return value
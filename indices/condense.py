@@ -0,0 +1,246 @@
+"""
+Condense the pipeline's results into the per-paper and per-journal dataframes used by
+the web app
+
+All paths are relative to a root directory laid out like the Snakefile's outputs
+(data/networks, data/pubmed/efetch, output/, and output/shuffle_results), so the same
+code runs on the cluster, a laptop, or a synthetic dataset from generate_synthetic_data.py.
+"""
+import glob
+import os
+import pickle as pkl
+from itertools import combinations
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from journals import aggregate_journals
+from manifest import build_pair_manifest, get_manifest_path, write_manifest
+from profiling import profile_phase
+from utils import (
+    load_group_headings,
+    load_pair_headings,
+    pair_from_group,
+    parse_metadata,
+)
+
+
+def get_out_paths(
+    root: str, heading1: str, heading2: str, group: str = None
+) -> Tuple[str, str]:
+    """
+    Get the paths of a pair's percentile and journal dataframes
+
+    Pairs taken from a group network (named like a+b+c) go in the group's directory
+    under viz_dataframes/groups, since their percentiles come from the group's shuffles
+    rather than the pair's own
+    """
+    out_dir = f"{root}/viz_dataframes"
+    if group is not None:
+        out_dir = f"{out_dir}/groups/{group}"
+    percentile_out_path = f"{out_dir}/percentiles/{heading1}-{heading2}.pkl"
+    journal_out_path = f"{out_dir}/journals/{heading1}-{heading2}.pkl"
+    return percentile_out_path, journal_out_path
+
+
+def get_group_out_path(root: str, headings: List[str]) -> str:
+    """Get the path of a group's combined percentile dataframe"""
+    return f"{root}/viz_dataframes/groups/{'+'.join(headings)}.pkl"
+
+
+def find_remaining_pairs(root: str) -> Dict[str, List[str]]:
+    """
+    Find the pairs of headings that don't have both of their outputs yet
+
+    Returns
+    -------
+    heading_to_pairs: A mapping between each pair's first heading and the headings it
+                      still needs to be condensed with
+    """
+    heading_to_pairs = {}
+    for path1, path2 in combinations(glob.glob(f"{root}/data/networks/*.pkl"), 2):
+        path1_file = os.path.basename(path1)
+        heading1 = os.path.splitext(path1_file)[0]
+        path2_file = os.path.basename(path2)
+        heading2 = os.path.splitext(path2_file)[0]
+
+        percentile_out_path, journal_out_path = get_out_paths(root, heading1, heading2)
+        if os.path.exists(percentile_out_path) and os.path.exists(journal_out_path):
+            continue
+        heading_to_pairs.setdefault(heading1, []).append(heading2)
+    return heading_to_pairs
+
+
+def load_heading_metadata(root: str, heading: str) -> pd.DataFrame:
+    return parse_metadata(f"{root}/data/pubmed/efetch/{heading}.xml.xz")
+
+
+def condense_pair(
+    root: str, heading1: str, heading2: str, metadata_df: pd.DataFrame = None
+) -> pd.DataFrame:
+    """
+    Calculate the percentiles of each paper in a pair of headings
+
+    Arguments
+    ---------
+    root: The directory containing the pipeline's data and output directories
+    heading1: The first heading in the pair
+    heading2: The second heading in the pair
+    metadata_df: heading1's metadata, if it's already been loaded
+
+    Returns
+    -------
+    df: The papers' pageranks, count-aware percentiles, and metadata
+    """
+    return load_pair_headings(
+        heading1,
+        heading2,
+        base_dir=f"{root}/output",
+        metadata_dir=f"{root}/data/pubmed/efetch",
+        metadata_df=metadata_df,
+    )
+
+
+def condense_heading(
+    root: str,
+    heading1: str,
+    heading2s: List[str],
+    journal_size_cutoff: int = 25,
+    quantiles: List[float] = None,
+    n_bootstrap: int = 0,
+):
+    """
+    Write the percentile and journal dataframes for each pair of `heading1` and one of
+    `heading2s`, loading heading1's metadata only once
+
+    Arguments
+    ---------
+    root: The directory containing the pipeline's data and output directories
+    heading1: The first heading in each pair
+    heading2s: The other heading in each pair
+    journal_size_cutoff: The number of papers in a journal for it to be included
+    quantiles: Extra quantiles to store for each journal
+    n_bootstrap: The number of bootstrap replicates used for the journals' median
+                 confidence intervals, or zero to skip them
+    """
+    metadata_df = None
+    for heading2 in heading2s:
+        print(heading1, heading2)
+        pair = f"{heading1}-{heading2}"
+
+        try:
+            if metadata_df is None:
+                with profile_phase("load", heading=heading1, output="metadata"):
+                    metadata_df = load_heading_metadata(root, heading1)
+            with profile_phase("load", pair=pair):
+                df = condense_pair(root, heading1, heading2, metadata_df)
+            write_pair_outputs(
+                root,
+                heading1,
+                heading2,
+                df,
+                journal_size_cutoff,
+                quantiles,
+                n_bootstrap,
+            )
+        except FileNotFoundError:
+            print("Results not found")
+            continue
+
+
+def write_pair_outputs(
+    root: str,
+    heading1: str,
+    heading2: str,
+    df: pd.DataFrame,
+    journal_size_cutoff: int = 25,
+    quantiles: List[float] = None,
+    n_bootstrap: int = 0,
+    group: str = None,
+):
+    """
+    Write a pair's percentile dataframe, its manifest, and its journal dataframe
+
+    If the pair was taken from a group network, `group` is the group's name
+    """
+    pair = f"{heading1}-{heading2}"
+    percentile_out_path, journal_out_path = get_out_paths(
+        root, heading1, heading2, group
+    )
+
+    # Store per-paper results
+    with profile_phase("save", pair=pair, output="percentiles"):
+        with open(percentile_out_path, "wb") as out_file:
+            pkl.dump(df, out_file)
+        write_manifest(
+            get_manifest_path(percentile_out_path),
+            build_pair_manifest(df, heading1, heading2, group),
+            percentile_out_path,
+        )
+
+    with profile_phase("compute", pair=pair):
+        journal_df = aggregate_journals(df, journal_size_cutoff, quantiles, n_bootstrap)
+    # Store journal-level results
+    with profile_phase("save", pair=pair, output="journals"):
+        with open(journal_out_path, "wb") as out_file:
+            pkl.dump(journal_df, out_file)
+
+
+def condense_group(
+    root: str,
+    headings: List[str],
+    journal_size_cutoff: int = 25,
+    quantiles: List[float] = None,
+    n_bootstrap: int = 0,
+):
+    """
+    Condense the results of a network built for a group of headings
+
+    The group's combined percentiles are written to viz_dataframes/groups, and every
+    pair of headings in the group gets the same kind of percentile and journal
+    dataframes the pairwise pipeline writes. The pairs' dataframes go in the group's own
+    directory (see `get_out_paths`), so they never replace the pairwise pipeline's
+
+    Arguments
+    ---------
+    root: The directory containing the pipeline's data and output directories
+    headings: The group's headings, in the order they appear in the group's name
+    journal_size_cutoff: The number of papers in a journal for it to be included
+    quantiles: Extra quantiles to store for each journal
+    n_bootstrap: The number of bootstrap replicates used for the journals' median
+                 confidence intervals, or zero to skip them
+    """
+    group = "+".join(headings)
+    with profile_phase("load", group=group):
+        group_df = load_group_headings(headings, base_dir=f"{root}/output")
+    with profile_phase("save", group=group, output="group"):
+        with open(get_group_out_path(root, headings), "wb") as out_file:
+            pkl.dump(group_df, out_file)
+
+    for out_path in get_out_paths(root, headings[0], headings[1], group):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    heading_to_metadata = {}
+    for heading1, heading2 in combinations(headings, 2):
+        if all(
+            os.path.exists(path)
+            for path in get_out_paths(root, heading1, heading2, group)
+        ):
+            continue
+        if heading1 not in heading_to_metadata:
+            with profile_phase("load", heading=heading1, output="metadata"):
+                heading_to_metadata[heading1] = load_heading_metadata(root, heading1)
+
+        df = pair_from_group(
+            group_df, heading1, heading2, heading_to_metadata[heading1]
+        )
+        write_pair_outputs(
+            root,
+            heading1,
+            heading2,
+            df,
+            journal_size_cutoff,
+            quantiles,
+            n_bootstrap,
+            group,
+        )
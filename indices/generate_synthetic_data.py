@@ -0,0 +1,108 @@
+"""
+Write fake COCI citation files and PubMed efetch files for running the pipeline offline
+
+The files have the same layout as the outputs of download_citations.sh and
+download_article_metadata.py, so the rest of the pipeline can run on them unchanged.
+A snakemake config file pointing the Snakefile at the synthetic headings is also written.
+"""
+import argparse
+import json
+import os
+
+from synthetic import (
+    DEGREE_DISTRIBUTIONS,
+    assign_headings,
+    make_citation_edges,
+    write_coci_files,
+    write_pubmed_xml,
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data_dir",
+        help="The directory to write the coci and pubmed directories to",
+        default="data",
+    )
+    parser.add_argument(
+        "--config_file",
+        help="The snakemake config file to write",
+        default="synthetic_config.json",
+    )
+    parser.add_argument(
+        "--n_articles",
+        help="The number of articles in the citation network",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--n_headings",
+        help="The number of MeSH headings to split the articles into",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--overlap",
+        help="The fraction of articles in a heading that belong to a second heading",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--coverage",
+        help="The fraction of articles that belong to any heading",
+        type=float,
+        default=0.5,
+    )
+    parser.add_argument(
+        "--mean_degree",
+        help="The average number of citations per article",
+        type=float,
+        default=10,
+    )
+    parser.add_argument(
+        "--distribution",
+        help="The distribution the number of citations per article is drawn from",
+        choices=DEGREE_DISTRIBUTIONS,
+        default="powerlaw",
+    )
+    parser.add_argument(
+        "--edges_per_file",
+        help="The number of citations to write to each COCI csv file",
+        type=int,
+        default=1000000,
+    )
+    parser.add_argument(
+        "--n_shuffles",
+        help="The number of shuffled networks the pipeline should create",
+        type=int,
+        default=100,
+    )
+    parser.add_argument("--seed", help="The random seed", type=int, default=0)
+    args = parser.parse_args()
+
+    coci_dir = os.path.join(args.data_dir, "coci")
+    efetch_dir = os.path.join(args.data_dir, "pubmed", "efetch")
+
+    citing, cited = make_citation_edges(
+        args.n_articles, args.mean_degree, args.distribution, args.seed
+    )
+    print(f"Writing {len(citing):,} citations to {coci_dir}")
+    write_coci_files(coci_dir, citing, cited, args.edges_per_file)
+    del citing, cited
+
+    heading_to_dois = assign_headings(
+        args.n_articles, args.n_headings, args.overlap, args.coverage, args.seed
+    )
+    for i, (heading, dois) in enumerate(heading_to_dois.items()):
+        print(f"Writing {len(dois):,} articles for {heading}")
+        out_path = os.path.join(efetch_dir, f"{heading}.xml.xz")
+        write_pubmed_xml(out_path, dois, seed=args.seed + i)
+
+    config = {
+        "coci_dir": coci_dir,
+        "headings": list(heading_to_dois.keys()),
+        "n_shuffles": args.n_shuffles,
+    }
+    with open(args.config_file, "w") as out_file:
+        json.dump(config, out_file, indent=2)
@@ -4,6 +4,18 @@ import os
 import pickle as pkl
 import shutil
 
+from lazy import lazy_import
+from manifest import (
+    build_pair_manifest,
+    get_manifest_path,
+    load_manifest,
+    rows_at_threshold,
+    write_manifest,
+)
+
+# scipy is slow to import and only needed with --metric_dir
+overlap = lazy_import("overlap")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("in_dir", help="The pagerank results to be filtered")
@@ -22,30 +34,69 @@ if __name__ == "__main__":
         default=95,
         type=int,
     )
+    parser.add_argument(
+        "--metric_dir",
+        help="The directory containing the single heading pagerank results. If set, "
+        "pairs whose headings can't share enough papers are skipped without loading "
+        "their dataframes",
+        default=None,
+    )
+    parser.add_argument(
+        "--symlink",
+        help="Link to the selected pairs' dataframes instead of copying them",
+        action="store_true",
+    )
     args = parser.parse_args()
 
+    max_overlap = None
+    if args.metric_dir is not None:
+        # Split heading networks only contain papers from the heading's own network,
+        # so the overlap between single heading results bounds each pair's size
+        _, headings, values = overlap.build_metric_matrix(
+            overlap.load_heading_metrics(args.metric_dir)
+        )
+        counts = overlap.overlap_counts(values)
+        max_overlap = {
+            (heading1, heading2): counts[idx1, idx2]
+            for idx1, heading1 in enumerate(headings)
+            for idx2, heading2 in enumerate(headings)
+        }
+
     i = 0
     for path in glob.glob(os.path.join(args.in_dir, "*.pkl")):
         filename = os.path.basename(path)
-        try:
-            with open(path, "rb") as in_file:
-                df = pkl.load(in_file)
-        except FileNotFoundError:
-            continue
-
-        file_name = os.path.basename(path)
-        file_noext = os.path.splitext(file_name)[0]
+        file_noext = os.path.splitext(filename)[0]
         heading1, heading2 = file_noext.split("-")
+        if max_overlap is not None:
+            pair_overlap = max_overlap.get((heading1, heading2))
+            if pair_overlap is not None and pair_overlap <= args.overlap_threshold:
+                continue
 
-        # Remove the papers that get lost in the shuffle too often
-        filter_condition = (df[f"{heading1}_count"] >= args.missingness_threshold) & (
-            df[f"{heading2}_count"] >= args.missingness_threshold
-        )
-
-        df = df[filter_condition]
+        manifest_path = get_manifest_path(path)
+        # Manifests are rebuilt if their dataframe was rewritten after them
+        manifest = load_manifest(manifest_path, path)
+        if manifest is None:
+            try:
+                with open(path, "rb") as in_file:
+                    df = pkl.load(in_file)
+            except FileNotFoundError:
+                continue
+            # Save the summary so later runs with other thresholds can skip loading
+            manifest = build_pair_manifest(df, heading1, heading2)
+            write_manifest(manifest_path, manifest, path)
 
-        if len(df) > args.overlap_threshold:
+        # Remove the papers that get lost in the shuffle too often
+        if (
+            rows_at_threshold(manifest, args.missingness_threshold)
+            > args.overlap_threshold
+        ):
             i += 1
-            shutil.copyfile(path, os.path.join(args.out_dir, filename))
+            out_path = os.path.join(args.out_dir, filename)
+            if args.symlink:
+                if os.path.lexists(out_path):
+                    os.remove(out_path)
+                os.symlink(os.path.abspath(path), out_path)
+            else:
+                shutil.copyfile(path, out_path)
 
     print(f"{i} heading pairs have > {args.overlap_threshold} shared papers")
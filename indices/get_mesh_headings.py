@@ -1,19 +1,12 @@
 import argparse
-import os
+import functools
 import pickle
-import sys
-import time
-from collections import defaultdict
 from typing import List
 
-import lxml.etree
-import pandas as pd
-import requests
-import tqdm
-from ratelimit import limits, sleep_and_retry
+from mesh_counts import CountCache, HeadingCounter, fetch_heading_count
+from mesh_tree import MeshTree, load_mesh_tree
 
 ARTICLE_THRESHOLD = 10000
-CACHE_FILE = "heading.tmp"
 
 
 class Node:
@@ -26,98 +19,87 @@ class Node:
         self.children.append(child)
 
 
-def persist_to_file(file_name):
-    # https://stackoverflow.com/questions/16463582/memoize-to-disk-python-persistent-memoization
-    def decorator(original_func):
-        try:
-            cache = pickle.load(open(file_name, "rb"))
-        except (IOError, ValueError):
-            cache = {}
-
-        def new_func(param):
-            if param not in cache:
-                cache[param] = original_func(param)
-                pickle.dump(cache, open(file_name, "wb"))
-            return cache[param]
-
-        return new_func
-
-    return decorator
-
-
 def make_path_safe(path: str) -> str:
     # https://stackoverflow.com/questions/7406102/create-sane-safe-filename-from-any-unsafe-string
     return "".join([c for c in path if c.isalpha() or c.isdigit() or c == " "]).rstrip()
 
 
-@sleep_and_retry
-@limits(calls=2, period=1)
-@persist_to_file(CACHE_FILE)
-def get_heading_article_count(heading: str) -> pd.DataFrame:
+def build_nodes(tree: MeshTree, branches: List[str]) -> List[Node]:
     """
-    Return the number of unique dois that fall under the given MeSH heading
+    Build the Node trees for some branches of MeSH
+
+    Headings can appear at several places in the tree, so each heading is only kept at
+    its shallowest position. Nodes whose parent was dropped are skipped, but their
+    heading can still show up elsewhere.
 
     Arguments
     ---------
-    heading: The MeSH heading to examine
+    tree: The parsed MeSH tree
+    branches: The tree numbers of the branches to include, e.g. H01
 
     Returns
     -------
-    count: The number or dois for the heading
-
-    Note:
-    This function is based on code from Le et al., and used in accordance with their license:
-    https://github.com/greenelab/iscb-diversity/blob/master/02.process-pubmed.ipynb
+    roots: The Node at the top of each branch
     """
-    payload = {
-        "db": "pubmed",
-        "term": f'"journal article"[pt] AND "{heading}"[MeSH Terms] AND English[Language]',
-    }
-
-    retry_interval = 1
-    while retry_interval < 5000:
-        try:
-            url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-            payload["rettype"] = "xml"
-            payload["retstart"] = 0
-            count = 1
-            response = requests.get(url, params=payload)
-
-            tree = lxml.etree.fromstring(response.content)
-            count = int(tree.findtext("Count"))
-            return count
-
-        except Exception as e:
-            print(
-                f"Retrying after {retry_interval} seconds due to {e}", file=sys.stderr
-            )
-            time.sleep(retry_interval)
-            retry_interval *= 4
-
-    raise RuntimeError(f"Repeated timeouts when downloading {heading}", file=sys.stderr)
-
-
-def get_headings(current_node: Node) -> List[str]:
+    branch_nodes = [
+        node for root in tree.find_all(branches) for node in tree.subtree(root)
+    ]
+    # A stable sort keeps the nodes at each depth in tree number order
+    branch_nodes.sort(key=lambda node: tree.depth[node])
+
+    id_to_node = {}
+    roots = []
+    headings_seen = set()
+    for tree_node in branch_nodes:
+        heading = tree.heading(tree_node)
+        if heading in headings_seen:
+            continue
+
+        id = tree.tree_numbers[tree_node]
+        current_node = Node(heading, id)
+        current_node.depth = int(tree.depth[tree_node])
+
+        parent = tree.parent[tree_node]
+        if tree.depth[tree_node] == 1:
+            roots.append(current_node)
+        elif parent == -1 or tree.tree_numbers[parent] not in id_to_node:
+            print(heading, id)
+            continue
+        else:
+            id_to_node[tree.tree_numbers[parent]].add_child(current_node)
+
+        id_to_node[id] = current_node
+        headings_seen.add(heading)
+
+    return roots
+
+
+def get_headings(
+    current_node: Node, counter: HeadingCounter, threshold: int = ARTICLE_THRESHOLD
+) -> List[str]:
     children = current_node.children
-    article_count = get_heading_article_count(current_node.heading)
+    article_count = counter.get_count(current_node.heading)
     spacer = "-" * current_node.depth
     print(spacer, current_node.heading, article_count)
 
     # If the current heading has less than the threshold amount, we filter out both it
     # and its children
-    if article_count < ARTICLE_THRESHOLD:
+    if article_count < threshold:
         return [None]
 
     if len(children) == 0:
         # Either return heading if X citations or None otherwise
-        if article_count >= ARTICLE_THRESHOLD:
+        if article_count >= threshold:
             return [current_node.heading]
         else:
             return [None]
     else:
+        # Look up all the children's counts at once so their requests run concurrently
+        counter.get_counts([child.heading for child in children])
+
         child_headings = []
         for child in children:
-            headings = get_headings(child)
+            headings = get_headings(child, counter, threshold)
             child_headings.extend(headings)
         child_headings = [h for h in child_headings if h is not None]
 
@@ -135,73 +117,58 @@ if __name__ == "__main__":
         "mesh_file", help="File containing mesh descriptors in ascii format"
     )
     parser.add_argument("out_file", help="Location to store the headings to use")
+    parser.add_argument(
+        "--branches",
+        help="The tree numbers of the MeSH branches to pick headings from. H01 is the "
+        "code for Natural Science Disciplines, and K01 is the Humanities",
+        nargs="+",
+        default=["H01"],
+    )
+    parser.add_argument(
+        "--article_threshold",
+        help="The number of articles a heading needs to be used",
+        type=int,
+        default=ARTICLE_THRESHOLD,
+    )
+    parser.add_argument(
+        "--cache_file",
+        help="The SQLite file to cache the headings' article counts in between runs",
+        default="data/mesh_counts.sqlite",
+    )
+    parser.add_argument(
+        "--workers",
+        help="The number of article count requests to make at once",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--requests_per_second",
+        help="The maximum number of requests to make to NCBI each second. NCBI allows "
+        "3 without an API key and 10 with one",
+        type=int,
+        default=2,
+    )
+    parser.add_argument("--api_key", help="An NCBI API key", default=None)
     args = parser.parse_args()
 
-    descriptors_by_depth = defaultdict(list)
-
-    with open(args.mesh_file) as in_file:
-        heading = None
-        ids = []
-        for line in in_file:
-            line = line.strip()
-            if "NEWRECORD" in line:
-                for id in ids:
-                    # H01 is the code for Natural Science Disciplines,
-                    # L01 is the code for information science
-                    # TODO consider adding Humanities (k01) as well
-                    if "H01" not in id:
-                        continue
-                    depth = len(id.split("."))
-
-                    descriptors_by_depth[depth].append((heading, id))
-
-                heading = None
-                ids = []
-            elif "MH = " in line:
-                heading = line.split("=")[-1].strip()
-            elif "MN = " in line:
-                # Headings are unique, but their location in the tree may not be
-                id = line.split("=")[-1].strip()
-                ids.append(id)
-
-    ids = []
-    for heading, id in descriptors_by_depth[1]:
-        ids.append(id)
-
-    depths = sorted(descriptors_by_depth.keys())
+    tree = load_mesh_tree(args.mesh_file)
+    trees = build_nodes(tree, args.branches)
 
-    id_to_node = {}
-    trees = []
-    headings_seen = set()
-
-    for depth in depths:
-        for heading, id in descriptors_by_depth[depth]:
-            if heading in headings_seen:
-                continue
-
-            current_node = Node(heading, id)
-            current_node.depth = depth
-
-            parent = id.rsplit(".", 1)[0]
-            if parent not in id_to_node:
-                if depth == 1:
-                    trees.append(current_node)
-                # Skip orphan nodes, but allow their heading to show up elsewhere
-                else:
-                    print(heading, id)
-                    continue
-            else:
-                id_to_node[parent].add_child(current_node)
-
-            id_to_node[id] = current_node
-            headings_seen.add(heading)
+    cache = CountCache(args.cache_file)
+    counter = HeadingCounter(
+        cache,
+        functools.partial(fetch_heading_count, api_key=args.api_key),
+        args.workers,
+        args.requests_per_second,
+    )
+    counter.get_counts([root.heading for root in trees])
 
     filtered_headings = []
     for root in trees:
-        filtered_headings.extend(get_headings(root))
+        filtered_headings.extend(get_headings(root, counter, args.article_threshold))
         print(filtered_headings)
+    print(f"Fetched {counter.n_fetched} article counts, the rest were cached")
+    cache.close()
 
     with open(args.out_file, "wb") as out_file:
         pickle.dump(filtered_headings, out_file)
-
-    os.remove(CACHE_FILE)
@@ -0,0 +1,442 @@
+"""
+A long-running server that keeps graphs in shared memory and runs metrics on them
+
+Starting Python and unpickling a networkx graph often takes longer than running
+PageRank on it. The server loads each graph once, stores it as CSR arrays in a shared
+memory block, and runs metric jobs on a pool of worker processes that attach to those
+blocks instead of loading their own copies. Recently used graphs stay in shared memory
+until they need to make room for others.
+
+Jobs are sent over a local socket, as many at a time as there are workers. PageRank
+takes the same options as in run_metric_on_graph.py:
+
+    python indices/graph_server.py serve --socket /tmp/indices.sock --workers 8 &
+    python indices/graph_server.py submit --socket /tmp/indices.sock graph1.pkl ...
+    python indices/graph_server.py shutdown --socket /tmp/indices.sock
+"""
+import argparse
+import os
+import pickle as pkl
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+
+import algos
+from cache import ByteLRUCache, file_fingerprint
+from pagerank import (
+    FallbackFailedConvergence,
+    csr_pagerank_with_telemetry,
+    graph_to_csr,
+)
+from run_metric_on_graph import (
+    add_pagerank_args,
+    get_pagerank_options,
+    get_telemetry_path,
+    write_telemetry,
+)
+from shuffle_graph import graph_base_name, load_graph
+
+METRICS = ["pagerank", "disruption_idx"]
+AUTHKEY = b"indices-graph-server"
+
+
+class SharedGraph:
+    """
+    A graph's node names and CSR out-edge arrays, packed into one shared memory block
+
+    The block holds the int64 row pointers, the int32 column indices, the int64 offsets
+    of each node name, and the utf-8 encoded node names, in that order. `meta` is all
+    another process needs to attach to the block.
+    """
+
+    def __init__(self, meta: dict, shm: SharedMemory):
+        self.meta = meta
+        self.shm = shm
+        self.pins = 0
+        self.evicted = False
+
+    @classmethod
+    def from_graph(cls, graph: nx.DiGraph) -> "SharedGraph":
+        graph.remove_edges_from(nx.selfloop_edges(graph))
+        nodes, indptr, indices = graph_to_csr(graph)
+
+        encoded = [str(node).encode() for node in nodes]
+        name_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+        names = b"".join(encoded)
+
+        meta = {
+            "n_nodes": len(nodes),
+            "n_edges": len(indices),
+            "n_name_bytes": len(names),
+        }
+        shm = SharedMemory(create=True, size=max(_block_size(meta), 1))
+        meta["name"] = shm.name
+
+        indptr_view, indices_view, offsets_view, names_view = _views(shm, meta)
+        indptr_view[:] = indptr
+        indices_view[:] = indices
+        offsets_view[:] = name_offsets
+        names_view[:] = np.frombuffer(names, dtype=np.uint8)
+        return cls(meta, shm)
+
+    @property
+    def size(self) -> int:
+        return _block_size(self.meta)
+
+    def release(self):
+        """Free the shared memory block"""
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _block_size(meta: dict) -> int:
+    return (
+        8 * (meta["n_nodes"] + 1)
+        + 4 * meta["n_edges"]
+        + 8 * (meta["n_nodes"] + 1)
+        + meta["n_name_bytes"]
+    )
+
+
+def _views(shm: SharedMemory, meta: dict) -> Tuple[np.ndarray, ...]:
+    """Get numpy views of the arrays stored in a SharedGraph's block"""
+    n_nodes, n_edges = meta["n_nodes"], meta["n_edges"]
+    offset = 0
+    indptr = np.ndarray((n_nodes + 1,), dtype=np.int64, buffer=shm.buf, offset=offset)
+    offset += indptr.nbytes
+    indices = np.ndarray((n_edges,), dtype=np.int32, buffer=shm.buf, offset=offset)
+    offset += indices.nbytes
+    name_offsets = np.ndarray(
+        (n_nodes + 1,), dtype=np.int64, buffer=shm.buf, offset=offset
+    )
+    offset += name_offsets.nbytes
+    names = np.ndarray(
+        (meta["n_name_bytes"],), dtype=np.uint8, buffer=shm.buf, offset=offset
+    )
+    return indptr, indices, name_offsets, names
+
+
+def run_metric(
+    meta: dict,
+    metric: str,
+    out_file: str,
+    options: dict = None,
+    telemetry_file: str = None,
+    telemetry: bool = False,
+    graph_file: str = None,
+):
+    """
+    Run a metric on a shared graph and save the {node: value} results
+
+    This runs in the worker processes, which attach to the graph's block by name
+
+    Arguments
+    ---------
+    meta: The shared graph's metadata
+    metric: The metric to run
+    out_file: The path to save the results to
+    options: The arguments for `pagerank.csr_pagerank_with_telemetry`, as
+             run_metric_on_graph.py's `get_pagerank_options` returns them
+    telemetry_file: Where to write PageRank's telemetry when the fallback solver
+                    doesn't converge, as run_metric_on_graph.py does
+    telemetry: Whether to write the telemetry for graphs that converged too
+    graph_file: The graph's file, which is recorded in the telemetry
+    """
+    shm = SharedMemory(name=meta["name"])
+    try:
+        indptr, indices, name_offsets, names = _views(shm, meta)
+        name_bytes = names.tobytes()
+        nodes = [
+            name_bytes[start:end].decode()
+            for start, end in zip(name_offsets[:-1].tolist(), name_offsets[1:].tolist())
+        ]
+
+        if metric == "pagerank":
+            try:
+                scores, solver_telemetry = csr_pagerank_with_telemetry(
+                    indptr, indices, **(options or {})
+                )
+            except FallbackFailedConvergence as error:
+                if telemetry_file is not None:
+                    write_telemetry(telemetry_file, graph_file, error.telemetry)
+                # The error's telemetry doesn't survive being sent back to the server
+                raise RuntimeError(str(error)) from None
+            if telemetry and telemetry_file is not None:
+                write_telemetry(telemetry_file, graph_file, solver_telemetry)
+            node_to_metric = dict(zip(nodes, scores.tolist()))
+        else:
+            graph = nx.DiGraph()
+            graph.add_nodes_from(nodes)
+            sources = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+            graph.add_edges_from(
+                (nodes[source], nodes[target])
+                for source, target in zip(sources.tolist(), indices.tolist())
+            )
+            node_to_metric = algos.all_nodes_disruption_index(graph)
+        # Drop the views before the block is closed
+        del indptr, indices, name_offsets, names
+    finally:
+        shm.close()
+
+    # Write to a temporary file so clients never see partial results
+    tmp_path = f"{out_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out:
+        pkl.dump(node_to_metric, out)
+    os.replace(tmp_path, out_file)
+
+
+class GraphServer:
+    """
+    Load graphs into shared memory and run metric jobs on them with a process pool
+
+    `handle` can be called directly, which is how the tests use the server, or requests
+    can be sent over a socket with `serve` and `send_request`
+
+    Arguments
+    ---------
+    workers: The number of worker processes
+    max_bytes: The amount of shared memory the cached graphs can use
+    """
+
+    def __init__(self, workers: int = 1, max_bytes: int = 8 * 1024**3):
+        self.graphs = ByteLRUCache(max_bytes, on_evict=self._evict)
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # Guards the cache and the pin counts. Reentrant since evictions triggered while
+        # caching a graph also take it
+        self.lock = threading.RLock()
+        # One lock per graph file, so two requests for a graph don't both load it but
+        # loading one graph doesn't hold up requests for others
+        self.load_locks: Dict[str, threading.Lock] = {}
+        self.n_jobs = 0
+        self.stopping = threading.Event()
+
+    def _evict(self, shared_graph: SharedGraph):
+        # Graphs still being used by a job are freed once the job finishes
+        with self.lock:
+            shared_graph.evicted = True
+            if shared_graph.pins == 0:
+                shared_graph.release()
+
+    def _unpin(self, shared_graph: SharedGraph):
+        with self.lock:
+            shared_graph.pins -= 1
+            if shared_graph.evicted and shared_graph.pins == 0:
+                shared_graph.release()
+
+    def get_graph(self, graph_file: str) -> SharedGraph:
+        """Get a pinned shared copy of a graph, loading it if it isn't cached"""
+        key = os.path.abspath(graph_file)
+        fingerprint = file_fingerprint([key])
+        with self.lock:
+            load_lock = self.load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self.lock:
+                found, shared_graph = self.graphs.get(key, fingerprint)
+                if found:
+                    shared_graph.pins += 1
+                    return shared_graph
+
+            graph = load_graph(graph_file)
+            shared_graph = SharedGraph.from_graph(graph)
+
+            with self.lock:
+                shared_graph.pins += 1
+                if not self.graphs.put(
+                    key, shared_graph, fingerprint, shared_graph.size
+                ):
+                    # Graphs too large for the cache are freed as soon as their job is
+                    # done
+                    shared_graph.evicted = True
+            return shared_graph
+
+    def handle(self, request: dict) -> dict:
+        """
+        Process a request
+
+        Arguments
+        ---------
+        request: A dict whose "command" is either "run", with the "graph_file",
+                 "metric", and "out_file" to run, or "stats". Run requests can also
+                 set the PageRank "options", the "telemetry_file" path, and whether
+                 to write the "telemetry" for every graph (see `run_metric`)
+
+        Returns
+        -------
+        response: A dict with a "status" of "ok", "exists", or "error"
+        """
+        try:
+            if request["command"] == "stats":
+                return {
+                    "status": "ok",
+                    "workers": self.workers,
+                    "n_jobs": self.n_jobs,
+                    **self.graphs.stats(),
+                }
+
+            if request["command"] != "run":
+                raise ValueError(f"Unknown command {request['command']}")
+            if request["metric"] not in METRICS:
+                raise ValueError(f"Unsupported metric {request['metric']}")
+            if os.path.exists(request["out_file"]):
+                return {"status": "exists", "out_file": request["out_file"]}
+
+            shared_graph = self.get_graph(request["graph_file"])
+            try:
+                self.executor.submit(
+                    run_metric,
+                    shared_graph.meta,
+                    request["metric"],
+                    request["out_file"],
+                    request.get("options"),
+                    request.get("telemetry_file"),
+                    request.get("telemetry", False),
+                    request["graph_file"],
+                ).result()
+            finally:
+                self._unpin(shared_graph)
+            with self.lock:
+                self.n_jobs += 1
+            return {"status": "ok", "out_file": request["out_file"]}
+        except Exception as e:
+            return {"status": "error", "error": repr(e)}
+
+    def serve(self, address: str, authkey: bytes = AUTHKEY):
+        """Handle requests from clients, each on its own thread, until told to stop"""
+        with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+            while True:
+                connection = listener.accept()
+                if self.stopping.is_set():
+                    connection.close()
+                    break
+                # Requests are read on their own threads, so a slow client doesn't
+                # hold up new connections
+                threading.Thread(
+                    target=self._respond,
+                    args=(connection, address, authkey),
+                    daemon=True,
+                ).start()
+        self.close()
+
+    def _respond(self, connection, address: str, authkey: bytes):
+        with connection:
+            request = connection.recv()
+            if request["command"] == "shutdown":
+                self.stopping.set()
+                connection.send({"status": "ok"})
+            else:
+                connection.send(self.handle(request))
+        if request["command"] == "shutdown":
+            # Wake the accept loop so it sees the server is stopping
+            Client(address, family="AF_UNIX", authkey=authkey).close()
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        self.executor.shutdown()
+        self.graphs.clear()
+
+
+def send_request(address: str, request: dict, authkey: bytes = AUTHKEY) -> dict:
+    """Send a request to a server started with `GraphServer.serve`"""
+    with Client(address, family="AF_UNIX", authkey=authkey) as connection:
+        connection.send(request)
+        return connection.recv()
+
+
+def submit_graphs(
+    address: str,
+    graph_files: List[str],
+    metric: str,
+    out_dir: str,
+    options: dict = None,
+    telemetry: bool = False,
+    max_requests: int = None,
+) -> List[Dict]:
+    """
+    Run a metric on each graph, naming the outputs like run_metric_on_graph.py
+
+    Each request waits for its job to finish, so up to `max_requests` of them are sent
+    at once. By default this is the server's number of workers, which keeps all of
+    them busy. `options` and `telemetry` are as in `run_metric`
+    """
+    if max_requests is None:
+        max_requests = send_request(address, {"command": "stats"})["workers"]
+
+    def submit(graph_file: str) -> Dict:
+        in_file_base = graph_base_name(graph_file)
+        out_file = os.path.join(out_dir, f"{in_file_base}-{metric}.pkl")
+        telemetry_file = get_telemetry_path(out_dir, in_file_base, metric)
+        return send_request(
+            address,
+            {
+                "command": "run",
+                "graph_file": graph_file,
+                "metric": metric,
+                "out_file": os.path.abspath(out_file),
+                "options": options,
+                "telemetry_file": os.path.abspath(telemetry_file),
+                "telemetry": telemetry,
+            },
+        )
+
+    with ThreadPoolExecutor(max_workers=max(max_requests, 1)) as executor:
+        return list(executor.map(submit, graph_files))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["serve", "submit", "stats", "shutdown"])
+    parser.add_argument(
+        "graph_files", help="The graphs to submit jobs for", nargs="*", default=[]
+    )
+    parser.add_argument(
+        "--socket", help="The path of the server's socket", default="graph_server.sock"
+    )
+    parser.add_argument(
+        "--workers", help="The number of worker processes", type=int, default=1
+    )
+    parser.add_argument(
+        "--memory_gb",
+        help="The amount of shared memory used to cache graphs",
+        type=float,
+        default=8,
+    )
+    parser.add_argument(
+        "--metric",
+        help="The metric to calculate for submitted graphs",
+        choices=METRICS,
+        default="pagerank",
+    )
+    parser.add_argument(
+        "--out_dir", help="The dictory to store the results to", default="output/"
+    )
+    add_pagerank_args(parser)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        GraphServer(args.workers, int(args.memory_gb * 1024**3)).serve(args.socket)
+    elif args.command == "submit":
+        failed = False
+        for response in submit_graphs(
+            args.socket,
+            args.graph_files,
+            args.metric,
+            args.out_dir,
+            get_pagerank_options(args),
+            args.telemetry,
+        ):
+            print(response)
+            failed = failed or response["status"] == "error"
+        sys.exit(1 if failed else 0)
+    else:
+        print(send_request(args.socket, {"command": args.command}))
@@ -0,0 +1,122 @@
+"""
+Compose a parent heading's network from the networks of its child headings
+
+Every citation between two papers in the same child heading is already in that child's
+network, so the parent's network is the union of its children's networks plus the
+citations that cross between children. Those are found in a single pass over COCI that
+routes citations by the child headings of each paper, the same way pairwise.py routes
+citations to pairs.
+"""
+from typing import Dict, Iterable, List, Set, Tuple
+
+import networkx as nx
+import pandas as pd
+from tqdm import tqdm
+
+from pairwise import (
+    build_doi_masks,
+    count_mask_words,
+    get_citation_masks,
+    mask_to_words,
+)
+
+
+def clean_heading(heading: str) -> str:
+    """Convert a MeSH heading to the form used in file names"""
+    clean_heading = heading.replace(" ", "_")
+    clean_heading = clean_heading.replace("-", "_")
+    clean_heading = clean_heading.replace(",", "")
+    return clean_heading.lower()
+
+
+def find_cross_edges(
+    file_paths: List[str],
+    doi_to_mask: Dict[str, int],
+    parent_to_mask: Dict[str, int],
+) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Find the citations between papers in different children of each parent heading
+
+    Arguments
+    ---------
+    file_paths: The COCI csv files to read
+    doi_to_mask: A mapping between each doi and the bitmask of its child headings
+    parent_to_mask: A mapping between each parent and the bitmask of its children
+
+    Returns
+    -------
+    parent_to_edges: The (citing, cited) citations whose papers are both in one of the
+                     parent's children, but never in the same child
+    """
+    n_words = count_mask_words(doi_to_mask)
+    parent_to_words = {
+        parent: mask_to_words(mask, n_words) for parent, mask in parent_to_mask.items()
+    }
+    parent_to_edges = {parent: [] for parent in parent_to_mask}
+    for file_path in tqdm(file_paths):
+        citation_df = pd.read_csv(file_path, usecols=["citing", "cited"])
+        citing_masks, cited_masks = get_citation_masks(
+            citation_df, doi_to_mask, n_words
+        )
+        citing = citation_df["citing"].to_numpy()
+        cited = citation_df["cited"].to_numpy()
+
+        for parent, parent_words in parent_to_words.items():
+            citing_children = citing_masks & parent_words
+            cited_children = cited_masks & parent_words
+            keep = (
+                citing_children.any(axis=1)
+                & cited_children.any(axis=1)
+                & ~(citing_children & cited_children).any(axis=1)
+            )
+            parent_to_edges[parent].extend(zip(citing[keep], cited[keep]))
+    return parent_to_edges
+
+
+def compose_parent_graphs(
+    parent_to_children: Dict[str, Iterable[str]],
+    child_to_graph: Dict[str, nx.DiGraph],
+    child_to_dois: Dict[str, Set[str]],
+    file_paths: List[str],
+    include_first_degree: bool = False,
+) -> Dict[str, nx.DiGraph]:
+    """
+    Build each parent heading's network from its children's networks
+
+    Arguments
+    ---------
+    parent_to_children: The child headings to compose each parent from
+    child_to_graph: The already built network of each child heading
+    child_to_dois: The dois in each child heading. These are needed in addition to the
+                   graphs because papers without citations within their own heading
+                   aren't in its network, but can still cite papers in another child
+    file_paths: The COCI csv files to read
+    include_first_degree: Whether the child networks include citations where only one
+                          paper is in the heading. Any citation touching a parent's
+                          papers then touches one of its children, so the union of the
+                          children's networks is already complete and COCI isn't read
+
+    Returns
+    -------
+    parent_to_graph: The composed network of each parent heading
+    """
+    parent_to_graph = {}
+    for parent, children in parent_to_children.items():
+        graph = nx.DiGraph()
+        for child in children:
+            graph.add_edges_from(child_to_graph[child].edges)
+        parent_to_graph[parent] = graph
+
+    if include_first_degree:
+        return parent_to_graph
+
+    heading_to_bit, doi_to_mask = build_doi_masks(child_to_dois)
+    parent_to_mask = {
+        parent: sum(heading_to_bit[child] for child in set(children))
+        for parent, children in parent_to_children.items()
+    }
+    parent_to_edges = find_cross_edges(file_paths, doi_to_mask, parent_to_mask)
+    for parent, edges in parent_to_edges.items():
+        parent_to_graph[parent].add_edges_from(edges)
+
+    return parent_to_graph
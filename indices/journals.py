@@ -0,0 +1,160 @@
+"""
+Summarize the papers in a pair of headings by journal
+
+Journals are encoded as integer codes and only the numeric columns are aggregated, so
+the medians (and any other quantiles) of every column are found from one sort per
+column instead of a pandas groupby over the object columns of the full dataframe.
+"""
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+def sort_groups(
+    codes: np.ndarray, values: np.ndarray, n_groups: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort a column's values within each group, moving missing values to the end
+
+    Arguments
+    ---------
+    codes: The group each value belongs to, from 0 to n_groups - 1
+    values: The values to sort
+    n_groups: The number of groups
+
+    Returns
+    -------
+    sorted_values: The values sorted by group, then by value
+    starts: The index in `sorted_values` where each group starts
+    non_null: The number of non-missing values in each group
+    """
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    non_null = np.bincount(codes, weights=~np.isnan(values), minlength=n_groups)
+    return sorted_values, starts, non_null.astype(np.int64)
+
+
+def group_quantile(
+    sorted_values: np.ndarray, starts: np.ndarray, non_null: np.ndarray, q: float
+) -> np.ndarray:
+    """
+    Find a quantile of each group in the output of `sort_groups`, interpolating linearly
+    between values like pandas does. Groups without any values get NaN
+    """
+    if len(sorted_values) == 0:
+        return np.full(len(starts), np.nan)
+
+    position = q * np.maximum(non_null - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+
+    has_values = non_null > 0
+    # Point empty groups at a valid index, their result is replaced with NaN below
+    safe_starts = np.where(has_values, starts, 0)
+    lower_vals = sorted_values[np.minimum(safe_starts + lower, len(sorted_values) - 1)]
+    upper_vals = sorted_values[np.minimum(safe_starts + upper, len(sorted_values) - 1)]
+    result = lower_vals + (upper_vals - lower_vals) * fraction
+    return np.where(has_values, result, np.nan)
+
+
+def bootstrap_median_ci(
+    sorted_values: np.ndarray,
+    starts: np.ndarray,
+    non_null: np.ndarray,
+    n_bootstrap: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimate a bootstrap confidence interval for the median of each group
+
+    Every group is resampled in the same vectorized draw, so each bootstrap replicate
+    costs one sort over all of the column's values
+
+    Returns
+    -------
+    lower: The lower bound of each group's interval
+    upper: The upper bound of each group's interval
+    """
+    rng = np.random.default_rng(seed)
+    n_groups = len(starts)
+    group_ids = np.repeat(np.arange(n_groups), non_null)
+    group_starts = starts[group_ids]
+    group_sizes = non_null[group_ids]
+    resampled_starts = np.concatenate([[0], np.cumsum(non_null)[:-1]])
+
+    medians = np.empty((n_bootstrap, n_groups))
+    for i in range(n_bootstrap):
+        offsets = np.floor(rng.random(len(group_ids)) * group_sizes).astype(np.int64)
+        resampled = sorted_values[group_starts + offsets]
+        resampled = resampled[np.lexsort((resampled, group_ids))]
+        medians[i] = group_quantile(resampled, resampled_starts, non_null, 0.5)
+
+    alpha = (1 - confidence) / 2
+    lower = np.quantile(medians, alpha, axis=0)
+    upper = np.quantile(medians, 1 - alpha, axis=0)
+    return lower, upper
+
+
+def aggregate_journals(
+    df: pd.DataFrame,
+    journal_size_cutoff: int = 25,
+    quantiles: Union[List[float], None] = None,
+    n_bootstrap: int = 0,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Summarize a pair's percentile dataframe by journal
+
+    Arguments
+    ---------
+    df: A dataframe with one row per paper and a journal column
+    journal_size_cutoff: Journals with this many papers or fewer are left out
+    quantiles: Other quantiles to calculate for each column, stored as {column}_q{q}
+    n_bootstrap: If greater than zero, the number of bootstrap replicates used to find
+                 a confidence interval for each median, stored as {column}_ci_lower and
+                 {column}_ci_upper
+    confidence: The confidence level of the bootstrap intervals
+    seed: The random seed for the bootstrap
+
+    Returns
+    -------
+    journal_df: A dataframe indexed by journal with the median of each numeric column,
+                the number of papers in the journal, and the journal's title
+    """
+    numeric_df = df.select_dtypes(include="number")
+    codes, journals = pd.factorize(df["journal"], sort=True)
+
+    # Papers without a journal aren't part of any group
+    has_journal = codes >= 0
+    codes = codes[has_journal]
+    sizes = np.bincount(codes, minlength=len(journals))
+    keep = sizes > journal_size_cutoff
+
+    columns = {}
+    for column in numeric_df.columns:
+        values = numeric_df[column].to_numpy(dtype=np.float64)[has_journal]
+        sorted_values, starts, non_null = sort_groups(codes, values, len(journals))
+
+        columns[column] = group_quantile(sorted_values, starts, non_null, 0.5)[keep]
+        for q in quantiles or []:
+            columns[f"{column}_q{q}"] = group_quantile(
+                sorted_values, starts, non_null, q
+            )[keep]
+        if n_bootstrap > 0:
+            lower, upper = bootstrap_median_ci(
+                sorted_values, starts, non_null, n_bootstrap, confidence, seed
+            )
+            columns[f"{column}_ci_lower"] = lower[keep]
+            columns[f"{column}_ci_upper"] = upper[keep]
+
+    index = pd.Index(journals[keep], name="journal")
+    journal_df = pd.DataFrame(columns, index=index)
+    journal_df["paper_count"] = sizes[keep]
+    journal_df["journal_title"] = journal_df.index
+    return journal_df
@@ -0,0 +1,48 @@
+"""
+Deferred imports for the scripts' heavy dependencies
+
+Snakemake launches thousands of short-lived processes, so the time spent importing
+modules a script never uses adds up. `lazy_import` returns a module whose code only
+runs the first time one of its attributes is used.
+"""
+import importlib.util
+import sys
+from types import ModuleType
+
+
+class _MissingModule(ModuleType):
+    """Stands in for a module that isn't installed, raising the error once it's used"""
+
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'")
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import a module, deferring running its code until one of its attributes is used
+
+    Arguments
+    ---------
+    name: The module's full name, such as "pandas" or "pubmedpy.efetch". Parent
+          packages are imported immediately
+
+    Returns
+    -------
+    module: The module, which behaves like a normal import once it's been used
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    try:
+        spec = importlib.util.find_spec(name)
+    except ModuleNotFoundError:
+        spec = None
+    if spec is None:
+        return _MissingModule(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
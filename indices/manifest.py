@@ -0,0 +1,103 @@
+"""
+Small per-pair summaries written next to the condensed percentile dataframes
+
+A manifest records how many papers a pair keeps at every possible missingness
+threshold, so filtering pairs by their size doesn't require unpickling each dataframe.
+It also records the modification time and size of the dataframe's pickle, so a
+manifest is ignored once the dataframe it describes has been rewritten.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Union
+
+from lazy import lazy_import
+
+# Reading manifests only needs json, so the array libraries are loaded on first use
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+def get_manifest_path(percentile_path: str) -> str:
+    """Get the path of the manifest for a pair's percentile dataframe"""
+    return os.path.splitext(percentile_path)[0] + ".manifest.json"
+
+
+def build_pair_manifest(
+    df: pd.DataFrame, heading1: str, heading2: str, group: str = None
+) -> dict:
+    """
+    Summarize a pair's percentile dataframe
+
+    Arguments
+    ---------
+    df: The pair's dataframe from condense_pair
+    heading1: The first heading in the pair
+    heading2: The second heading in the pair
+    group: The group network the pair's results were taken from, or None if they came
+           from the pair's own network
+
+    Returns
+    -------
+    manifest: A dict containing the pair's headings, its source `group`, the number of
+              papers in both headings (`overlap`), and `rows_at_threshold`, where the
+              i-th element is the number of papers present in at least i shuffles of
+              both headings
+    """
+    counts1 = df[f"{heading1}_count"].to_numpy(dtype=np.float64)
+    counts2 = df[f"{heading2}_count"].to_numpy(dtype=np.float64)
+    # Papers without a count for either heading never pass the filter
+    present = ~np.isnan(counts1) & ~np.isnan(counts2)
+    min_counts = np.minimum(counts1[present], counts2[present])
+    count_hist = np.bincount(min_counts.astype(np.int64))
+    rows_at_threshold = np.cumsum(count_hist[::-1])[::-1]
+
+    return {
+        "heading1": heading1,
+        "heading2": heading2,
+        "group": group,
+        "overlap": len(df),
+        "rows_at_threshold": rows_at_threshold.tolist(),
+    }
+
+
+def rows_at_threshold(manifest: dict, missingness_threshold: int) -> int:
+    """Get the number of papers present in at least `missingness_threshold` shuffles"""
+    counts = manifest["rows_at_threshold"]
+    if missingness_threshold >= len(counts):
+        return 0
+    return counts[max(missingness_threshold, 0)]
+
+
+def get_source_fingerprint(percentile_path: str) -> Union[dict, None]:
+    """Get the modification time and size of a percentile dataframe's pickle"""
+    try:
+        stat = os.stat(percentile_path)
+    except FileNotFoundError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def write_manifest(manifest_path: str, manifest: dict, percentile_path: str):
+    """Write a manifest along with the fingerprint of the pickle it summarizes"""
+    manifest = {**manifest, "source": get_source_fingerprint(percentile_path)}
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as out_file:
+        json.dump(manifest, out_file)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_manifest(manifest_path: str, percentile_path: str) -> Union[dict, None]:
+    """
+    Load a manifest, returning None if it doesn't exist or if the pickle at
+    `percentile_path` has changed since the manifest was written
+    """
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as in_file:
+        manifest = json.load(in_file)
+    source = get_source_fingerprint(percentile_path)
+    if source is None or manifest.get("source") != source:
+        return None
+    return manifest
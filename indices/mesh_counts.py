@@ -0,0 +1,162 @@
+"""
+Look up the number of PubMed articles for MeSH headings, caching the counts on disk
+
+Counts are stored in a SQLite database that persists between runs, one committed row per
+heading, so an interrupted run loses nothing and rerunning the heading selection with a
+different threshold doesn't make any requests. Headings that aren't cached are fetched
+concurrently while staying under NCBI's rate limit.
+"""
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable
+
+import lxml.etree
+import requests
+from ratelimit import limits, sleep_and_retry
+
+ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+
+
+def fetch_heading_count(heading: str, api_key: str = None) -> int:
+    """
+    Return the number of unique dois that fall under the given MeSH heading
+
+    Arguments
+    ---------
+    heading: The MeSH heading to examine
+    api_key: An NCBI API key, which raises the rate limit from 3 to 10 requests/second
+
+    Returns
+    -------
+    count: The number or dois for the heading
+
+    Note:
+    This function is based on code from Le et al., and used in accordance with their license:
+    https://github.com/greenelab/iscb-diversity/blob/master/02.process-pubmed.ipynb
+    """
+    payload = {
+        "db": "pubmed",
+        "term": f'"journal article"[pt] AND "{heading}"[MeSH Terms] AND English[Language]',
+        "rettype": "xml",
+        "retstart": 0,
+    }
+    if api_key is not None:
+        payload["api_key"] = api_key
+
+    retry_interval = 1
+    while retry_interval < 5000:
+        try:
+            response = requests.get(ESEARCH_URL, params=payload)
+
+            tree = lxml.etree.fromstring(response.content)
+            count = int(tree.findtext("Count"))
+            return count
+
+        except Exception as e:
+            print(
+                f"Retrying after {retry_interval} seconds due to {e}", file=sys.stderr
+            )
+            time.sleep(retry_interval)
+            retry_interval *= 4
+
+    raise RuntimeError(f"Repeated timeouts when downloading {heading}")
+
+
+class CountCache:
+    """
+    A persistent mapping between MeSH headings and their article counts
+
+    Arguments
+    ---------
+    path: The SQLite file to store the counts in, which is created if it doesn't exist
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS counts "
+                "(heading TEXT PRIMARY KEY, count INTEGER NOT NULL, fetched_at REAL)"
+            )
+
+    def get_many(self, headings: Iterable[str]) -> Dict[str, int]:
+        """Get the cached counts of any of `headings` that have one"""
+        headings = list(headings)
+        heading_to_count = {}
+        with self.lock:
+            # Stay under SQLite's limit on the number of query parameters
+            for start in range(0, len(headings), 500):
+                batch = headings[start : start + 500]
+                rows = self.connection.execute(
+                    "SELECT heading, count FROM counts "
+                    f"WHERE heading IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                heading_to_count.update(rows)
+        return heading_to_count
+
+    def put(self, heading: str, count: int):
+        """Store a heading's count, committing it immediately"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?)",
+                (heading, count, time.time()),
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM counts").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class HeadingCounter:
+    """
+    Get headings' article counts from the cache, fetching the missing ones concurrently
+
+    Arguments
+    ---------
+    cache: The cache to read from and store fetched counts in
+    fetch: The function that looks up a single heading's count
+    workers: The number of requests to have in flight at once
+    requests_per_second: The rate limit shared by all of the workers
+    """
+
+    def __init__(
+        self,
+        cache: CountCache,
+        fetch: Callable[[str], int] = fetch_heading_count,
+        workers: int = 4,
+        requests_per_second: int = 2,
+    ):
+        self.cache = cache
+        self.workers = workers
+        self.fetch = sleep_and_retry(limits(calls=requests_per_second, period=1)(fetch))
+        self.n_fetched = 0
+
+    def _fetch_and_store(self, heading: str) -> int:
+        count = self.fetch(heading)
+        self.cache.put(heading, count)
+        return count
+
+    def get_counts(self, headings: Iterable[str]) -> Dict[str, int]:
+        """Get the article counts of several headings"""
+        headings = list(dict.fromkeys(headings))
+        heading_to_count = self.cache.get_many(headings)
+        missing = [heading for heading in headings if heading not in heading_to_count]
+
+        if len(missing) > 0:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                counts = executor.map(self._fetch_and_store, missing)
+                heading_to_count.update(zip(missing, counts))
+            self.n_fetched += len(missing)
+
+        return heading_to_count
+
+    def get_count(self, heading: str) -> int:
+        return self.get_counts([heading])[heading]
@@ -0,0 +1,206 @@
+"""
+Parse the MeSH descriptor file into an array-backed tree covering every branch
+
+The nodes of the tree are the descriptors' tree numbers (e.g. H01.158.273), sorted so
+each node's subtree is the contiguous run of nodes after it. That makes subtree queries
+a range lookup, ancestor queries a walk up the parent array, and depth a single lookup.
+Parsing the ~30,000 descriptor records takes a few seconds, so the parsed arrays are
+cached next to the descriptor file and reused until the file changes.
+"""
+import os
+import pickle as pkl
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def parse_descriptors(mesh_file: str) -> List[Tuple[str, List[str]]]:
+    """
+    Read the headings and tree numbers from an ASCII MeSH descriptor file
+
+    Arguments
+    ---------
+    mesh_file: The descriptor file from download_mesh_tree.sh
+
+    Returns
+    -------
+    descriptors: A list of (heading, tree numbers) tuples, one per record
+    """
+    descriptors = []
+    heading = None
+    tree_numbers = []
+    with open(mesh_file) as in_file:
+        for line in in_file:
+            line = line.strip()
+            if line == "*NEWRECORD":
+                if heading is not None:
+                    descriptors.append((heading, tree_numbers))
+                heading = None
+                tree_numbers = []
+                continue
+
+            key, sep, value = line.partition(" = ")
+            if sep == "":
+                continue
+            if key == "MH":
+                heading = value.strip()
+            elif key == "MN":
+                tree_numbers.append(value.strip())
+
+    if heading is not None:
+        descriptors.append((heading, tree_numbers))
+    return descriptors
+
+
+class MeshTree:
+    """
+    Every position in the MeSH hierarchy, stored as arrays in preorder
+
+    Node i has tree number `tree_numbers[i]`, heading `headings[heading_idx[i]]`, parent
+    `parent[i]` (-1 for the top of a branch), and depth `depth[i]` (1 for the top of a
+    branch, like H01). Its subtree is nodes i through `subtree_end[i] - 1`.
+    """
+
+    def __init__(self, descriptors: List[Tuple[str, List[str]]]):
+        self.headings = [heading for heading, _ in descriptors]
+
+        positions = [
+            (tree_number, heading_idx)
+            for heading_idx, (_, tree_numbers) in enumerate(descriptors)
+            for tree_number in tree_numbers
+        ]
+        # Tree numbers have fixed width segments separated by a character that sorts
+        # before the digits, so sorting them puts every node right before its subtree
+        positions.sort()
+
+        self.tree_numbers = [tree_number for tree_number, _ in positions]
+        self.heading_idx = np.array(
+            [heading_idx for _, heading_idx in positions], dtype=np.int32
+        )
+        self.tree_number_to_node = {
+            tree_number: node for node, tree_number in enumerate(self.tree_numbers)
+        }
+
+        n_nodes = len(self.tree_numbers)
+        self.depth = np.array(
+            [tree_number.count(".") + 1 for tree_number in self.tree_numbers],
+            dtype=np.int16,
+        )
+        self.parent = np.full(n_nodes, -1, dtype=np.int32)
+        for node, tree_number in enumerate(self.tree_numbers):
+            parent_number, sep, _ = tree_number.rpartition(".")
+            if sep != "":
+                self.parent[node] = self.tree_number_to_node.get(parent_number, -1)
+
+        # A node's subtree ends at the first later node that isn't deeper than it
+        self.subtree_end = np.full(n_nodes, n_nodes, dtype=np.int32)
+        stack = []
+        for node in range(n_nodes):
+            while stack and not self._is_descendant(node, stack[-1]):
+                self.subtree_end[stack.pop()] = node
+            stack.append(node)
+
+        self.heading_to_nodes: Dict[str, List[int]] = {}
+        for node, heading_idx in enumerate(self.heading_idx.tolist()):
+            self.heading_to_nodes.setdefault(self.headings[heading_idx], []).append(
+                node
+            )
+
+    def _is_descendant(self, node: int, ancestor: int) -> bool:
+        return self.tree_numbers[node].startswith(self.tree_numbers[ancestor] + ".")
+
+    def __len__(self) -> int:
+        return len(self.tree_numbers)
+
+    def find(self, tree_number: str) -> int:
+        """Get the node with a given tree number"""
+        return self.tree_number_to_node[tree_number]
+
+    def find_all(self, tree_numbers: List[str]) -> List[int]:
+        """Get the nodes with the given tree numbers, skipping any that don't exist"""
+        return [
+            self.tree_number_to_node[tree_number]
+            for tree_number in tree_numbers
+            if tree_number in self.tree_number_to_node
+        ]
+
+    def positions(self, heading: str) -> List[int]:
+        """Get every node a heading appears at"""
+        return self.heading_to_nodes.get(heading, [])
+
+    def heading(self, node: int) -> str:
+        return self.headings[self.heading_idx[node]]
+
+    def subtree(self, node: int) -> range:
+        """Get the nodes in a node's subtree, including the node itself"""
+        return range(node, int(self.subtree_end[node]))
+
+    def subtree_headings(self, node: int) -> List[str]:
+        """Get the distinct headings in a node's subtree, in preorder"""
+        headings = [
+            self.headings[idx]
+            for idx in self.heading_idx[node : self.subtree_end[node]]
+        ]
+        return list(dict.fromkeys(headings))
+
+    def children(self, node: int) -> Iterator[int]:
+        """Iterate over a node's children by jumping over each child's subtree"""
+        child = node + 1
+        while child < self.subtree_end[node]:
+            yield child
+            child = int(self.subtree_end[child])
+
+    def ancestors(self, node: int) -> List[int]:
+        """Get a node's ancestors, starting with its parent"""
+        ancestors = []
+        node = self.parent[node]
+        while node != -1:
+            ancestors.append(int(node))
+            node = self.parent[node]
+        return ancestors
+
+    def is_ancestor(self, ancestor: int, node: int) -> bool:
+        """Check whether `ancestor` is above `node` in the tree"""
+        return ancestor < node < self.subtree_end[ancestor]
+
+    def branch_roots(self, prefix: str = "") -> List[int]:
+        """Get the top nodes of the branches whose tree numbers start with `prefix`"""
+        return [
+            node
+            for node, tree_number in enumerate(self.tree_numbers)
+            if self.depth[node] == 1 and tree_number.startswith(prefix)
+        ]
+
+
+def load_mesh_tree(mesh_file: str, cache_path: str = None) -> MeshTree:
+    """
+    Load the MeSH tree, using the cached index if it was built from the same file
+
+    Arguments
+    ---------
+    mesh_file: The ASCII MeSH descriptor file
+    cache_path: Where to cache the parsed tree, defaults to {mesh_file}.index.pkl
+    """
+    if cache_path is None:
+        cache_path = f"{mesh_file}.index.pkl"
+
+    stat = os.stat(mesh_file)
+    source = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as in_file:
+            cached = pkl.load(in_file)
+        if cached["source"] == source:
+            tree = MeshTree.__new__(MeshTree)
+            tree.__dict__.update(cached["arrays"])
+            return tree
+
+    tree = MeshTree(parse_descriptors(mesh_file))
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out_file:
+        # Only the arrays and dicts are stored, so the cache can be loaded no matter
+        # how this module was imported
+        pkl.dump({"source": source, "arrays": tree.__dict__}, out_file)
+    os.replace(tmp_path, cache_path)
+    return tree
@@ -0,0 +1,182 @@
+"""
+Store metric results as sorted columns that can be queried without loading them whole
+
+A result is a directory holding the values sorted in ascending order, the DOIs in the
+same order, and a permutation that sorts the DOIs, all as .npy files. They're opened
+as memory maps, so finding the top papers, the papers in a range of values, or one
+paper's value only reads the parts of the files the query touches.
+
+    python indices/metric_store.py output/*-pagerank.pkl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pickle as pkl
+from typing import Dict, Iterator, Union
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+COLUMNAR_SUFFIX = ".cols"
+
+
+def get_columnar_path(pickle_path: str) -> str:
+    """Get the directory the columnar copy of a pickled result is stored in"""
+    return os.path.splitext(pickle_path)[0] + COLUMNAR_SUFFIX
+
+
+def write_columnar(out_dir: str, node_to_metric: Dict[str, float]):
+    """
+    Write a {doi: value} dict in the columnar layout
+
+    Arguments
+    ---------
+    out_dir: The directory to write the columns to
+    node_to_metric: The metric results. Papers with a value of None are stored with NaN
+                    values, after all of the papers with values
+    """
+    dois = [str(doi).encode() for doi in node_to_metric.keys()]
+    values = np.array(
+        [np.nan if value is None else value for value in node_to_metric.values()],
+        dtype=np.float64,
+    )
+
+    # np.argsort puts NaNs last, and a stable sort keeps ties in a fixed order
+    order = np.argsort(values, kind="stable")
+    sorted_dois = np.array(dois, dtype=bytes)[order] if dois else np.array([], "S1")
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "values.npy"), values[order])
+    np.save(os.path.join(out_dir, "dois.npy"), sorted_dois)
+    np.save(
+        os.path.join(out_dir, "doi_order.npy"), np.argsort(sorted_dois, kind="stable")
+    )
+    with open(os.path.join(out_dir, "meta.json"), "w") as out_file:
+        json.dump(
+            {"n_papers": len(values), "n_valid": int((~np.isnan(values)).sum())},
+            out_file,
+        )
+
+
+class MetricResults:
+    """
+    Read-only queries on a result written by `write_columnar`
+
+    Arguments
+    ---------
+    path: The result's directory
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as in_file:
+            meta = json.load(in_file)
+        self.n_papers = meta["n_papers"]
+        self.n_valid = meta["n_valid"]
+
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        self.dois = np.load(os.path.join(path, "dois.npy"), mmap_mode="r")
+        self.doi_order = np.load(os.path.join(path, "doi_order.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.n_papers
+
+    def _rows(self, start: int, stop: int, descending: bool = False) -> pd.DataFrame:
+        dois = self.dois[start:stop]
+        values = self.values[start:stop]
+        if descending:
+            dois, values = dois[::-1], values[::-1]
+        return pd.DataFrame(
+            {
+                "doi": [doi.decode() for doi in dois.tolist()],
+                "value": np.array(values),
+            }
+        )
+
+    def top_k(self, k: int) -> pd.DataFrame:
+        """Get the `k` papers with the largest values, largest first"""
+        start = max(self.n_valid - k, 0)
+        return self._rows(start, self.n_valid, descending=True)
+
+    def bottom_k(self, k: int) -> pd.DataFrame:
+        """Get the `k` papers with the smallest values, smallest first"""
+        return self._rows(0, min(k, self.n_valid))
+
+    def value_range(
+        self,
+        low: float = float("-inf"),
+        high: float = float("inf"),
+        inclusive: bool = True,
+    ) -> pd.DataFrame:
+        """Get the papers with values between `low` and `high`, in ascending order"""
+        valid = self.values[: self.n_valid]
+        start = np.searchsorted(valid, low, side="left" if inclusive else "right")
+        stop = np.searchsorted(valid, high, side="right" if inclusive else "left")
+        return self._rows(start, max(start, stop))
+
+    def _find_row(self, doi: str) -> Union[int, None]:
+        """Binary search for a paper's row using the sorted DOI permutation"""
+        key = str(doi).encode()
+        position = np.searchsorted(self.dois, key, sorter=self.doi_order)
+        if position == self.n_papers:
+            return None
+        row = self.doi_order[position]
+        if self.dois[row] != key:
+            return None
+        return row
+
+    def get(self, doi: str, default=None) -> Union[float, None]:
+        """Get a single paper's value, or `default` if it isn't in the results"""
+        row = self._find_row(doi)
+        if row is None:
+            return default
+        value = float(self.values[row])
+        return None if np.isnan(value) else value
+
+    def __contains__(self, doi: str) -> bool:
+        return self._find_row(doi) is not None
+
+    def iter_batches(
+        self, batch_size: int = 100000, descending: bool = True
+    ) -> Iterator[pd.DataFrame]:
+        """Stream the papers with values in sorted order, `batch_size` at a time"""
+        if descending:
+            for stop in range(self.n_valid, 0, -batch_size):
+                yield self._rows(max(stop - batch_size, 0), stop, descending=True)
+        else:
+            for start in range(0, self.n_valid, batch_size):
+                yield self._rows(start, min(start + batch_size, self.n_valid))
+
+    def to_dict(self) -> Dict[str, Union[float, None]]:
+        """Load every paper's value into the {doi: value} format of the pickled results"""
+        return {
+            doi.decode(): None if np.isnan(value) else value
+            for doi, value in zip(self.dois.tolist(), self.values.tolist())
+        }
+
+
+def convert_pickle(pickle_path: str) -> str:
+    """Write the columnar copy of a pickled result, returning its path"""
+    with open(pickle_path, "rb") as in_file:
+        node_to_metric = pkl.load(in_file)
+    out_dir = get_columnar_path(pickle_path)
+    write_columnar(out_dir, node_to_metric)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "result_files",
+        help="The pickled results from run_metric_on_graph.py to convert",
+        nargs="+",
+    )
+    args = parser.parse_args()
+
+    for result_file in args.result_files:
+        if not os.path.exists(get_columnar_path(result_file)):
+            convert_pickle(result_file)
@@ -0,0 +1,287 @@
+"""
+Compute DOI overlap and metric correlations between every pair of headings at once
+
+Instead of intersecting DOI sets pair by pair, each heading's results are stored as a
+column of a sparse DOI x heading matrix. Sparse matrix products over that matrix give
+the overlap counts and the sums needed for Pearson correlations for all pairs of
+headings in one pass.
+"""
+import glob
+import os
+import pickle as pkl
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def build_membership_matrix(
+    heading_to_dois: Dict[str, Iterable[str]]
+) -> Tuple[List[str], List[str], sparse.csc_matrix]:
+    """
+    Build a sparse matrix recording which headings each DOI belongs to
+
+    Arguments
+    ---------
+    heading_to_dois: A mapping between MeSH heading names and their corresponding dois
+
+    Returns
+    -------
+    dois: The doi corresponding to each row of the matrix
+    headings: The heading corresponding to each column of the matrix
+    presence: A DOI x heading matrix with a one where the DOI is in the heading
+    """
+    heading_to_metrics = {
+        heading: dict.fromkeys(dois, 1.0) for heading, dois in heading_to_dois.items()
+    }
+    dois, headings, presence = build_metric_matrix(heading_to_metrics)
+    return dois, headings, presence
+
+
+def build_metric_matrix(
+    heading_to_metrics: Dict[str, Dict[str, float]]
+) -> Tuple[List[str], List[str], sparse.csc_matrix]:
+    """
+    Align each heading's {doi: value} results into a sparse DOI x heading matrix
+
+    Arguments
+    ---------
+    heading_to_metrics: A mapping between headings and the metric values of their papers.
+                        Papers with a value of None are treated as missing
+
+    Returns
+    -------
+    dois: The doi corresponding to each row of the matrix
+    headings: The heading corresponding to each column of the matrix
+    values: A DOI x heading matrix of metric values. The sparsity structure of the
+            matrix marks which DOIs are in which heading, so a stored zero is a real
+            value rather than a missing one
+    """
+    headings = sorted(heading_to_metrics.keys())
+    doi_to_idx = {}
+    rows, cols, vals = [], [], []
+    for col, heading in enumerate(headings):
+        for doi, value in heading_to_metrics[heading].items():
+            if value is None:
+                continue
+            row = doi_to_idx.setdefault(doi, len(doi_to_idx))
+            rows.append(row)
+            cols.append(col)
+            vals.append(value)
+
+    values = sparse.csc_matrix(
+        (
+            np.array(vals, dtype=np.float64),
+            (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)),
+        ),
+        shape=(len(doi_to_idx), len(headings)),
+    )
+    values.sort_indices()
+    return list(doi_to_idx.keys()), headings, values
+
+
+def get_presence(values: sparse.csc_matrix) -> sparse.csc_matrix:
+    """Get a matrix with a one wherever `values` has a stored entry"""
+    presence = values.copy()
+    presence.data = np.ones_like(presence.data)
+    return presence
+
+
+def overlap_counts(values: sparse.csc_matrix) -> np.ndarray:
+    """
+    Count the DOIs shared by every pair of headings
+
+    Returns
+    -------
+    counts: A heading x heading array whose diagonal holds the size of each heading
+    """
+    presence = get_presence(values)
+    return (presence.T @ presence).toarray()
+
+
+def jaccard_matrix(counts: np.ndarray) -> np.ndarray:
+    """Convert overlap counts into the fraction of the union of each pair that's shared"""
+    sizes = np.diag(counts)
+    union = sizes[:, None] + sizes[None, :] - counts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, counts / union, np.nan)
+
+
+def pearson_matrix(values: sparse.csc_matrix) -> np.ndarray:
+    """
+    Calculate the Pearson correlation between each pair of headings over their shared DOIs
+
+    Arguments
+    ---------
+    values: A DOI x heading matrix from `build_metric_matrix`
+
+    Returns
+    -------
+    correlations: A heading x heading array of correlations, with NaN for pairs that
+                  share fewer than two DOIs or have a constant value over their overlap
+    """
+    values = values.copy()
+    presence = get_presence(values)
+
+    # Centering each column doesn't change the correlations, but it avoids losing
+    # precision when subtracting the large sums below
+    column_sizes = np.diff(values.indptr)
+    column_sums = np.asarray(values.sum(axis=0)).ravel()
+    column_means = np.divide(
+        column_sums,
+        column_sizes,
+        out=np.zeros_like(column_sums),
+        where=column_sizes > 0,
+    )
+    values.data -= np.repeat(column_means, column_sizes)
+
+    # sums[i, j] holds the sum of heading i's values over the DOIs it shares with j
+    n = (presence.T @ presence).toarray()
+    sums = (values.T @ presence).toarray()
+    sums_of_squares = (values.multiply(values).T @ presence).toarray()
+    cross_products = (values.T @ values).toarray()
+
+    covariance = n * cross_products - sums * sums.T
+    variance = n * sums_of_squares - sums**2
+    denominator = np.sqrt(variance * variance.T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = np.where(
+            (n >= 2) & (denominator > 0), covariance / denominator, np.nan
+        )
+    return np.clip(correlations, -1, 1)
+
+
+def spearman_matrix(values: sparse.csc_matrix) -> np.ndarray:
+    """
+    Calculate the Spearman correlation between each pair of headings over their shared DOIs
+
+    Unlike Pearson correlations, the ranks depend on which DOIs each pair shares, so
+    they're taken within each pair's overlap. Rather than intersecting the columns pair
+    by pair, every (DOI, heading, other heading) combination that `overlap_counts` counts
+    is listed at once, and a single sort ranks each heading's values within every pair
+    it's part of. The correlations are then sums over those ranks, like `pearson_matrix`.
+
+    Arguments
+    ---------
+    values: A DOI x heading matrix from `build_metric_matrix`
+
+    Returns
+    -------
+    correlations: A heading x heading array of correlations, with NaN for pairs that
+                  share fewer than two DOIs or have tied ranks over their whole overlap
+    """
+    n_headings = values.shape[1]
+    counts = overlap_counts(values)
+    values = sparse.csr_matrix(values)
+    if values.nnz == 0:
+        return np.full((n_headings, n_headings), np.nan)
+
+    # Pair each DOI's entries with every entry in the same row, including themselves.
+    # Row d has h_d entries, so it gets h_d ** 2 combinations, laid out so combination
+    # a * h_d + b pairs its a-th entry with its b-th
+    row_sizes = np.diff(values.indptr)
+    n_combinations = row_sizes**2
+    combination_starts = np.concatenate([[0], np.cumsum(n_combinations)[:-1]])
+    rows = np.repeat(np.arange(values.shape[0]), n_combinations)
+    within_row = np.arange(len(rows)) - combination_starts[rows]
+    first, second = np.divmod(within_row, row_sizes[rows])
+    left = values.indptr[rows] + first
+    # The same DOI seen from the other heading in the pair
+    mirror = combination_starts[rows] + second * row_sizes[rows] + first
+
+    pair = (
+        values.indices[left] * n_headings + values.indices[values.indptr[rows] + second]
+    )
+    x = values.data[left]
+
+    # Rank each heading's values within each pair, averaging the ranks of ties
+    order = np.lexsort((x, pair))
+    sorted_pair, sorted_x = pair[order], x[order]
+    new_pair = np.concatenate([[True], sorted_pair[1:] != sorted_pair[:-1]])
+    new_run = new_pair | np.concatenate([[True], sorted_x[1:] != sorted_x[:-1]])
+    pair_starts = np.flatnonzero(new_pair)
+    positions = np.arange(1, len(order) + 1) - np.repeat(
+        pair_starts, np.diff(np.append(pair_starts, len(order)))
+    )
+    run_starts = np.flatnonzero(new_run)
+    run_ends = np.append(run_starts[1:], len(order)) - 1
+    run_ranks = (positions[run_starts] + positions[run_ends]) / 2
+    ranks = np.empty(len(order))
+    ranks[order] = run_ranks[np.cumsum(new_run) - 1]
+
+    # Averaged ranks always have a mean of (n + 1) / 2, so centering them is exact
+    n = counts.ravel()
+    centered = ranks - (n[pair] + 1) / 2
+    size = n_headings * n_headings
+    cross_products = np.bincount(pair, centered * centered[mirror], size)
+    sums_of_squares = np.bincount(pair, centered**2, size)
+
+    cross_products = cross_products.reshape(n_headings, n_headings)
+    sums_of_squares = sums_of_squares.reshape(n_headings, n_headings)
+    denominator = np.sqrt(sums_of_squares * sums_of_squares.T)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = np.where(
+            (counts >= 2) & (denominator > 0), cross_products / denominator, np.nan
+        )
+    return np.clip(correlations, -1, 1)
+
+
+def pairwise_table(
+    headings: List[str],
+    counts: np.ndarray,
+    correlations: Union[Dict[str, np.ndarray], None] = None,
+) -> pd.DataFrame:
+    """
+    Convert the heading x heading matrices into one row per pair of headings
+
+    Arguments
+    ---------
+    headings: The heading corresponding to each row and column of the matrices
+    counts: The overlap counts from `overlap_counts`
+    correlations: A mapping between column names and heading x heading matrices to add
+
+    Returns
+    -------
+    pairwise_df: A dataframe with the columns heading1, heading2, overlap_count,
+                 paper_overlap, and one column per correlation matrix
+    """
+    idx1, idx2 = np.triu_indices(len(headings), k=1)
+    pairwise_df = pd.DataFrame(
+        {
+            "heading1": np.array(headings, dtype=object)[idx1],
+            "heading2": np.array(headings, dtype=object)[idx2],
+            "overlap_count": counts[idx1, idx2],
+            "paper_overlap": jaccard_matrix(counts)[idx1, idx2],
+        }
+    )
+    if correlations is not None:
+        for column, matrix in correlations.items():
+            pairwise_df[column] = matrix[idx1, idx2]
+    return pairwise_df
+
+
+def load_heading_metrics(
+    metric_dir: str, metric: str = "pagerank"
+) -> Dict[str, Dict[str, float]]:
+    """
+    Load the results of run_metric_on_graph.py for each single-heading network
+
+    Arguments
+    ---------
+    metric_dir: The directory containing {heading}-{metric}.pkl files
+    metric: The name of the metric to load
+
+    Returns
+    -------
+    heading_to_metrics: A mapping between headings and the metric values of their papers
+    """
+    heading_to_metrics = {}
+    for path in glob.glob(os.path.join(metric_dir, f"*-{metric}.pkl")):
+        heading = os.path.basename(path)[: -len(f"-{metric}.pkl")]
+        # Skip split heading and first degree results
+        if "-" in heading:
+            continue
+        with open(path, "rb") as in_file:
+            heading_to_metrics[heading] = pkl.load(in_file)
+    return heading_to_metrics
@@ -0,0 +1,482 @@
+"""
+PageRank on graphs stored as compressed sparse row arrays
+
+Citation graphs are converted to an array of node names and CSR arrays of their out
+edges once, after which PageRank only touches numpy arrays. The results match
+nx.pagerank's defaults (uniform teleportation, dangling nodes linking to every node,
+and the same convergence check).
+
+`component_pagerank` gives the same scores by solving each weakly connected component
+separately. Teleportation and the dangling nodes' links spread the same amount of rank
+to every node, so a component's scores are a shared constant times the solution of its
+own linear system, and the constant is whatever makes all of the scores sum to one.
+Small components are solved directly together, and large ones can run in parallel.
+
+When power iteration doesn't converge, the same linear system can be solved with a
+Krylov method instead, and `pagerank_with_telemetry` records how each solver did. If the
+Krylov method doesn't converge either, no scores are returned.
+"""
+import inspect
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import bicgstab, gmres, spsolve
+
+FALLBACK_SOLVERS = {"gmres": gmres, "bicgstab": bicgstab}
+
+
+class FallbackFailedConvergence(nx.ExceededMaxIterations):
+    """
+    Raised when neither power iteration nor the fallback solver converged
+
+    Attributes
+    ----------
+    telemetry: The record of how each solver did, as `pagerank_with_telemetry` returns
+    """
+
+    def __init__(self, telemetry: Dict):
+        self.telemetry = telemetry
+        super().__init__(
+            f"{telemetry['fallback']} failed to converge within "
+            f"{telemetry['fallback_max_iter']} iterations"
+        )
+
+
+def graph_to_csr(graph: nx.DiGraph) -> Tuple[List, np.ndarray, np.ndarray]:
+    """
+    Convert a graph's out edges into CSR arrays
+
+    Returns
+    -------
+    nodes: The node corresponding to each row
+    indptr: The out edges of node i are indices[indptr[i]:indptr[i+1]]
+    indices: The row numbers of each edge's target
+    """
+    nodes = list(graph.nodes())
+    node_to_idx = {node: i for i, node in enumerate(nodes)}
+
+    out_degrees = np.fromiter(
+        (graph.out_degree(node) for node in nodes), dtype=np.int64, count=len(nodes)
+    )
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(out_degrees, out=indptr[1:])
+    indices = np.fromiter(
+        (node_to_idx[target] for node in nodes for target in graph.successors(node)),
+        dtype=np.int32,
+        count=indptr[-1],
+    )
+    return nodes, indptr, indices
+
+
+def build_transition_matrix(
+    indptr: np.ndarray, indices: np.ndarray
+) -> sparse.csr_matrix:
+    """Build the row-normalized adjacency matrix, leaving dangling nodes' rows empty"""
+    n_nodes = len(indptr) - 1
+    out_degrees = np.diff(indptr)
+    data = np.repeat(1 / np.maximum(out_degrees, 1), out_degrees)
+    return sparse.csr_matrix((data, indices, indptr), shape=(n_nodes, n_nodes))
+
+
+def csr_pagerank(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+    residuals: List[float] = None,
+) -> np.ndarray:
+    """
+    Calculate PageRank with power iteration
+
+    Arguments
+    ---------
+    indptr: The CSR row pointers of the graph's out edges
+    indices: The CSR column indices of the graph's out edges
+    alpha: The damping factor
+    max_iter: The maximum number of iterations to run
+    tol: The convergence tolerance, scaled by the number of nodes as in networkx
+    residuals: If set, the L1 change in the scores after each iteration is appended
+
+    Returns
+    -------
+    scores: The PageRank of each node
+    """
+    n_nodes = len(indptr) - 1
+    if n_nodes == 0:
+        return np.zeros(0)
+
+    transition = build_transition_matrix(indptr, indices)
+    dangling = np.diff(indptr) == 0
+
+    x = np.full(n_nodes, 1 / n_nodes)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (x @ transition) + (alpha * x[dangling].sum() + 1 - alpha) / n_nodes
+        residual = np.abs(x - x_last).sum()
+        if residuals is not None:
+            residuals.append(float(residual))
+        if residual < n_nodes * tol:
+            return x
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+
+def solve_component(
+    transition: sparse.csr_matrix,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+    residuals: List[float] = None,
+) -> np.ndarray:
+    """
+    Solve y = alpha * y @ transition + 1 for a component with power iteration
+
+    The iteration stops once the L1 norm of the change in y is below `tol` times the
+    L1 norm of y, so every component is solved to the same relative accuracy. If
+    `residuals` is set, each iteration's relative change is appended to it.
+    """
+    y = np.full(transition.shape[0], 1 / (1 - alpha))
+    for _ in range(max_iter):
+        y_last = y
+        y = alpha * (y @ transition) + 1
+        residual = np.abs(y - y_last).sum() / y.sum()
+        if residuals is not None:
+            residuals.append(float(residual))
+        if residual < tol:
+            return y
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+
+def solve_linear(
+    transition: sparse.csr_matrix,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+    solver: str = "gmres",
+) -> Tuple[np.ndarray, List[float], bool]:
+    """
+    Solve the same system as `solve_component`, (I - alpha * transition^T) y = 1, with
+    a Krylov method
+
+    Dividing y by its sum gives the PageRank of a whole graph, so this also works as a
+    fallback for `csr_pagerank`
+
+    Arguments
+    ---------
+    transition: The graph's (or component's) row-normalized adjacency matrix
+    alpha: The damping factor
+    max_iter: The maximum number of iterations (restart cycles for GMRES)
+    tol: The tolerance on the residual's norm relative to the right hand side's
+    solver: A key of FALLBACK_SOLVERS
+
+    Returns
+    -------
+    y: The solution
+    residuals: The relative residual norm after each iteration
+    converged: Whether the solver reached `tol`
+    """
+    n_nodes = transition.shape[0]
+    system = (sparse.identity(n_nodes, format="csr") - alpha * transition.T).tocsr()
+    rhs = np.ones(n_nodes)
+    rhs_norm = np.linalg.norm(rhs)
+
+    residuals = []
+
+    def record_residual(xk):
+        residuals.append(float(np.linalg.norm(rhs - system @ xk) / rhs_norm))
+
+    solve = FALLBACK_SOLVERS[solver]
+    kwargs = {"maxiter": max_iter, "atol": 0.0, "callback": record_residual}
+    # scipy renamed tol to rtol in 1.12 and removed tol in 1.14
+    if "rtol" in inspect.signature(solve).parameters:
+        kwargs["rtol"] = tol
+    else:
+        kwargs["tol"] = tol
+    if solver == "gmres":
+        kwargs["callback_type"] = "x"
+
+    y, info = solve(system, rhs, x0=np.full(n_nodes, 1 / (1 - alpha)), **kwargs)
+    return y, residuals, info == 0
+
+
+def _solve_large_component(
+    transition: sparse.csr_matrix,
+    alpha: float,
+    max_iter: int,
+    tol: float,
+    fallback: str = None,
+    fallback_max_iter: int = 1000,
+) -> Tuple[np.ndarray, Dict]:
+    """Solve a component with power iteration, falling back to `solve_linear`"""
+    residuals = []
+    try:
+        y = solve_component(transition, alpha, max_iter, tol, residuals)
+        return y, {"iterations": len(residuals), "fallback": None, "converged": True}
+    except nx.PowerIterationFailedConvergence:
+        if fallback is None:
+            raise
+    y, fallback_residuals, converged = solve_linear(
+        transition, alpha, fallback_max_iter, tol, fallback
+    )
+    return y, {
+        "iterations": len(residuals),
+        "fallback": fallback,
+        "fallback_iterations": len(fallback_residuals),
+        "converged": converged,
+    }
+
+
+def component_pagerank(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+    small_size: int = 64,
+    workers: int = 1,
+    fallback: str = None,
+    fallback_max_iter: int = 1000,
+    telemetry: Dict = None,
+) -> np.ndarray:
+    """
+    Calculate PageRank one weakly connected component at a time
+
+    Arguments
+    ---------
+    indptr: The CSR row pointers of the graph's out edges
+    indices: The CSR column indices of the graph's out edges
+    alpha: The damping factor
+    max_iter: The maximum number of iterations to run on each large component
+    tol: The relative convergence tolerance for each large component
+    small_size: Components with at most this many nodes are solved directly
+    workers: The number of processes to solve large components with
+    fallback: The solver in FALLBACK_SOLVERS to use on large components that power
+              iteration doesn't converge on. If None, the error is raised
+    fallback_max_iter: The maximum number of iterations for the fallback solver
+    telemetry: If set, the number of components and the solvers' iteration counts
+               are added to it
+
+    Raises
+    ------
+    FallbackFailedConvergence: If the fallback solver didn't converge on a component
+
+    Returns
+    -------
+    scores: The PageRank of each node
+    """
+    n_nodes = len(indptr) - 1
+    if n_nodes == 0:
+        if telemetry is not None:
+            telemetry.update({"n_components": 0, "components": [], "converged": True})
+        return np.zeros(0)
+
+    transition = build_transition_matrix(indptr, indices)
+    n_components, labels = csgraph.connected_components(
+        transition, directed=True, connection="weak"
+    )
+    component_sizes = np.bincount(labels, minlength=n_components)
+    # Group the nodes by component
+    order = np.argsort(labels, kind="stable")
+    starts = np.zeros(n_components + 1, dtype=np.int64)
+    np.cumsum(component_sizes, out=starts[1:])
+
+    y = np.ones(n_nodes)
+
+    # The small components' systems are independent blocks of one sparse system, so a
+    # single direct solve handles all of them
+    small_nodes = np.flatnonzero(component_sizes[labels] <= small_size)
+    if len(small_nodes) > 0:
+        block = transition[small_nodes][:, small_nodes]
+        system = sparse.identity(len(small_nodes), format="csc") - alpha * block.T
+        y[small_nodes] = spsolve(system.tocsc(), np.ones(len(small_nodes)))
+
+    large_components = np.flatnonzero(component_sizes > small_size)
+    # Start the largest components first so the workers finish together
+    large_components = large_components[np.argsort(-component_sizes[large_components])]
+    members = [order[starts[c] : starts[c + 1]] for c in large_components]
+    blocks = [transition[nodes][:, nodes] for nodes in members]
+
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            solutions = list(
+                executor.map(
+                    _solve_large_component,
+                    blocks,
+                    [alpha] * len(blocks),
+                    [max_iter] * len(blocks),
+                    [tol] * len(blocks),
+                    [fallback] * len(blocks),
+                    [fallback_max_iter] * len(blocks),
+                )
+            )
+    else:
+        solutions = [
+            _solve_large_component(
+                block, alpha, max_iter, tol, fallback, fallback_max_iter
+            )
+            for block in blocks
+        ]
+    for nodes, (solution, _) in zip(members, solutions):
+        y[nodes] = solution
+
+    component_info = [info for _, info in solutions]
+    component_telemetry = {
+        "n_components": int(n_components),
+        "n_small_nodes": len(small_nodes),
+        "components": [
+            {"n_nodes": len(nodes), **info}
+            for nodes, info in zip(members, component_info)
+        ],
+        "converged": all(info["converged"] for info in component_info),
+        "fallback": (
+            fallback
+            if any(info["fallback"] is not None for info in component_info)
+            else None
+        ),
+        "fallback_max_iter": fallback_max_iter,
+    }
+    if telemetry is None:
+        telemetry = {}
+    telemetry.update(component_telemetry)
+    if not telemetry["converged"]:
+        raise FallbackFailedConvergence(telemetry)
+
+    return y / y.sum()
+
+
+def pagerank(graph: nx.DiGraph, by_component: bool = False, **kwargs) -> dict:
+    """
+    A drop-in replacement for nx.pagerank using `csr_pagerank`, or `component_pagerank`
+    if `by_component` is True
+    """
+    nodes, indptr, indices = graph_to_csr(graph)
+    if by_component:
+        scores = component_pagerank(indptr, indices, **kwargs)
+    else:
+        scores = csr_pagerank(indptr, indices, **kwargs)
+    return dict(zip(nodes, scores.tolist()))
+
+
+def csr_pagerank_with_telemetry(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+    fallback: str = "gmres",
+    fallback_max_iter: int = 1000,
+    by_component: bool = False,
+    **component_kwargs,
+) -> Tuple[np.ndarray, Dict]:
+    """
+    Calculate PageRank on CSR arrays and record how the solvers converged
+
+    Arguments
+    ---------
+    indptr: The CSR row pointers of the graph's out edges
+    indices: The CSR column indices of the graph's out edges
+    alpha: The damping factor
+    max_iter: The maximum number of power iterations
+    tol: The convergence tolerance, see `csr_pagerank` and `component_pagerank`
+    fallback: The solver in FALLBACK_SOLVERS to use if power iteration doesn't
+              converge, or None to raise nx.PowerIterationFailedConvergence instead
+    fallback_max_iter: The maximum number of iterations for the fallback solver
+              (restart cycles for GMRES)
+    by_component: Whether to use `component_pagerank`
+    component_kwargs: Extra arguments for `component_pagerank`
+
+    Returns
+    -------
+    scores: The PageRank of each node
+    telemetry: A JSON-serializable dict with the parameters, each solver's iteration
+               count (and residuals, unless `by_component` is set), whether the result
+               converged, and the wall time in seconds
+
+    Raises
+    ------
+    FallbackFailedConvergence: If the fallback solver didn't converge either. The
+                               error's telemetry records how far each solver got
+    """
+    start = time.perf_counter()
+    telemetry = {
+        "n_nodes": len(indptr) - 1,
+        "n_edges": len(indices),
+        "alpha": alpha,
+        "max_iter": max_iter,
+        "tol": tol,
+        "by_component": by_component,
+        "fallback": None,
+        "fallback_max_iter": fallback_max_iter,
+    }
+
+    if by_component:
+        try:
+            scores = component_pagerank(
+                indptr,
+                indices,
+                alpha,
+                max_iter,
+                tol,
+                fallback=fallback,
+                fallback_max_iter=fallback_max_iter,
+                telemetry=telemetry,
+                **component_kwargs,
+            )
+        except FallbackFailedConvergence:
+            telemetry["wall_time_s"] = time.perf_counter() - start
+            raise
+    else:
+        residuals = []
+        try:
+            scores = csr_pagerank(indptr, indices, alpha, max_iter, tol, residuals)
+            converged = True
+        except nx.PowerIterationFailedConvergence:
+            if fallback is None:
+                raise
+            converged = False
+        telemetry.update(
+            {
+                "iterations": len(residuals),
+                "residuals": residuals,
+                "converged": converged,
+            }
+        )
+
+        if not converged:
+            y, fallback_residuals, converged = solve_linear(
+                build_transition_matrix(indptr, indices),
+                alpha,
+                fallback_max_iter,
+                tol,
+                fallback,
+            )
+            scores = y / y.sum()
+            telemetry.update(
+                {
+                    "fallback": fallback,
+                    "fallback_iterations": len(fallback_residuals),
+                    "fallback_residuals": fallback_residuals,
+                    "converged": converged,
+                }
+            )
+            if not converged:
+                telemetry["wall_time_s"] = time.perf_counter() - start
+                raise FallbackFailedConvergence(telemetry)
+
+    telemetry["wall_time_s"] = time.perf_counter() - start
+    return scores, telemetry
+
+
+def pagerank_with_telemetry(graph: nx.DiGraph, **kwargs) -> Tuple[dict, Dict]:
+    """
+    Calculate PageRank on a graph with `csr_pagerank_with_telemetry`, returning the
+    {node: score} results as in nx.pagerank along with the telemetry
+    """
+    nodes, indptr, indices = graph_to_csr(graph)
+    scores, telemetry = csr_pagerank_with_telemetry(indptr, indices, **kwargs)
+    return dict(zip(nodes, scores.tolist())), telemetry
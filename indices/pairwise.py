@@ -0,0 +1,526 @@
+"""
+Route COCI citations to pairwise heading networks under a memory budget
+
+Each DOI is given a bitmask of the headings it belongs to. The masks are Python ints,
+and arrays of them are stored as rows of 64 bit words so any number of headings fits.
+A single pass over COCI records how many citations fall between each combination of
+heading masks in each file, which gives the number of edges in every pairwise network
+and the last file each network needs. Pairs are then packed into work units whose graphs fit in memory
+together, and each unit only reads the COCI files that contain its edges.
+
+Alternatively, COCI can be read once into a union graph holding every citation that
+belongs to at least one pair, from which each pair's network is extracted directly.
+"""
+import math
+import os
+import pickle as pkl
+from typing import Callable, Dict, Iterable, List, Sequence, Set, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# A rough estimate of the memory used by each edge of a networkx DiGraph, including
+# the per-node overhead amortized over a typical citation network's edges
+BYTES_PER_EDGE = 250
+
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+
+
+def build_doi_masks(
+    heading_to_dois: Dict[str, Set[str]]
+) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Assign each heading a bit and build a bitmask of the headings each DOI belongs to
+
+    Arguments
+    ---------
+    heading_to_dois: A mapping between MeSH heading names and their corresponding dois
+
+    Returns
+    -------
+    heading_to_bit: A mapping between each heading and its bit
+    doi_to_mask: A mapping between each doi and the bitwise or of its headings' bits
+    """
+    heading_to_bit = {
+        heading: 1 << i for i, heading in enumerate(sorted(heading_to_dois.keys()))
+    }
+    doi_to_mask = {}
+    for heading, dois in heading_to_dois.items():
+        bit = heading_to_bit[heading]
+        for doi in dois:
+            doi_to_mask[doi] = doi_to_mask.get(doi, 0) | bit
+
+    return heading_to_bit, doi_to_mask
+
+
+def count_mask_words(doi_to_mask: Dict[str, int]) -> int:
+    """Get the number of 64 bit words needed to store the largest mask"""
+    n_bits = max((mask.bit_length() for mask in doi_to_mask.values()), default=0)
+    return max(math.ceil(n_bits / WORD_BITS), 1)
+
+
+def masks_to_words(masks: Sequence[int], n_words: int) -> np.ndarray:
+    """Convert masks to an array with a row of little-endian uint64 words for each"""
+    if n_words == 1:
+        return np.fromiter(masks, dtype=np.uint64, count=len(masks)).reshape(-1, 1)
+    words = np.empty((len(masks), n_words), dtype=np.uint64)
+    for i in range(n_words):
+        shift = i * WORD_BITS
+        words[:, i] = np.fromiter(
+            ((mask >> shift) & WORD_MASK for mask in masks),
+            dtype=np.uint64,
+            count=len(masks),
+        )
+    return words
+
+
+def mask_to_words(mask: int, n_words: int) -> np.ndarray:
+    """
+    Convert a single pair's or parent's mask to a row of words, dropping any bits past
+    the last word, which no DOI has
+    """
+    return masks_to_words([mask & ((1 << (n_words * WORD_BITS)) - 1)], n_words)[0]
+
+
+def words_to_mask(words: np.ndarray) -> int:
+    """Convert a row of words from `masks_to_words` back to a mask"""
+    return sum(int(word) << (i * WORD_BITS) for i, word in enumerate(words.tolist()))
+
+
+def get_citation_masks(
+    citation_df: pd.DataFrame, doi_to_mask: Dict[str, int], n_words: int = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Look up the heading masks of the citing and cited papers in a COCI file
+
+    Returns
+    -------
+    citing_masks: The masks of the citing papers, as rows of `n_words` words (see
+                  `masks_to_words`). Defaults to enough words for every mask
+    cited_masks: The masks of the cited papers
+    """
+    if n_words is None:
+        n_words = count_mask_words(doi_to_mask)
+    citing_masks = masks_to_words(
+        [doi_to_mask.get(doi, 0) for doi in citation_df["citing"]], n_words
+    )
+    cited_masks = masks_to_words(
+        [doi_to_mask.get(doi, 0) for doi in citation_df["cited"]], n_words
+    )
+    return citing_masks, cited_masks
+
+
+def index_coci_files(
+    file_paths: List[str], doi_to_mask: Dict[str, int]
+) -> Dict[str, Dict[Tuple[int, int], int]]:
+    """
+    Count the citations between each combination of heading masks in each COCI file
+
+    Arguments
+    ---------
+    file_paths: The COCI csv files to index
+    doi_to_mask: A mapping between each doi and the bitmask of its headings
+
+    Returns
+    -------
+    file_to_mask_counts: A mapping between each file and a dict mapping
+                         (citing mask, cited mask) tuples to their number of citations.
+                         Citations where neither paper is in a heading are left out
+    """
+    n_words = count_mask_words(doi_to_mask)
+    file_to_mask_counts = {}
+    for file_path in tqdm(file_paths):
+        citation_df = pd.read_csv(file_path, usecols=["citing", "cited"])
+        citing_masks, cited_masks = get_citation_masks(
+            citation_df, doi_to_mask, n_words
+        )
+
+        keep = citing_masks.any(axis=1) | cited_masks.any(axis=1)
+        mask_pairs = np.concatenate([citing_masks[keep], cited_masks[keep]], axis=1)
+        unique_pairs, counts = np.unique(mask_pairs, axis=0, return_counts=True)
+
+        file_to_mask_counts[file_path] = {
+            (words_to_mask(row[:n_words]), words_to_mask(row[n_words:])): int(count)
+            for row, count in zip(unique_pairs, counts.tolist())
+        }
+    return file_to_mask_counts
+
+
+def load_coci_index(
+    index_path: str,
+    file_paths: List[str],
+    heading_to_bit: Dict[str, int],
+    doi_to_mask: Dict[str, int],
+) -> Dict[str, Dict[Tuple[int, int], int]]:
+    """
+    Load the COCI index from `index_path`, or build and save it if it is missing or was
+    built for a different set of files or headings
+    """
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as in_file:
+            index = pkl.load(in_file)
+        if (
+            index["file_paths"] == file_paths
+            and index["heading_to_bit"] == heading_to_bit
+        ):
+            return index["file_to_mask_counts"]
+
+    file_to_mask_counts = index_coci_files(file_paths, doi_to_mask)
+    # Write to a temporary file first so other jobs never read a partial index
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out_file:
+        pkl.dump(
+            {
+                "file_paths": file_paths,
+                "heading_to_bit": heading_to_bit,
+                "file_to_mask_counts": file_to_mask_counts,
+            },
+            out_file,
+        )
+    os.replace(tmp_path, index_path)
+    return file_to_mask_counts
+
+
+def is_routed(
+    citing_mask, cited_mask, pair_mask: int, include_first_degree: bool = False
+):
+    """
+    Check whether citations belong in the network for a pair of headings
+
+    Works on both int masks and arrays of them from `masks_to_words`
+    """
+    if isinstance(citing_mask, np.ndarray):
+        pair_words = mask_to_words(pair_mask, citing_mask.shape[-1])
+        citing_in_pair = (citing_mask & pair_words).any(axis=-1)
+        cited_in_pair = (cited_mask & pair_words).any(axis=-1)
+    else:
+        citing_in_pair = (citing_mask & pair_mask) != 0
+        cited_in_pair = (cited_mask & pair_mask) != 0
+    if include_first_degree:
+        return citing_in_pair | cited_in_pair
+    return citing_in_pair & cited_in_pair
+
+
+def route_pairs(
+    file_to_mask_counts: Dict[str, Dict[Tuple[int, int], int]],
+    pair_to_mask: Dict[str, int],
+    include_first_degree: bool = False,
+) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    """
+    Use the COCI index to find the number of edges and the files needed for each pair
+
+    Arguments
+    ---------
+    file_to_mask_counts: The output of `index_coci_files`
+    pair_to_mask: A mapping between pair names and the bitmask of both their headings
+    include_first_degree: Whether citations with only one paper in the pair count
+
+    Returns
+    -------
+    pair_to_edges: The number of citations that will be added to each pair's network
+    pair_to_files: The COCI files containing each pair's citations, in the same order
+                   as `file_to_mask_counts`
+    """
+    # Flatten the index into arrays so each pair is routed with one array operation
+    file_paths = list(file_to_mask_counts.keys())
+    file_ids, citing, cited, counts = [], [], [], []
+    for file_id, mask_counts in enumerate(file_to_mask_counts.values()):
+        for (citing_mask, cited_mask), count in mask_counts.items():
+            file_ids.append(file_id)
+            citing.append(citing_mask)
+            cited.append(cited_mask)
+            counts.append(count)
+    n_bits = max((mask.bit_length() for mask in citing + cited), default=0)
+    n_words = max(math.ceil(n_bits / WORD_BITS), 1)
+    citing_masks = masks_to_words(citing, n_words)
+    cited_masks = masks_to_words(cited, n_words)
+    file_ids = np.array(file_ids, dtype=np.int64)
+    counts = np.array(counts, dtype=np.int64)
+
+    pair_to_edges = {}
+    pair_to_files = {}
+    for pair, pair_mask in pair_to_mask.items():
+        routed = is_routed(citing_masks, cited_masks, pair_mask, include_first_degree)
+        file_edges = np.zeros(len(file_paths), dtype=np.int64)
+        np.add.at(file_edges, file_ids[routed], counts[routed])
+        pair_to_edges[pair] = int(file_edges.sum())
+        pair_to_files[pair] = [file_paths[i] for i in np.flatnonzero(file_edges)]
+    return pair_to_edges, pair_to_files
+
+
+def pack_work_units(pair_to_bytes: Dict[str, float], budget: float) -> List[List[str]]:
+    """
+    Group pairs into work units whose networks fit in memory together
+
+    Uses first-fit decreasing bin packing. Pairs larger than the budget get a unit
+    of their own.
+
+    Arguments
+    ---------
+    pair_to_bytes: The estimated memory needed for each pair's network
+    budget: The maximum memory a work unit should use
+
+    Returns
+    -------
+    work_units: A list of work units, each of which is a list of pair names
+    """
+    work_units = []
+    unit_bytes = []
+    # Sort by name as well as size so the units are deterministic
+    for pair in sorted(pair_to_bytes, key=lambda pair: (-pair_to_bytes[pair], pair)):
+        size = pair_to_bytes[pair]
+        for i, used in enumerate(unit_bytes):
+            if used + size <= budget:
+                work_units[i].append(pair)
+                unit_bytes[i] += size
+                break
+        else:
+            work_units.append([pair])
+            unit_bytes.append(size)
+    return work_units
+
+
+def build_pair_graphs(
+    pair_to_mask: Dict[str, int],
+    pair_to_files: Dict[str, List[str]],
+    doi_to_mask: Dict[str, int],
+    on_finished: Callable[[str, nx.DiGraph], None],
+    include_first_degree: bool = False,
+):
+    """
+    Build the pairwise networks for a work unit, handing each one off once it's done
+
+    Only the files that contain a pair's citations are read, and each pair's network is
+    passed to `on_finished` (and dropped from memory) as soon as its last file has been
+    routed.
+
+    Arguments
+    ---------
+    pair_to_mask: A mapping between pair names and the bitmask of both their headings
+    pair_to_files: The COCI files containing each pair's citations, from `route_pairs`
+    doi_to_mask: A mapping between each doi and the bitmask of its headings
+    on_finished: A function to call with each pair's name and finished network
+    include_first_degree: If True include citations where either paper belongs to the
+                          pair, if False, include only citations where both papers do
+    """
+    file_order = []
+    file_to_pairs = {}
+    pair_to_remaining = {}
+    for pair, files in pair_to_files.items():
+        pair_to_remaining[pair] = len(files)
+        for file_path in files:
+            if file_path not in file_to_pairs:
+                file_to_pairs[file_path] = []
+                file_order.append(file_path)
+            file_to_pairs[file_path].append(pair)
+
+    n_words = count_mask_words(doi_to_mask)
+    pair_to_graph = {pair: nx.DiGraph() for pair in pair_to_files}
+
+    # Pairs without any citations are already done
+    for pair in list(pair_to_graph.keys()):
+        if pair_to_remaining[pair] == 0:
+            on_finished(pair, pair_to_graph.pop(pair))
+
+    for file_path in tqdm(sorted(file_order)):
+        citation_df = pd.read_csv(file_path, usecols=["citing", "cited"])
+        citing_masks, cited_masks = get_citation_masks(
+            citation_df, doi_to_mask, n_words
+        )
+        citing = citation_df["citing"].to_numpy()
+        cited = citation_df["cited"].to_numpy()
+
+        for pair in file_to_pairs[file_path]:
+            keep = is_routed(
+                citing_masks, cited_masks, pair_to_mask[pair], include_first_degree
+            )
+            pair_to_graph[pair].add_edges_from(zip(citing[keep], cited[keep]))
+
+            pair_to_remaining[pair] -= 1
+            if pair_to_remaining[pair] == 0:
+                on_finished(pair, pair_to_graph.pop(pair))
+
+
+def heading_pair_masks(
+    heading_pairs: Iterable[Tuple[str, ...]], heading_to_bit: Dict[str, int]
+) -> Dict[str, int]:
+    """
+    Build the `pair_to_mask` dict used above, using the pipeline's pair names
+
+    Groups of more than two headings work the same way, and are named by joining all
+    of their headings with +
+    """
+    return {
+        "+".join(headings): sum(heading_to_bit[heading] for heading in set(headings))
+        for headings in heading_pairs
+    }
+
+
+def build_union_graph(
+    file_paths: List[str],
+    doi_to_mask: Dict[str, int],
+    include_first_degree: bool = False,
+) -> Dict:
+    """
+    Read COCI once, keeping every citation that belongs in at least one pair's network
+
+    The citations are stored as arrays of node ids, grouped by the heading masks of
+    their citing and cited papers. A pair's network is then the union of the groups
+    whose masks route to it, so it can be pulled out without reading COCI again.
+
+    Arguments
+    ---------
+    file_paths: The COCI csv files to read
+    doi_to_mask: A mapping between each doi and the bitmask of its headings
+    include_first_degree: Whether to keep citations where only one paper is in a heading
+
+    Returns
+    -------
+    union: A dict containing the node dois, and the citing and cited node ids of each
+           citation sorted by group. Group i's citations are rows
+           group_starts[i]:group_starts[i+1], and its citing and cited masks are
+           group_masks[i, 0] and group_masks[i, 1], as rows of words
+    """
+    n_words = count_mask_words(doi_to_mask)
+    doi_to_node = {}
+    citing_nodes, cited_nodes = [], []
+    for file_path in tqdm(file_paths):
+        citation_df = pd.read_csv(file_path, usecols=["citing", "cited"])
+        citing_masks, cited_masks = get_citation_masks(
+            citation_df, doi_to_mask, n_words
+        )
+
+        if include_first_degree:
+            keep = citing_masks.any(axis=1) | cited_masks.any(axis=1)
+        else:
+            keep = citing_masks.any(axis=1) & cited_masks.any(axis=1)
+
+        for dois, nodes in [
+            (citation_df["citing"].to_numpy()[keep], citing_nodes),
+            (citation_df["cited"].to_numpy()[keep], cited_nodes),
+        ]:
+            nodes.append(
+                np.fromiter(
+                    (doi_to_node.setdefault(doi, len(doi_to_node)) for doi in dois),
+                    dtype=np.int64,
+                    count=len(dois),
+                )
+            )
+
+    dois = list(doi_to_node.keys())
+    masks = masks_to_words([doi_to_mask.get(doi, 0) for doi in dois], n_words)
+    citing = np.concatenate(citing_nodes) if citing_nodes else np.zeros(0, np.int64)
+    cited = np.concatenate(cited_nodes) if cited_nodes else np.zeros(0, np.int64)
+
+    mask_pairs = np.concatenate([masks[citing], masks[cited]], axis=1)
+    group_masks, groups, counts = np.unique(
+        mask_pairs, axis=0, return_inverse=True, return_counts=True
+    )
+    order = np.argsort(groups.ravel(), kind="stable")
+    group_starts = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=group_starts[1:])
+
+    return {
+        "dois": dois,
+        "citing": citing[order].astype(np.int32),
+        "cited": cited[order].astype(np.int32),
+        "group_masks": group_masks.reshape(-1, 2, n_words),
+        "group_starts": group_starts,
+    }
+
+
+def load_union_graph(
+    union_path: str,
+    file_paths: List[str],
+    heading_to_bit: Dict[str, int],
+    doi_to_mask: Dict[str, int],
+    include_first_degree: bool = False,
+) -> Dict:
+    """
+    Load the union graph from `union_path`, or build and save it if it is missing or was
+    built for a different set of files, headings, or citations
+    """
+    source = {
+        "file_paths": file_paths,
+        "heading_to_bit": heading_to_bit,
+        "include_first_degree": include_first_degree,
+        # Union graphs from before masks were stored as words are rebuilt
+        "n_mask_words": count_mask_words(doi_to_mask),
+    }
+    if os.path.exists(union_path):
+        with open(union_path, "rb") as in_file:
+            union = pkl.load(in_file)
+        if union["source"] == source:
+            return union
+
+    union = build_union_graph(file_paths, doi_to_mask, include_first_degree)
+    union["source"] = source
+    # Write to a temporary file first so other jobs never read a partial graph
+    tmp_path = f"{union_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out_file:
+        pkl.dump(union, out_file, protocol=4)
+    os.replace(tmp_path, union_path)
+    return union
+
+
+def get_pair_groups(
+    union: Dict, pair_mask: int, include_first_degree: bool = False
+) -> np.ndarray:
+    """Find the citation groups of the union graph that belong in a pair's network"""
+    group_masks = union["group_masks"]
+    routed = is_routed(
+        group_masks[:, 0], group_masks[:, 1], pair_mask, include_first_degree
+    )
+    return np.flatnonzero(routed)
+
+
+def union_pair_edges(
+    union: Dict, pair_to_mask: Dict[str, int], include_first_degree: bool = False
+) -> Dict[str, int]:
+    """Count the citations in each pair's network using the union graph's groups"""
+    group_sizes = np.diff(union["group_starts"])
+    return {
+        pair: int(group_sizes[get_pair_groups(union, mask, include_first_degree)].sum())
+        for pair, mask in pair_to_mask.items()
+    }
+
+
+def extract_pair_graph(
+    union: Dict, pair_mask: int, include_first_degree: bool = False
+) -> nx.DiGraph:
+    """
+    Pull a pair's network out of the union graph
+
+    Arguments
+    ---------
+    union: The output of `build_union_graph`
+    pair_mask: The bitmask of both of the pair's headings
+    include_first_degree: If True include citations where either paper belongs to the
+                          pair, if False, include only citations where both papers do.
+                          Must not be True unless the union graph was built with it
+
+    Returns
+    -------
+    graph: The pair's citation network
+    """
+    starts = union["group_starts"]
+    edge_slices = [
+        slice(starts[group], starts[group + 1])
+        for group in get_pair_groups(union, pair_mask, include_first_degree)
+    ]
+    if len(edge_slices) == 0:
+        return nx.DiGraph()
+
+    citing = np.concatenate([union["citing"][edges] for edges in edge_slices])
+    cited = np.concatenate([union["cited"][edges] for edges in edge_slices])
+    dois = union["dois"]
+
+    graph = nx.DiGraph()
+    graph.add_edges_from(
+        (dois[source], dois[target])
+        for source, target in zip(citing.tolist(), cited.tolist())
+    )
+    return graph
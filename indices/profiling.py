@@ -0,0 +1,183 @@
+"""
+Timers and memory instrumentation for the load, compute, and save phases of the scripts
+
+Profiling is off by default. It can be turned on with the `--profile` flag added by
+`add_profiling_args`, or by setting the INDICES_PROFILE environment variable (which
+is convenient for sbatch scripts). When it's on, each phase prints one JSON line to
+stderr with its wall time, CPU time, and peak memory usage. If a profile directory is
+also set (`--profile_dir` or INDICES_PROFILE_DIR), each phase additionally writes
+cProfile stats and a tracemalloc summary of its largest allocations there. Phases can be
+nested, in which case only the outermost one runs cProfile and starts tracemalloc, and
+the inner ones are included in its output. Each phase resets the kernel's peak memory
+counter when it starts, and passes its peak up to the phase around it so the outer
+phase's peak still covers the whole phase.
+"""
+import argparse
+import cProfile
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_ENABLED = False
+_PROFILE_DIR = None
+_SCRIPT_NAME = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+_PHASE_COUNTER = itertools.count()
+# Only one cProfile profiler can collect at a time, so nested phases share the outer one
+_PROFILER_ACTIVE = False
+# The peak memory usage in megabytes seen so far by each open phase, innermost last,
+# from before the phases nested in them reset the kernel's counter
+_PEAK_RSS_STACK = []
+
+# The keys every record has, which a phase's extra fields can't replace
+RESERVED_FIELDS = {
+    "script",
+    "phase",
+    "wall_time_s",
+    "cpu_time_s",
+    "peak_rss_mb",
+    "pid",
+    "tracemalloc_peak_mb",
+    "profile_path",
+}
+
+
+def reset_peak_rss():
+    """Reset the kernel's high-water mark for this process's memory usage if possible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as out_file:
+            out_file.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_rss_mb() -> float:
+    """Get the peak resident set size of the current process in megabytes"""
+    try:
+        with open("/proc/self/status") as in_file:
+            for line in in_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    if platform.system() == "Darwin":
+        return peak / 1024**2
+    return peak / 1024
+
+
+def add_profiling_args(parser: argparse.ArgumentParser):
+    """Add the --profile and --profile_dir arguments to a script's parser"""
+    parser.add_argument(
+        "--profile",
+        help="Print the time and memory used by each phase of the script as JSON",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile_dir",
+        help="If profiling is enabled, also write cProfile and tracemalloc output "
+        "for each phase to this directory",
+        default=None,
+    )
+
+
+def configure_profiling(args: argparse.Namespace):
+    """Turn profiling on or off based on a script's arguments and the environment"""
+    global _ENABLED, _PROFILE_DIR
+
+    env_setting = os.environ.get("INDICES_PROFILE", "")
+    _ENABLED = args.profile or env_setting.lower() not in ["", "0", "false"]
+    _PROFILE_DIR = args.profile_dir or os.environ.get("INDICES_PROFILE_DIR")
+
+    if _ENABLED and _PROFILE_DIR is not None:
+        os.makedirs(_PROFILE_DIR, exist_ok=True)
+
+
+@contextmanager
+def profile_phase(phase: str, **fields):
+    """
+    Measure the time and memory used by the code run inside the context
+
+    Arguments
+    ---------
+    phase: The name of the phase, usually "load", "compute", or "save"
+    fields: Any extra information to include in the JSON output, such as the file
+            being processed. These can't use the names in RESERVED_FIELDS
+
+    Raises
+    ------
+    ValueError: If a field would replace one of the record's own keys
+    """
+    global _PROFILER_ACTIVE
+
+    reserved = RESERVED_FIELDS.intersection(fields)
+    if len(reserved) > 0:
+        raise ValueError(f"{sorted(reserved)} can't be used as profiling fields")
+
+    if not _ENABLED:
+        yield
+        return
+
+    profiler = None
+    started_tracing = False
+    if _PROFILE_DIR is not None:
+        # Stopping tracemalloc in a nested phase would throw away the outer phase's
+        # traces, so only the phase that started it stops it
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        if not _PROFILER_ACTIVE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            _PROFILER_ACTIVE = True
+
+    if len(_PEAK_RSS_STACK) > 0:
+        _PEAK_RSS_STACK[-1] = max(_PEAK_RSS_STACK[-1], get_peak_rss_mb())
+    reset_peak_rss()
+    _PEAK_RSS_STACK.append(0.0)
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        peak_rss_mb = max(_PEAK_RSS_STACK.pop(), get_peak_rss_mb())
+        if len(_PEAK_RSS_STACK) > 0:
+            _PEAK_RSS_STACK[-1] = max(_PEAK_RSS_STACK[-1], peak_rss_mb)
+        record = {
+            "script": _SCRIPT_NAME,
+            "phase": phase,
+            **fields,
+            "wall_time_s": time.perf_counter() - start_wall,
+            "cpu_time_s": time.process_time() - start_cpu,
+            "peak_rss_mb": peak_rss_mb,
+            "pid": os.getpid(),
+        }
+
+        snapshot = None
+        if started_tracing:
+            snapshot = tracemalloc.take_snapshot()
+            record["tracemalloc_peak_mb"] = (
+                tracemalloc.get_traced_memory()[1] / 1024**2
+            )
+            tracemalloc.stop()
+
+        if profiler is not None:
+            profiler.disable()
+            _PROFILER_ACTIVE = False
+
+            base_name = f"{_SCRIPT_NAME}-{phase}-{os.getpid()}-{next(_PHASE_COUNTER)}"
+            base_path = os.path.join(_PROFILE_DIR, base_name)
+            profiler.dump_stats(base_path + ".prof")
+            record["profile_path"] = base_path + ".prof"
+            if snapshot is not None:
+                with open(base_path + "-tracemalloc.txt", "w") as out_file:
+                    for stat in snapshot.statistics("lineno")[:25]:
+                        out_file.write(f"{stat}\n")
+
+        print(json.dumps(record), file=sys.stderr, flush=True)
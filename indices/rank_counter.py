@@ -0,0 +1,393 @@
+"""
+Count where each paper's true value ranks among its shuffled values as shuffles stream in
+
+A percentile only needs the number of shuffled values below the true value and the
+number of shuffles the paper was in, so instead of keeping every shuffled value, a
+counter keeps those two counts (plus the smallest and largest shuffled values, to spot
+papers the shuffles never changed) for each paper. Memory doesn't grow with the number
+of shuffles, and counters covering different shuffles of the same network can be
+summed together. Shuffled values are compared to the true values at float32, the
+precision the shuffle store keeps, so the percentiles are exactly those of
+`utils.calculate_matrix_percentiles` whether a shuffle was read from its pickle or from
+the store.
+
+Shuffles can be counted as they finish with run_metric_on_graph.py --rank_counter, or
+afterwards from their pickles and shuffle store with the count command. Either way the
+counter file is locked while it's updated, so jobs sharing a split heading can run at
+the same time.
+
+    python indices/rank_counter.py count heading1-heading2 --base_dir output --delete
+    python indices/rank_counter.py merge total.ranks.npz job1.ranks.npz job2.ranks.npz
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import pickle as pkl
+from typing import Dict, List
+
+import shuffle_store
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+COUNTER_SUFFIX = ".ranks.npz"
+
+
+def get_counter_path(base_dir: str, heading_str: str, metric: str = "pagerank") -> str:
+    """Get the counter for a split heading like a-b"""
+    return os.path.join(
+        base_dir, "shuffle_results", f"{heading_str}-{metric}{COUNTER_SUFFIX}"
+    )
+
+
+class RankCounter:
+    """
+    Running rank counts of each paper's true value among its shuffled values
+
+    Arguments
+    ---------
+    true_vals: A mapping between dois and their metric value in the true network.
+               Papers with a value of None are left out, as in `calculate_percentiles`
+    """
+
+    def __init__(self, true_vals: Dict[str, float]):
+        self.dois = [doi for doi, value in true_vals.items() if value is not None]
+        self.true_values = np.array(
+            [true_vals[doi] for doi in self.dois], dtype=np.float64
+        )
+        self.n_below = np.zeros(len(self.dois), dtype=np.int64)
+        self.n_seen = np.zeros(len(self.dois), dtype=np.int64)
+        self.mins = np.full(len(self.dois), np.inf)
+        self.maxes = np.full(len(self.dois), -np.inf)
+        self.shuffles = set()
+        self._doi_to_idx = None
+
+    @property
+    def doi_to_idx(self) -> Dict[str, int]:
+        if self._doi_to_idx is None:
+            self._doi_to_idx = {doi: idx for idx, doi in enumerate(self.dois)}
+        return self._doi_to_idx
+
+    def update(self, shuffle: int, node_to_metric: Dict[str, float]) -> bool:
+        """
+        Count a shuffle's results
+
+        Arguments
+        ---------
+        shuffle: The shuffle's number, used to make sure no shuffle is counted twice
+        node_to_metric: The shuffle's {doi: value} results. Papers that aren't in the
+                        true network or have None values are skipped
+
+        Returns
+        -------
+        counted: False if the shuffle had already been counted
+        """
+        if shuffle in self.shuffles:
+            return False
+
+        doi_to_idx = self.doi_to_idx
+        idx, values = [], []
+        for doi, value in node_to_metric.items():
+            if value is not None and doi in doi_to_idx:
+                idx.append(doi_to_idx[doi])
+                values.append(value)
+        idx = np.array(idx, dtype=np.int64)
+        values = np.array(values, dtype=np.float32)
+        true_values = self.true_values[idx].astype(np.float32)
+
+        # Each paper appears at most once per shuffle, so the indices are unique
+        self.n_below[idx] += values < true_values
+        self.n_seen[idx] += 1
+        self.mins[idx] = np.minimum(self.mins[idx], values)
+        self.maxes[idx] = np.maximum(self.maxes[idx], values)
+        self.shuffles.add(shuffle)
+        return True
+
+    def update_columns(
+        self, shuffles: List[int], dois: List[str], matrix: np.ndarray
+    ) -> int:
+        """
+        Count the shuffles in a matrix of results, like a shuffle_store.ShuffleStore's
+
+        Arguments
+        ---------
+        shuffles: The shuffle number of each column
+        dois: The DOI of each row
+        matrix: A (DOIs x shuffles) matrix with NaN where a DOI wasn't in a shuffle.
+                Values are compared to the true values at float32, as in
+                `utils.calculate_matrix_percentiles`
+
+        Returns
+        -------
+        n_counted: The number of shuffles that hadn't already been counted
+        """
+        columns = [
+            j for j, shuffle in enumerate(shuffles) if shuffle not in self.shuffles
+        ]
+        if len(columns) == 0:
+            return 0
+
+        doi_to_idx = self.doi_to_idx
+        rows = np.array([doi_to_idx.get(doi, -1) for doi in dois], dtype=np.int64)
+        idx = rows[rows >= 0]
+        # The store's rows are unique, so the indices are too
+        values = matrix[rows >= 0][:, columns].astype(np.float32, copy=False)
+        present = ~np.isnan(values)
+        true_values = self.true_values[idx].astype(np.float32)
+
+        self.n_below[idx] += (values < true_values[:, None]).sum(axis=1)
+        self.n_seen[idx] += present.sum(axis=1)
+        self.mins[idx] = np.minimum(
+            self.mins[idx], np.where(present, values, np.inf).min(axis=1)
+        )
+        self.maxes[idx] = np.maximum(
+            self.maxes[idx], np.where(present, values, -np.inf).max(axis=1)
+        )
+        self.shuffles.update(shuffles[j] for j in columns)
+        return len(columns)
+
+    def merge(self, other: "RankCounter"):
+        """
+        Add the counts from another counter for the same network
+
+        Raises
+        ------
+        ValueError: If the counters are for different true values, or share shuffles
+        """
+        if self.dois != other.dois or not np.array_equal(
+            self.true_values, other.true_values
+        ):
+            raise ValueError("Counters for different networks can't be merged")
+        overlap = self.shuffles & other.shuffles
+        if len(overlap) > 0:
+            raise ValueError(
+                f"Shuffles {sorted(overlap)} were counted by both counters"
+            )
+
+        self.n_below += other.n_below
+        self.n_seen += other.n_seen
+        np.minimum(self.mins, other.mins, out=self.mins)
+        np.maximum(self.maxes, other.maxes, out=self.maxes)
+        self.shuffles |= other.shuffles
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Build the dataframe `calculate_percentiles` would for the counted shuffles"""
+        percentiles, counts = [], []
+        for below, seen, low, high in zip(
+            self.n_below.tolist(),
+            self.n_seen.tolist(),
+            self.mins.tolist(),
+            self.maxes.tolist(),
+        ):
+            if seen == 0:
+                percentiles.append(None)
+                counts.append(None)
+            elif low == high:
+                # If the node is unshuffleable for some reason, its percentile isn't
+                # meaningful
+                percentiles.append(None)
+                counts.append(seen)
+            else:
+                percentiles.append(below / seen)
+                counts.append(seen)
+
+        return pd.DataFrame(
+            {
+                "doi": self.dois,
+                "pagerank": self.true_values.tolist(),
+                "percentile": percentiles,
+                "count": counts,
+            }
+        )
+
+    def save(self, path: str):
+        # np.savez adds .npz to names without it, so write to a name that has it
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            dois=np.array([str(doi).encode() for doi in self.dois], dtype=bytes),
+            true_values=self.true_values,
+            n_below=self.n_below,
+            n_seen=self.n_seen,
+            mins=self.mins,
+            maxes=self.maxes,
+            shuffles=np.array(sorted(self.shuffles), dtype=np.int64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RankCounter":
+        counter = cls.__new__(cls)
+        with np.load(path) as arrays:
+            counter.dois = [doi.decode() for doi in arrays["dois"].tolist()]
+            counter.true_values = arrays["true_values"]
+            counter.n_below = arrays["n_below"]
+            counter.n_seen = arrays["n_seen"]
+            counter.mins = arrays["mins"]
+            counter.maxes = arrays["maxes"]
+            counter.shuffles = set(arrays["shuffles"].tolist())
+        counter._doi_to_idx = None
+        return counter
+
+
+def find_shuffle_results(
+    base_dir: str, heading_str: str, metric: str = "pagerank"
+) -> Dict[int, str]:
+    """Find the pickled shuffle results for a split heading, by shuffle number"""
+    suffix = f"-{metric}.pkl"
+    prefix = f"{heading_str}-"
+    shuffle_to_path = {}
+    pattern = f"{base_dir}/shuffle_results/{heading_str}-[0-9]*{suffix}"
+    for path in glob.glob(pattern):
+        shuffle = os.path.basename(path)[len(prefix) : -len(suffix)]
+        if shuffle.isdigit():
+            shuffle_to_path[int(shuffle)] = path
+    return shuffle_to_path
+
+
+def count_pickles(counter: RankCounter, shuffle_to_path: Dict[int, str]) -> List[str]:
+    """Stream pickled shuffle results into a counter, returning the paths it counted"""
+    counted = []
+    for shuffle, path in sorted(shuffle_to_path.items()):
+        if shuffle in counter.shuffles:
+            continue
+        with open(path, "rb") as in_file:
+            counter.update(shuffle, pkl.load(in_file))
+        counted.append(path)
+    return counted
+
+
+def count_store(
+    counter: RankCounter, base_dir: str, heading_str: str, metric: str = "pagerank"
+) -> int:
+    """Count the shuffles in a split heading's shuffle store, if it has one"""
+    store_path = shuffle_store.get_store_path(base_dir, heading_str, metric)
+    if not os.path.exists(os.path.join(store_path, "index.json")):
+        return 0
+    dois, matrix, shuffles = shuffle_store.ShuffleStore(store_path).load()
+    return counter.update_columns(shuffles, dois, matrix)
+
+
+def _load_or_create(counter_path: str, true_path: str) -> RankCounter:
+    if os.path.exists(counter_path):
+        return RankCounter.load(counter_path)
+    with open(true_path, "rb") as in_file:
+        return RankCounter(pkl.load(in_file))
+
+
+def add_shuffle(
+    counter_path: str,
+    true_path: str,
+    shuffle: int,
+    node_to_metric: Dict[str, float],
+) -> bool:
+    """
+    Count a single shuffle's results as soon as they're calculated
+
+    Arguments
+    ---------
+    counter_path: The counter to update, see `get_counter_path`
+    true_path: The true network's pickled results, used if the counter doesn't exist
+    shuffle: The shuffle's number
+    node_to_metric: The shuffle's {doi: value} results
+
+    Returns
+    -------
+    counted: False if the shuffle had already been counted
+    """
+    with shuffle_store.file_lock(f"{counter_path}.lock"):
+        counter = _load_or_create(counter_path, true_path)
+        counted = counter.update(shuffle, node_to_metric)
+        if counted:
+            counter.save(counter_path)
+    return counted
+
+
+def count_shuffles(
+    base_dir: str,
+    heading_str: str,
+    metric: str = "pagerank",
+    delete: bool = False,
+) -> RankCounter:
+    """
+    Update a split heading's counter with its pickled shuffle results and the shuffles
+    in its store, and save it
+
+    Arguments
+    ---------
+    base_dir: The directory containing the true and shuffled metric results
+    heading_str: The split heading, like a-b
+    metric: The metric the results are for
+    delete: Whether to delete the pickled results once they're counted
+
+    Returns
+    -------
+    counter: The updated counter
+    """
+    counter_path = get_counter_path(base_dir, heading_str, metric)
+    # Without the lock, two jobs could both load the counter and the second to save
+    # would drop the first's shuffles, which --delete would then lose for good
+    with shuffle_store.file_lock(f"{counter_path}.lock"):
+        counter = _load_or_create(
+            counter_path, f"{base_dir}/{heading_str}-{metric}.pkl"
+        )
+        shuffle_to_path = find_shuffle_results(base_dir, heading_str, metric)
+        count_pickles(counter, shuffle_to_path)
+        count_store(counter, base_dir, heading_str, metric)
+        counter.save(counter_path)
+
+        if delete:
+            # Pickles counted earlier, e.g. by run_metric_on_graph.py, go too
+            for shuffle, path in shuffle_to_path.items():
+                if shuffle in counter.shuffles:
+                    os.remove(path)
+    return counter
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    count_parser = subparsers.add_parser(
+        "count",
+        help="Count the pickled shuffle results and shuffle stores of split headings",
+    )
+    count_parser.add_argument(
+        "heading_strs", nargs="+", help="The split headings, like heading1-heading2"
+    )
+    count_parser.add_argument(
+        "--base_dir",
+        help="The directory containing the true and shuffled metric results",
+        default="output",
+    )
+    count_parser.add_argument(
+        "--metric", help="The metric the results are for", default="pagerank"
+    )
+    count_parser.add_argument(
+        "--delete",
+        help="Delete the pickled results once they've been counted",
+        action="store_true",
+    )
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="Merge counters that counted different shuffles"
+    )
+    merge_parser.add_argument("out_path", help="Where to write the merged counter")
+    merge_parser.add_argument("counter_paths", nargs="+", help="The counters to merge")
+
+    args = parser.parse_args()
+
+    if args.command == "count":
+        for heading_str in args.heading_strs:
+            counter = count_shuffles(
+                args.base_dir, heading_str, args.metric, delete=args.delete
+            )
+            print(heading_str, len(counter.shuffles))
+    else:
+        counter = RankCounter.load(args.counter_paths[0])
+        for counter_path in args.counter_paths[1:]:
+            counter.merge(RankCounter.load(counter_path))
+        counter.save(args.out_path)
@@ -1,18 +1,99 @@
 """This script runs a user-selected metric on a citation graph and saves the result"""
 
 import argparse
+import json
 import os
 import pickle
+import sys
 
 import networkx as nx
 
 import algos
+from lazy import lazy_import
+from profiling import add_profiling_args, configure_profiling, profile_phase
+from shuffle_graph import graph_base_name, load_graph
+
+# These need numpy, which most runs of the script don't
+betweenness = lazy_import("betweenness")
+metric_store = lazy_import("metric_store")
+pagerank = lazy_import("pagerank")
+rank_counter = lazy_import("rank_counter")
+shuffle_store = lazy_import("shuffle_store")
+
+
+def write_telemetry(path: str, file: str, telemetry: dict):
+    with open(path, "w") as out_file:
+        json.dump({"file": file, **telemetry}, out_file, indent=2)
+
+
+def get_telemetry_path(out_dir: str, in_file_base: str, metric: str) -> str:
+    return os.path.join(out_dir, f"{in_file_base}-{metric}.telemetry.json")
+
+
+def add_pagerank_args(parser: argparse.ArgumentParser):
+    """Add the PageRank options, which graph_server.py's submit command shares"""
+    parser.add_argument(
+        "--by_component",
+        help="Calculate PageRank separately for each weakly connected component, "
+        "which gives the same results but lets large components run in parallel",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--alpha", help="PageRank's damping factor", type=float, default=0.85
+    )
+    parser.add_argument(
+        "--tol",
+        help="PageRank's convergence tolerance, as in nx.pagerank",
+        type=float,
+        default=1.0e-6,
+    )
+    parser.add_argument(
+        "--max_iter",
+        help="The maximum number of PageRank's power iterations",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--fallback_max_iter",
+        help="The maximum number of iterations for the fallback solver (restart "
+        "cycles for GMRES)",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--fallback",
+        help="The solver to use when PageRank's power iteration doesn't converge. "
+        "With none, the script stops with an error instead. Graphs the fallback "
+        "doesn't converge on either are skipped, and their telemetry is written",
+        choices=["gmres", "bicgstab", "none"],
+        default="gmres",
+    )
+    parser.add_argument(
+        "--telemetry",
+        help="Write PageRank's iteration counts, residuals, and wall time for each "
+        "graph to a .telemetry.json file next to its results",
+        action="store_true",
+    )
+
+
+def get_pagerank_options(args: argparse.Namespace) -> dict:
+    """Get the arguments for `pagerank.pagerank_with_telemetry` from the options"""
+    return {
+        "alpha": args.alpha,
+        "max_iter": args.max_iter,
+        "tol": args.tol,
+        "fallback": None if args.fallback == "none" else args.fallback,
+        "fallback_max_iter": args.fallback_max_iter,
+        "by_component": args.by_component,
+    }
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "graph_files",
-        help="The files containing the pickled graphs for a MeSH heading",
+        help="The files containing the pickled graphs for a MeSH heading, or virtual "
+        "shuffles from shuffle_graph.py --virtual",
         nargs="+",
     )
     parser.add_argument(
@@ -25,38 +106,172 @@ if __name__ == "__main__":
     parser.add_argument(
         "--out_dir", help="The dictory to store the results to", default="output/"
     )
+    parser.add_argument(
+        "--betweenness_k",
+        help="The number of pivots to sample when calculating betweenness centrality",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--epsilon",
+        help="If set, add betweenness pivots until every node is within epsilon "
+        "of its true value instead of using a fixed number of pivots",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--delta",
+        help="The probability of a node exceeding the epsilon error bound",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--workers",
+        help="The number of processes to split betweenness pivots, or PageRank's "
+        "components with --by_component, across",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--columnar",
+        help="Also write the results as sorted columns that metric_store.py can query "
+        "without loading them whole",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--shuffle_store",
+        help="Append the results for shuffled networks (named like heading1-heading2-3) "
+        "to their split heading's shuffle store in the output directory instead of "
+        "writing a pickle for each",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--rank_counter",
+        help="Count the results for shuffled networks (named like heading1-heading2-3) "
+        "in their split heading's rank counter in the output directory instead of "
+        "writing a pickle for each",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--true_results_dir",
+        help="The directory containing the true networks' results, which new rank "
+        "counters start from. Defaults to the parent of --out_dir",
+        default=None,
+    )
+    add_pagerank_args(parser)
+    add_profiling_args(parser)
     args = parser.parse_args()
+    configure_profiling(args)
 
+    true_results_dir = args.true_results_dir
+    if true_results_dir is None:
+        true_results_dir = os.path.dirname(os.path.normpath(args.out_dir))
+
+    failed_files = []
     for file in args.graph_files:
         # Build path to save the results to
-        in_file_name = os.path.basename(file)
-        in_file_base = os.path.splitext(in_file_name)[0]
+        in_file_base = graph_base_name(file)
         file_description = f"-{args.metric}.pkl"
         out_file_path = os.path.join(args.out_dir, in_file_base + file_description)
+        telemetry_path = get_telemetry_path(args.out_dir, in_file_base, args.metric)
 
         if os.path.exists(out_file_path):
             continue
 
-        # Load graph
-        with open(file, "rb") as in_file:
-            graph = pickle.load(in_file)
+        store, counter_path, shuffle = None, None, None
+        if args.shuffle_store or args.rank_counter:
+            split_heading, shuffle = shuffle_store.parse_shuffle_name(in_file_base)
+        if args.shuffle_store:
+            store = shuffle_store.ShuffleStore(
+                os.path.join(
+                    args.out_dir,
+                    f"{split_heading}-{args.metric}{shuffle_store.STORE_SUFFIX}",
+                )
+            )
+        if args.rank_counter:
+            counter_path = os.path.join(
+                args.out_dir,
+                f"{split_heading}-{args.metric}{rank_counter.COUNTER_SUFFIX}",
+            )
+        if store is not None or counter_path is not None:
+            # Skip shuffles that are already everywhere they're meant to go
+            in_store = store is None or shuffle in store
+            in_counter = counter_path is None or (
+                os.path.exists(counter_path)
+                and shuffle in rank_counter.RankCounter.load(counter_path).shuffles
+            )
+            if in_store and in_counter:
+                continue
 
-        # Remove self-loops
-        graph.remove_edges_from(nx.selfloop_edges(graph))
+        # Load graph, regenerating it if it's a virtual shuffle
+        with profile_phase("load", file=file):
+            graph = load_graph(file)
 
-        # Run metric on graph
-        if args.metric == "betweenness_centrality":
-            node_to_metric = nx.betweenness_centrality(graph, k=100)
-        elif args.metric == "pagerank":
-            node_to_metric = nx.pagerank(graph)
-        elif args.metric == "disruption_idx":
-            node_to_metric = algos.all_nodes_disruption_index(graph)
+        with profile_phase("compute", file=file, metric=args.metric):
+            # Remove self-loops
+            graph.remove_edges_from(nx.selfloop_edges(graph))
 
-        # Build path to save the results to
-        in_file_name = os.path.basename(file)
-        in_file_base = os.path.splitext(in_file_name)[0]
-        file_description = f"-{args.metric}.pkl"
-        out_file_path = os.path.join(args.out_dir, in_file_base + file_description)
+            # Run metric on graph
+            if args.metric == "betweenness_centrality":
+                if args.epsilon is not None:
+                    node_to_metric = betweenness.adaptive_betweenness_centrality(
+                        graph, args.epsilon, args.delta, workers=args.workers
+                    )
+                else:
+                    node_to_metric = betweenness.betweenness_centrality(
+                        graph, k=args.betweenness_k, workers=args.workers
+                    )
+            elif args.metric == "pagerank":
+                component_kwargs = (
+                    {"workers": args.workers} if args.by_component else {}
+                )
+                try:
+                    node_to_metric, telemetry = pagerank.pagerank_with_telemetry(
+                        graph, **get_pagerank_options(args), **component_kwargs
+                    )
+                except pagerank.FallbackFailedConvergence as error:
+                    # Keep the record of what went wrong even without --telemetry,
+                    # but don't write scores that didn't converge
+                    print(f"{file}: {error}, skipping it", file=sys.stderr)
+                    write_telemetry(telemetry_path, file, error.telemetry)
+                    failed_files.append(file)
+                    continue
+                if telemetry["fallback"] is not None:
+                    print(
+                        f"{file}: power iteration didn't converge, solved with "
+                        f"{telemetry['fallback']}",
+                        file=sys.stderr,
+                    )
+            elif args.metric == "disruption_idx":
+                node_to_metric = algos.all_nodes_disruption_index(graph)
+
+        with profile_phase("save", file=file):
+            if args.telemetry and args.metric == "pagerank":
+                write_telemetry(telemetry_path, file, telemetry)
+            if store is not None:
+                store.append(shuffle, node_to_metric)
+            if counter_path is not None:
+                rank_counter.add_shuffle(
+                    counter_path,
+                    os.path.join(
+                        true_results_dir, f"{split_heading}-{args.metric}.pkl"
+                    ),
+                    shuffle,
+                    node_to_metric,
+                )
+            if store is not None or counter_path is not None:
+                continue
+            with open(out_file_path, "wb") as out_file:
+                pickle.dump(node_to_metric, out_file)
+            if args.columnar:
+                metric_store.write_columnar(
+                    metric_store.get_columnar_path(out_file_path), node_to_metric
+                )
 
-        with open(out_file_path, "wb") as out_file:
-            pickle.dump(node_to_metric, out_file)
+    if len(failed_files) > 0:
+        print(
+            f"PageRank didn't converge on {len(failed_files)} graphs: "
+            + " ".join(failed_files),
+            file=sys.stderr,
+        )
+        sys.exit(1)
@@ -0,0 +1,207 @@
+"""
+A single SQLite file holding the percentile and journal dataframes used by the web app
+
+The store has a catalog of headings and pairs plus one table per pair for each kind of
+dataframe. The percentile tables are indexed by doi and journal, so the app can pull
+individual papers or journals without reading a whole pair. The file is opened
+read-only, so any number of app worker processes can share it.
+"""
+from __future__ import annotations
+
+import glob
+import os
+import pickle as pkl
+import sqlite3
+from typing import Dict, List, Tuple, Union
+
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+STORE_NAME = "serving.sqlite"
+
+# Connections are reused within a process, but never across a fork. Each is stored with
+# the inode and modification time of the file it opened, since a rebuilt store replaces
+# the file and an open connection would keep reading the old one
+_CONNECTIONS: Dict[Tuple[str, int], Tuple[Tuple[int, int], sqlite3.Connection]] = {}
+
+
+def get_store_path(base_dir: str = "viz_dataframes") -> str:
+    return os.path.join(base_dir, STORE_NAME)
+
+
+def _table_name(kind: str, heading1: str, heading2: str) -> str:
+    return f"{kind}__{heading1}__{heading2}"
+
+
+def build_store(base_dir: str = "viz_dataframes", store_path: str = None):
+    """
+    Write every pair's percentile and journal dataframes into a single SQLite file
+
+    Arguments
+    ---------
+    base_dir: The directory containing the percentiles/ and journals/ directories
+    store_path: Where to write the store, defaults to serving.sqlite in `base_dir`
+    """
+    if store_path is None:
+        store_path = get_store_path(base_dir)
+
+    # Build into a temporary file so running apps never see a half-written store
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+
+    connection.execute(
+        "CREATE TABLE pairs (heading1 TEXT, heading2 TEXT, has_journals INTEGER, "
+        "PRIMARY KEY (heading1, heading2))"
+    )
+
+    headings = set()
+    for path in sorted(glob.glob(f"{base_dir}/percentiles/*.pkl")):
+        file_base = os.path.splitext(os.path.basename(path))[0]
+        heading1, heading2 = file_base.split("-")
+        headings.update([heading1, heading2])
+
+        with open(path, "rb") as in_file:
+            percentile_df = pkl.load(in_file)
+        table = _table_name("percentiles", heading1, heading2)
+        percentile_df.to_sql(table, connection, index=False)
+        connection.execute(f'CREATE INDEX "{table}__doi" ON "{table}" (doi)')
+        if "journal" in percentile_df.columns:
+            connection.execute(
+                f'CREATE INDEX "{table}__journal" ON "{table}" (journal)'
+            )
+
+        journal_path = f"{base_dir}/journals/{file_base}.pkl"
+        has_journals = os.path.exists(journal_path)
+        if has_journals:
+            with open(journal_path, "rb") as in_file:
+                journal_df = pkl.load(in_file)
+            table = _table_name("journals", heading1, heading2)
+            journal_df.to_sql(table, connection, index=True)
+
+        connection.execute(
+            "INSERT INTO pairs VALUES (?, ?, ?)", (heading1, heading2, has_journals)
+        )
+
+    connection.execute("CREATE TABLE headings (heading TEXT PRIMARY KEY)")
+    connection.executemany(
+        "INSERT INTO headings VALUES (?)", [(heading,) for heading in sorted(headings)]
+    )
+    connection.execute("CREATE INDEX pairs__heading2 ON pairs (heading2)")
+    connection.commit()
+    connection.close()
+
+    os.replace(tmp_path, store_path)
+
+
+def get_connection(store_path: str) -> sqlite3.Connection:
+    """
+    Get a read-only connection to the store, reusing one from this process as long as
+    the store hasn't been rebuilt since it was opened
+    """
+    key = (os.path.abspath(store_path), os.getpid())
+    stat = os.stat(key[0])
+    fingerprint = (stat.st_ino, stat.st_mtime_ns)
+
+    if key in _CONNECTIONS:
+        connection_fingerprint, connection = _CONNECTIONS[key]
+        if connection_fingerprint == fingerprint:
+            return connection
+        connection.close()
+
+    connection = sqlite3.connect(
+        f"file:{key[0]}?mode=ro", uri=True, check_same_thread=False
+    )
+    _CONNECTIONS[key] = (fingerprint, connection)
+    return connection
+
+
+def query_heading_names(store_path: str) -> List[str]:
+    """Get the names of all headings in the store"""
+    rows = get_connection(store_path).execute("SELECT heading FROM headings")
+    return [row[0] for row in rows]
+
+
+def query_pair_names(store_path: str, heading: str) -> List[str]:
+    """Get the names of all headings that have been compared against `heading`"""
+    rows = get_connection(store_path).execute(
+        "SELECT heading2 FROM pairs WHERE heading1 = ? "
+        "UNION SELECT heading1 FROM pairs WHERE heading2 = ?",
+        (heading, heading),
+    )
+    return [row[0] for row in rows]
+
+
+def find_pair(
+    store_path: str, heading1: str, heading2: str
+) -> Union[Tuple[str, str, bool], None]:
+    """Find the order a pair was stored in, and whether it has journal data"""
+    row = (
+        get_connection(store_path)
+        .execute(
+            "SELECT heading1, heading2, has_journals FROM pairs "
+            "WHERE (heading1 = ? AND heading2 = ?) OR (heading1 = ? AND heading2 = ?)",
+            (heading1, heading2, heading2, heading1),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    return row[0], row[1], bool(row[2])
+
+
+def query_percentile_data(
+    store_path: str,
+    heading1: str,
+    heading2: str,
+    dois: Union[List[str], None] = None,
+    journal: Union[str, None] = None,
+) -> pd.DataFrame:
+    """
+    Load a pair's percentile dataframe, optionally only for some papers or one journal
+
+    Arguments
+    ---------
+    store_path: The path to the store
+    heading1: One of the headings in the pair
+    heading2: The other heading in the pair
+    dois: If set, only return these papers
+    journal: If set, only return papers from this journal
+
+    Returns
+    -------
+    result_df: The requested rows of the pair's percentile dataframe
+    """
+    pair = find_pair(store_path, heading1, heading2)
+    if pair is None:
+        raise FileNotFoundError(f"{heading1}-{heading2} is not in {store_path}")
+    table = _table_name("percentiles", pair[0], pair[1])
+
+    query = f'SELECT * FROM "{table}"'
+    conditions, params = [], []
+    if dois is not None:
+        conditions.append(f"doi IN ({','.join('?' * len(dois))})")
+        params.extend(dois)
+    if journal is not None:
+        conditions.append("journal = ?")
+        params.append(journal)
+    if len(conditions) > 0:
+        query += " WHERE " + " AND ".join(conditions)
+
+    return pd.read_sql_query(query, get_connection(store_path), params=params)
+
+
+def query_journal_data(store_path: str, heading1: str, heading2: str) -> pd.DataFrame:
+    """Load a pair's journal-level dataframe"""
+    pair = find_pair(store_path, heading1, heading2)
+    if pair is None or not pair[2]:
+        raise FileNotFoundError(f"{heading1}-{heading2} is not in {store_path}")
+    table = _table_name("journals", pair[0], pair[1])
+
+    result_df = pd.read_sql_query(
+        f'SELECT * FROM "{table}"', get_connection(store_path)
+    )
+    # The first column is the journal index written by build_store
+    return result_df.set_index(result_df.columns[0])
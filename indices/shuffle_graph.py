@@ -1,11 +1,196 @@
+"""
+Generate degree-preserving shuffles of networks
+
+Shuffles are either written as pickled graphs, or with --virtual as small specs that
+record the source network's hash, the seed, and the swap parameters. A virtual shuffle
+is regenerated whenever it's loaded with `load_graph`, which gives the same graph as the
+pickled shuffle would have, and splitting one with split_pairwise_network.py just writes
+another spec. That way the shuffled networks never have to be stored.
+
+The last shuffle regenerated is kept, so loading every heading's split of the same
+shuffle (one per heading in a group network) only does the edge swaps once.
+"""
 import argparse
+import functools
+import hashlib
+import json
 import pickle
 import os
 from copy import deepcopy
+from typing import Tuple
 
 import networkx as nx
 from tqdm import tqdm
 
+from profiling import add_profiling_args, configure_profiling, profile_phase
+
+
+VIRTUAL_SUFFIX = ".shuffle.json"
+
+
+def get_swap_params(graph: nx.DiGraph) -> Tuple[int, int]:
+    """Get the number of swaps and the maximum number of tries to shuffle a graph with"""
+    n_edges = len(graph.edges)
+    # Directed edge swap swaps three edges at a time
+    return n_edges * 2, 100 * n_edges
+
+
+def shuffle_graph(
+    graph: nx.DiGraph, seed: int, nswap: int = None, max_tries: int = None
+) -> nx.DiGraph:
+    """
+    Create a shuffled copy of a graph that preserves each node's in and out degree
+
+    Arguments
+    ---------
+    graph: The graph to shuffle
+    seed: The random seed to use for the edge swaps
+    nswap: The number of swaps to do, defaults to `get_swap_params`
+    max_tries: The number of swaps to attempt, defaults to `get_swap_params`
+
+    Returns
+    -------
+    shuffled_graph: The shuffled copy of `graph`
+    """
+    graph_copy = deepcopy(graph)
+    default_nswap, default_max_tries = get_swap_params(graph)
+    if nswap is None:
+        nswap = default_nswap
+    if max_tries is None:
+        max_tries = default_max_tries
+
+    shuffled_graph = nx.directed_edge_swap(
+        graph_copy, nswap=nswap, max_tries=max_tries, seed=seed
+    )
+    return shuffled_graph
+
+
+def graph_hash(graph: nx.DiGraph) -> str:
+    """
+    Hash a graph's nodes and edges in order
+
+    The order matters because the edge swaps depend on it, so two graphs only have the
+    same hash if shuffling them with the same seed gives the same result
+    """
+    digest = hashlib.sha256()
+    digest.update("\n".join(repr(node) for node in graph.nodes).encode())
+    digest.update(b"\0")
+    digest.update("\n".join(f"{u!r}\t{v!r}" for u, v in graph.edges).encode())
+    return digest.hexdigest()
+
+
+def graph_base_name(path: str) -> str:
+    """Get a graph file's name without its extension, for pickled or virtual graphs"""
+    file_name = os.path.basename(path)
+    if file_name.endswith(VIRTUAL_SUFFIX):
+        return file_name[: -len(VIRTUAL_SUFFIX)]
+    return os.path.splitext(file_name)[0]
+
+
+def write_virtual_shuffle(
+    out_path: str, source_path: str, seed: int, subgraph_path: str = None, **params
+):
+    """
+    Write the spec of a virtual shuffle
+
+    Arguments
+    ---------
+    out_path: Where to write the spec, which should end with VIRTUAL_SUFFIX
+    source_path: The pickled network to shuffle
+    seed: The random seed used for the edge swaps
+    subgraph_path: A network whose nodes the shuffled network is restricted to, as
+                   split_pairwise_network.py does for each heading
+    params: The source's "source_hash", "nswap", and "max_tries"
+    """
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    spec = {
+        # Paths are stored relative to the spec so the directories can be moved
+        "source": os.path.relpath(os.path.abspath(source_path), out_dir),
+        "source_hash": params["source_hash"],
+        "seed": seed,
+        "nswap": params["nswap"],
+        "max_tries": params["max_tries"],
+    }
+    if subgraph_path is not None:
+        spec["subgraph"] = os.path.relpath(os.path.abspath(subgraph_path), out_dir)
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as out_file:
+        json.dump(spec, out_file, indent=2)
+    os.replace(tmp_path, out_path)
+
+
+def load_virtual_spec(path: str) -> dict:
+    """Load a virtual shuffle's spec, resolving its paths"""
+    with open(path) as in_file:
+        spec = json.load(in_file)
+    spec_dir = os.path.dirname(os.path.abspath(path))
+    for key in ["source", "subgraph"]:
+        if key in spec:
+            spec[key] = os.path.normpath(os.path.join(spec_dir, spec[key]))
+    return spec
+
+
+# Every shuffle of a network regenerates from the same source, so keep the last one.
+# The source's modification time and size are part of the key so a long-running process
+# like graph_server.py notices when it's rewritten
+@functools.lru_cache(maxsize=1)
+def _load_source_version(path: str, mtime_ns: int, size: int) -> Tuple[nx.DiGraph, str]:
+    with open(path, "rb") as in_file:
+        graph = pickle.load(in_file)
+    return graph, graph_hash(graph)
+
+
+def _load_source(path: str) -> Tuple[nx.DiGraph, str]:
+    stat = os.stat(path)
+    return _load_source_version(path, stat.st_mtime_ns, stat.st_size)
+
+
+# The (source hash, seed, nswap, max_tries) and result of the last shuffle regenerated
+_last_shuffle = (None, None)
+
+
+def _regenerate_shuffle(source: nx.DiGraph, source_hash: str, spec: dict) -> nx.DiGraph:
+    """Shuffle a source network as a spec describes, reusing the last shuffle if possible"""
+    global _last_shuffle
+    key = (source_hash, spec["seed"], spec["nswap"], spec["max_tries"])
+    # Read the pair once, since graph_server.py can load graphs on several threads
+    last_key, shuffled_graph = _last_shuffle
+    if last_key != key:
+        shuffled_graph = shuffle_graph(
+            source, spec["seed"], nswap=spec["nswap"], max_tries=spec["max_tries"]
+        )
+        _last_shuffle = (key, shuffled_graph)
+    return shuffled_graph
+
+
+def load_graph(path: str) -> nx.DiGraph:
+    """
+    Load a pickled graph, or regenerate a virtual shuffle
+
+    Raises
+    ------
+    ValueError: If a virtual shuffle's source network has changed since it was written
+    """
+    if not path.endswith(VIRTUAL_SUFFIX):
+        with open(path, "rb") as in_file:
+            return pickle.load(in_file)
+
+    spec = load_virtual_spec(path)
+    source, source_hash = _load_source(spec["source"])
+    if source_hash != spec["source_hash"]:
+        raise ValueError(f"{spec['source']} has changed since {path} was written")
+
+    shuffled_graph = _regenerate_shuffle(source, source_hash, spec)
+    # Callers can modify the graph they get, so never hand out the kept shuffle itself
+    if "subgraph" not in spec:
+        return shuffled_graph.copy()
+    with open(spec["subgraph"], "rb") as in_file:
+        nodes = pickle.load(in_file).nodes
+    shuffled_graph = shuffled_graph.subgraph(nodes).copy()
+    shuffled_graph.remove_nodes_from(list(nx.isolates(shuffled_graph)))
+    return shuffled_graph
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -18,33 +203,53 @@ if __name__ == "__main__":
         default="data/shuffled_combined_networks",
     )
     parser.add_argument(
-        "--n_graphs", help="The number of shuffled graphs to create", default=100
+        "--n_graphs",
+        help="The number of shuffled graphs to create",
+        default=100,
+        type=int,
+    )
+    parser.add_argument(
+        "--virtual",
+        help="Write the seed and swap parameters of each shuffle instead of the "
+        "shuffled graph",
+        action="store_true",
     )
+    add_profiling_args(parser)
     args = parser.parse_args()
+    configure_profiling(args)
 
     graph_path = args.graph_paths
     for graph_path in args.graph_paths:
         file_base = os.path.basename(graph_path)
         file_base = os.path.splitext(file_base)[0]
 
-        with open(graph_path, "rb") as in_file:
-            original_network = pickle.load(in_file)
+        with profile_phase("load", file=graph_path):
+            with open(graph_path, "rb") as in_file:
+                original_network = pickle.load(in_file)
+
+        if args.virtual:
+            nswap, max_tries = get_swap_params(original_network)
+            params = {
+                "source_hash": graph_hash(original_network),
+                "nswap": nswap,
+                "max_tries": max_tries,
+            }
 
-        n_edges = len(original_network.edges)
         for i in tqdm(range(args.n_graphs)):
-            out_file_name = f"{file_base}-{i}.pkl"
+            extension = VIRTUAL_SUFFIX if args.virtual else ".pkl"
+            out_file_name = f"{file_base}-{i}{extension}"
             out_file_path = os.path.join(args.out_dir, out_file_name)
             # Skip creating files that already exist
             if os.path.exists(out_file_path):
                 continue
 
-            graph_copy = deepcopy(original_network)
-            # Directed edge swap swaps three edges at a time
-            n_swap = n_edges * 2
+            if args.virtual:
+                write_virtual_shuffle(out_file_path, graph_path, 42 * i, **params)
+                continue
 
-            shuffled_graph = nx.directed_edge_swap(
-                graph_copy, nswap=n_swap, max_tries=100 * n_edges, seed=42 * i
-            )
+            with profile_phase("compute", file=graph_path, shuffle=i):
+                shuffled_graph = shuffle_graph(original_network, seed=42 * i)
 
-            with open(out_file_path, "wb") as out_path:
-                pickle.dump(shuffled_graph, out_path)
+            with profile_phase("save", file=graph_path, shuffle=i):
+                with open(out_file_path, "wb") as out_path:
+                    pickle.dump(shuffled_graph, out_path)
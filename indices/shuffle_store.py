@@ -0,0 +1,267 @@
+"""
+Pack the metric results from every shuffle of a split heading into one store
+
+The pipeline writes a tiny {doi: value} pickle for each shuffle of each split heading,
+which adds up to hundreds of thousands of files. A store keeps them all in a directory
+with four files instead: the DOIs in the order they were first seen, a float32 matrix
+of values with one column per shuffle, the shuffle numbers of the columns, and a lock.
+
+Shuffles are appended one column at a time. Each column has a row for every DOI known
+when it was written, so later shuffles that add DOIs don't have to rewrite earlier
+columns, and rows past a column's end are read as missing (NaN).
+
+    python indices/shuffle_store.py output/shuffle_results --delete
+"""
+from __future__ import annotations
+
+import argparse
+import fcntl
+import glob
+import json
+import os
+import pickle as pkl
+import re
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+STORE_SUFFIX = ".shuffles"
+SHUFFLE_RESULT_REGEX = re.compile(r"^(?P<split_heading>.+)-(?P<shuffle>[0-9]+)$")
+
+
+def get_store_path(base_dir: str, heading_str: str, metric: str = "pagerank") -> str:
+    """Get the store holding the shuffle results for a split heading like a-b"""
+    return os.path.join(
+        base_dir, "shuffle_results", f"{heading_str}-{metric}{STORE_SUFFIX}"
+    )
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive lock on a file while the block runs"""
+    # Shuffles of the same split heading often finish at the same time on a cluster
+    with open(path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def parse_shuffle_name(name: str) -> Tuple[str, int]:
+    """Split a shuffled network's name, like a-b-12, into its split heading and shuffle"""
+    match = SHUFFLE_RESULT_REGEX.match(name)
+    if match is None:
+        raise ValueError(f"{name} isn't the name of a shuffled network")
+    return match.group("split_heading"), int(match.group("shuffle"))
+
+
+class ShuffleStore:
+    """
+    The shuffle results of a single split heading
+
+    Arguments
+    ---------
+    path: The store's directory, which is created if it doesn't exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _lock(self):
+        return file_lock(self._file("lock"))
+
+    def read_index(self) -> dict:
+        """
+        Read the index, which is only updated once a column has been fully written
+
+        Returns
+        -------
+        index: A dict with the number of DOIs ("n_dois"), the length of the DOI file
+               they take up ("dois_bytes"), and a list of "columns", each with a
+               "shuffle" number and the "offset" and "length" of its values
+        """
+        index_path = self._file("index.json")
+        if not os.path.exists(index_path):
+            return {"n_dois": 0, "dois_bytes": 0, "columns": []}
+        with open(index_path) as in_file:
+            return json.load(in_file)
+
+    def shuffles(self) -> List[int]:
+        return [column["shuffle"] for column in self.read_index()["columns"]]
+
+    def __contains__(self, shuffle: int) -> bool:
+        return shuffle in self.shuffles()
+
+    def _read_dois(self, index: dict) -> List[str]:
+        dois_path = self._file("dois.txt")
+        if index["n_dois"] == 0:
+            return []
+        with open(dois_path, "rb") as in_file:
+            # Anything past the indexed length is left over from an interrupted append
+            data = in_file.read(index["dois_bytes"])
+        return data.decode().split("\n")[: index["n_dois"]]
+
+    def append(self, shuffle: int, node_to_metric: Dict[str, float]) -> bool:
+        """
+        Add a shuffle's results as a new column
+
+        Arguments
+        ---------
+        shuffle: The shuffle's number
+        node_to_metric: The shuffle's {doi: value} results. None values are stored
+                        as missing
+
+        Returns
+        -------
+        added: False if the shuffle was already in the store
+        """
+        with self._lock():
+            index = self.read_index()
+            if any(entry["shuffle"] == shuffle for entry in index["columns"]):
+                return False
+
+            dois = self._read_dois(index)
+            doi_to_row = {doi: row for row, doi in enumerate(dois)}
+            new_dois = [doi for doi in node_to_metric if doi not in doi_to_row]
+            for doi in new_dois:
+                doi_to_row[doi] = len(doi_to_row)
+
+            column = np.full(len(doi_to_row), np.nan, dtype=np.float32)
+            for doi, value in node_to_metric.items():
+                if value is not None:
+                    column[doi_to_row[doi]] = value
+
+            offset = sum(entry["length"] for entry in index["columns"])
+            values_path = self._file("values.f32")
+            with open(values_path, "r+b" if os.path.exists(values_path) else "wb") as f:
+                f.seek(offset * 4)
+                f.write(column.tobytes())
+                f.truncate()
+
+            dois_bytes = index["dois_bytes"]
+            if len(new_dois) > 0:
+                # DOIs are newline separated, so every DOI after the first starts with one
+                prefix = "\n" if index["n_dois"] > 0 else ""
+                new_data = (prefix + "\n".join(str(doi) for doi in new_dois)).encode()
+                dois_path = self._file("dois.txt")
+                with open(dois_path, "r+b" if os.path.exists(dois_path) else "wb") as f:
+                    f.seek(dois_bytes)
+                    f.write(new_data)
+                    f.truncate()
+                dois_bytes += len(new_data)
+
+            index = {
+                "n_dois": len(doi_to_row),
+                "dois_bytes": dois_bytes,
+                "columns": index["columns"]
+                + [{"shuffle": shuffle, "offset": offset, "length": len(column)}],
+            }
+            tmp_path = f"{self._file('index.json')}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as out_file:
+                json.dump(index, out_file)
+            os.replace(tmp_path, self._file("index.json"))
+        return True
+
+    def load(self) -> Tuple[List[str], np.ndarray, List[int]]:
+        """
+        Read the whole store
+
+        Returns
+        -------
+        dois: The DOI of each row
+        matrix: A (DOIs x shuffles) float32 matrix, with NaN where a DOI wasn't in a
+                shuffle's results
+        shuffles: The shuffle number of each column
+        """
+        index = self.read_index()
+        dois = self._read_dois(index)
+        columns = index["columns"]
+        matrix = np.full((len(dois), len(columns)), np.nan, dtype=np.float32)
+        if len(columns) > 0:
+            n_values = sum(column["length"] for column in columns)
+            values = np.fromfile(self._file("values.f32"), np.float32, count=n_values)
+            for j, column in enumerate(columns):
+                start = column["offset"]
+                matrix[: column["length"], j] = values[start : start + column["length"]]
+        return dois, matrix, [column["shuffle"] for column in columns]
+
+
+def find_result_files(results_dir: str, metric: str = "pagerank") -> Dict[str, Dict]:
+    """
+    Group the pickled shuffle results in a directory by split heading
+
+    Returns
+    -------
+    heading_to_files: A mapping between each split heading and a {shuffle: path} dict
+    """
+    heading_to_files = {}
+    suffix = f"-{metric}.pkl"
+    for path in glob.glob(os.path.join(results_dir, f"*{suffix}")):
+        name = os.path.basename(path)[: -len(suffix)]
+        try:
+            split_heading, shuffle = parse_shuffle_name(name)
+        except ValueError:
+            continue
+        heading_to_files.setdefault(split_heading, {})[shuffle] = path
+    return heading_to_files
+
+
+def compact(
+    results_dir: str, metric: str = "pagerank", delete: bool = False
+) -> Iterator[Tuple[str, int]]:
+    """
+    Move pickled shuffle results into stores, one per split heading
+
+    Arguments
+    ---------
+    results_dir: The directory containing the results, usually output/shuffle_results
+    metric: The metric the results are for
+    delete: Whether to delete each pickle once it's in a store
+
+    Yields
+    ------
+    split_heading: A split heading whose store was updated
+    n_added: The number of shuffles added to its store
+    """
+    heading_to_files = find_result_files(results_dir, metric)
+    for split_heading, shuffle_to_path in sorted(heading_to_files.items()):
+        store = ShuffleStore(
+            os.path.join(results_dir, f"{split_heading}-{metric}{STORE_SUFFIX}")
+        )
+        n_added = 0
+        for shuffle, path in sorted(shuffle_to_path.items()):
+            if shuffle not in store:
+                with open(path, "rb") as in_file:
+                    n_added += store.append(shuffle, pkl.load(in_file))
+            if delete:
+                os.remove(path)
+        yield split_heading, n_added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "results_dir",
+        help="The directory containing pickled shuffle results",
+        default="output/shuffle_results",
+    )
+    parser.add_argument(
+        "--metric", help="The metric the results are for", default="pagerank"
+    )
+    parser.add_argument(
+        "--delete",
+        help="Delete the pickled results once they've been added to a store",
+        action="store_true",
+    )
+    args = parser.parse_args()
+
+    for split_heading, n_added in compact(args.results_dir, args.metric, args.delete):
+        print(split_heading, n_added)
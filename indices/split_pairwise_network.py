@@ -1,10 +1,94 @@
+"""
+Split pairwise networks, or networks built for a group of headings, into the subgraphs
+induced by each heading's papers
+
+A network named heading1+heading2 is split into heading1-heading2 and heading2-heading1,
+and a group network named a+b+c into a-b+c, b-a+c, and c-a+b. Shuffled networks keep
+their shuffle number at the end of each name. Virtual shuffles from shuffle_graph.py
+are split by writing a virtual shuffle for each heading, without regenerating them.
+"""
 import argparse
 import os
 import pickle as pkl
 import re
+from typing import Dict, Iterable, Tuple
 
 import networkx as nx
 
+from shuffle_graph import (
+    VIRTUAL_SUFFIX,
+    graph_base_name,
+    load_virtual_spec,
+    write_virtual_shuffle,
+)
+
+
+def split_network(
+    pairwise_network: nx.DiGraph,
+    heading1_nodes: Iterable[str],
+    heading2_nodes: Iterable[str],
+) -> Tuple[nx.DiGraph, nx.DiGraph]:
+    """
+    Split a pairwise network into the subgraphs induced by each heading's papers
+
+    Arguments
+    ---------
+    pairwise_network: The (possibly shuffled) network built from both headings
+    heading1_nodes: The papers belonging to the first heading
+    heading2_nodes: The papers belonging to the second heading
+
+    Returns
+    -------
+    heading1_network: The subgraph of `pairwise_network` for the first heading
+    heading2_network: The subgraph of `pairwise_network` for the second heading
+    """
+    heading1_network = pairwise_network.subgraph(heading1_nodes).copy()
+    heading2_network = pairwise_network.subgraph(heading2_nodes).copy()
+
+    # Remove nodes with no edges (i.e. citations)
+    heading1_network.remove_nodes_from(list(nx.isolates(heading1_network)))
+    heading2_network.remove_nodes_from(list(nx.isolates(heading2_network)))
+
+    return heading1_network, heading2_network
+
+
+def split_group_network(
+    group_network: nx.DiGraph, heading_to_nodes: Dict[str, Iterable[str]]
+) -> Dict[str, nx.DiGraph]:
+    """
+    Split a network built from any number of headings into each heading's subgraph
+
+    Arguments
+    ---------
+    group_network: The (possibly shuffled) network built from all of the headings
+    heading_to_nodes: The papers belonging to each heading
+
+    Returns
+    -------
+    heading_to_network: The subgraph of `group_network` for each heading
+    """
+    heading_to_network = {}
+    for heading, nodes in heading_to_nodes.items():
+        network = group_network.subgraph(nodes).copy()
+        network.remove_nodes_from(list(nx.isolates(network)))
+        heading_to_network[heading] = network
+    return heading_to_network
+
+
+def get_split_names(file_noext: str) -> Dict[str, str]:
+    """Get the name of each heading's subgraph from a pairwise or group network's name"""
+    shuffle_suffix = ""
+    if re.search("-[0-9]+$", file_noext):
+        file_noext, shuffle_number = file_noext.split("-")
+        shuffle_suffix = f"-{shuffle_number}"
+
+    headings = file_noext.split("+")
+    heading_to_name = {}
+    for heading in headings:
+        others = "+".join(other for other in headings if other != heading)
+        heading_to_name[heading] = f"{heading}-{others}{shuffle_suffix}"
+    return heading_to_name
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -28,53 +112,52 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
+    heading_to_nodes = {}
     for file in args.in_files:
-        file_base = os.path.basename(file)
-        file_noext = os.path.splitext(file_base)[0]
-        shuffle_number = None
-
-        shuffle_regex = "-[0-9]+.pkl"
-        if re.search(shuffle_regex, file_base):
-            headings, shuffle_number = file_noext.split("-")
-            heading1, heading2 = headings.split("+")
-        else:
-            heading1, heading2 = file_noext.split("+")
-
-        if shuffle_number is None:
-            filename1 = f"{heading1}-{heading2}.pkl"
-            filename2 = f"{heading2}-{heading1}.pkl"
-        else:
-            filename1 = f"{heading1}-{heading2}-{shuffle_number}.pkl"
-            filename2 = f"{heading2}-{heading1}-{shuffle_number}.pkl"
-
-        file1_out = os.path.join(args.out_dir, filename1)
-        file2_out = os.path.join(args.out_dir, filename2)
-        if os.path.exists(file1_out) and os.path.exists(file2_out):
+        file_noext = graph_base_name(file)
+        heading_to_name = get_split_names(file_noext)
+
+        is_virtual = file.endswith(VIRTUAL_SUFFIX)
+        extension = VIRTUAL_SUFFIX if is_virtual else ".pkl"
+        heading_to_out = {
+            heading: os.path.join(args.out_dir, f"{name}{extension}")
+            for heading, name in heading_to_name.items()
+        }
+        if all(os.path.exists(path) for path in heading_to_out.values()):
             continue
 
-        heading1_network_file = os.path.join(
-            args.original_network_dir, f"{heading1}.pkl"
-        )
-        heading2_network_file = os.path.join(
-            args.original_network_dir, f"{heading2}.pkl"
-        )
+        if is_virtual:
+            spec = load_virtual_spec(file)
+            for heading, out_path in heading_to_out.items():
+                write_virtual_shuffle(
+                    out_path,
+                    spec["source"],
+                    spec["seed"],
+                    os.path.join(args.original_network_dir, f"{heading}.pkl"),
+                    source_hash=spec["source_hash"],
+                    nswap=spec["nswap"],
+                    max_tries=spec["max_tries"],
+                )
+            continue
 
-        with open(heading1_network_file, "rb") as in_file:
-            heading1_network = pkl.load(in_file)
-        with open(heading2_network_file, "rb") as in_file:
-            heading2_network = pkl.load(in_file)
+        # Shuffles of the same network are usually split together, so each heading's
+        # nodes are only loaded once
+        for heading in heading_to_name:
+            if heading not in heading_to_nodes:
+                heading_network_file = os.path.join(
+                    args.original_network_dir, f"{heading}.pkl"
+                )
+                with open(heading_network_file, "rb") as in_file:
+                    heading_to_nodes[heading] = list(pkl.load(in_file).nodes)
 
         with open(file, "rb") as file_handle:
-            pairwise_network = pkl.load(file_handle)
+            group_network = pkl.load(file_handle)
 
-        heading1_network = pairwise_network.subgraph(heading1_network.nodes).copy()
-        heading2_network = pairwise_network.subgraph(heading2_network.nodes).copy()
-
-        # Remove nodes with no edges (i.e. citations)
-        heading1_network.remove_nodes_from(list(nx.isolates(heading1_network)))
-        heading2_network.remove_nodes_from(list(nx.isolates(heading2_network)))
+        heading_to_network = split_group_network(
+            group_network,
+            {heading: heading_to_nodes[heading] for heading in heading_to_name},
+        )
 
-        with open(file1_out, "wb") as out_file:
-            pkl.dump(heading1_network, out_file)
-        with open(file2_out, "wb") as out_file:
-            pkl.dump(heading2_network, out_file)
+        for heading, network in heading_to_network.items():
+            with open(heading_to_out[heading], "wb") as out_file:
+                pkl.dump(network, out_file)
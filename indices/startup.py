@@ -0,0 +1,125 @@
+"""
+Measure how long each pipeline script takes to start, and check it against a budget
+
+Each script is run with --help in a fresh interpreter, which covers interpreter startup
+and the script's imports but none of its work. The budgets are in seconds and include
+the interpreter's own startup, which is usually 20-50ms.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# The scripts Snakemake and the cluster scripts launch, and their startup budgets.
+# The scripts that run once per network get the tightest budgets, since they're
+# launched thousands of times. Loading networkx (needed to unpickle the graphs) takes
+# most of their budget
+STARTUP_BUDGETS_S = {
+    "run_metric_on_graph.py": 0.6,
+    "split_pairwise_network.py": 0.6,
+    "shuffle_graph.py": 0.6,
+    "build_single_heading_networks.py": 0.3,
+    "build_pairwise_networks.py": 1.2,
+    "get_high_overlap_fields.py": 0.3,
+    "store_percentile_dataframes.py": 1.5,
+    "graph_server.py": 1.5,
+}
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_startup(script: str, repeats: int = 5) -> float:
+    """
+    Time starting a script with --help in a new interpreter
+
+    Returns
+    -------
+    startup_s: The fastest of the `repeats` runs, which is the least affected by
+               other activity on the machine
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, script), "--help"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def slowest_imports(script: str, n_imports: int = 5) -> List[Dict]:
+    """Find the imports that take the longest for a script with python -X importtime"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            os.path.join(SCRIPT_DIR, script),
+            "--help",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        cumulative_us, name = line.split("|")[1:]
+        # Nested imports are indented, and their times are included in their parents'
+        if name.startswith("  "):
+            continue
+        imports.append(
+            {"module": name.strip(), "cumulative_s": int(cumulative_us) / 1e6}
+        )
+    return sorted(imports, key=lambda item: -item["cumulative_s"])[:n_imports]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scripts",
+        help="The scripts to measure",
+        nargs="+",
+        choices=list(STARTUP_BUDGETS_S.keys()),
+        default=list(STARTUP_BUDGETS_S.keys()),
+    )
+    parser.add_argument(
+        "--repeats",
+        help="The number of times to start each script",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--out_file", help="A JSON file to write the measurements to", default=None
+    )
+    args = parser.parse_args()
+
+    results = []
+    for script in args.scripts:
+        startup_s = measure_startup(script, args.repeats)
+        results.append(
+            {
+                "script": script,
+                "startup_s": startup_s,
+                "budget_s": STARTUP_BUDGETS_S[script],
+                "within_budget": startup_s <= STARTUP_BUDGETS_S[script],
+                "slowest_imports": slowest_imports(script),
+            }
+        )
+        print(
+            f"{script}: {startup_s:.3f}s (budget {STARTUP_BUDGETS_S[script]:.1f}s)"
+            + ("" if results[-1]["within_budget"] else " OVER BUDGET")
+        )
+
+    if args.out_file is not None:
+        with open(args.out_file, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+
+    sys.exit(0 if all(result["within_budget"] for result in results) else 1)
@@ -0,0 +1,253 @@
+"""
+Generate synthetic citation data for benchmarking and testing the pipeline offline
+"""
+import lzma
+import os
+from typing import Dict, Iterable, Set, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+DEGREE_DISTRIBUTIONS = ["powerlaw", "poisson", "constant"]
+
+
+def synthetic_doi(idx: int) -> str:
+    """Build a fake (but DOI-shaped) identifier for the paper with the given index"""
+    return f"10.5555/synthetic.{idx}"
+
+
+def sample_out_degrees(
+    n_nodes: int, mean_degree: float, distribution: str, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Sample the number of references for each paper
+
+    Arguments
+    ---------
+    n_nodes: The number of papers
+    mean_degree: The average number of references per paper
+    distribution: One of "powerlaw", "poisson", or "constant"
+    rng: The random number generator to sample from
+
+    Returns
+    -------
+    out_degrees: An array containing the number of references for each paper
+    """
+    if distribution == "powerlaw":
+        # A pareto distribution with shape 2 has a mean of 2, so rescale it
+        degrees = (rng.pareto(2.0, n_nodes) + 1) * mean_degree / 2
+    elif distribution == "poisson":
+        degrees = rng.poisson(mean_degree, n_nodes)
+    elif distribution == "constant":
+        degrees = np.full(n_nodes, mean_degree)
+    else:
+        raise ValueError(f"Unknown degree distribution {distribution}")
+
+    return np.round(degrees).astype(np.int64)
+
+
+def make_citation_edges(
+    n_nodes: int,
+    mean_degree: float = 10,
+    distribution: str = "powerlaw",
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate the edges of a synthetic citation network
+
+    Papers are ordered by publication date and only cite papers published before them.
+    Each paper has a heavy-tailed "fitness", and the papers it cites are chosen in
+    proportion to their fitness, which gives the skewed in-degree distribution seen in
+    real citation data. Duplicate citations are dropped, so early papers (which have
+    few papers to cite) end up with fewer references than they were assigned.
+
+    Arguments
+    ---------
+    n_nodes: The number of papers in the network
+    mean_degree: The average number of references per paper
+    distribution: The distribution references per paper are drawn from
+    seed: The random seed used to generate the network
+
+    Returns
+    -------
+    citing: The index of the citing paper for each edge
+    cited: The index of the cited paper for each edge
+    """
+    rng = np.random.default_rng(seed)
+    out_degrees = sample_out_degrees(n_nodes, mean_degree, distribution, rng)
+    # The first paper has nothing to cite
+    out_degrees[0] = 0
+
+    citing = np.repeat(np.arange(n_nodes), out_degrees)
+
+    fitness = rng.pareto(1.5, n_nodes) + 1
+    cumulative_fitness = np.cumsum(fitness)
+    # Draw a point in the fitness mass of the papers published before the citing paper
+    draws = rng.random(len(citing)) * cumulative_fitness[citing - 1]
+    cited = np.searchsorted(cumulative_fitness, draws, side="right")
+
+    # Papers only cite each other once
+    edge_ids = np.unique(citing * n_nodes + cited)
+    citing, cited = np.divmod(edge_ids, n_nodes)
+
+    return citing, cited
+
+
+def make_citation_graph(
+    n_nodes: int,
+    mean_degree: float = 10,
+    distribution: str = "powerlaw",
+    seed: int = 0,
+) -> nx.DiGraph:
+    """
+    Generate a synthetic citation network with DOI-shaped node names
+
+    See `make_citation_edges` for a description of the arguments
+    """
+    citing, cited = make_citation_edges(n_nodes, mean_degree, distribution, seed)
+
+    graph = nx.DiGraph()
+    graph.add_edges_from(
+        (synthetic_doi(source), synthetic_doi(target))
+        for source, target in zip(citing.tolist(), cited.tolist())
+    )
+    return graph
+
+
+def synthetic_heading_name(idx: int) -> str:
+    """
+    Build a heading name for the given index
+
+    Heading names in the pipeline can only contain lowercase letters and underscores,
+    so the index is written in base 26 with letters instead of digits
+    """
+    letters = ""
+    idx += 1
+    while idx > 0:
+        idx, remainder = divmod(idx - 1, 26)
+        letters = chr(ord("a") + remainder) + letters
+    return f"synthetic_{letters}"
+
+
+def assign_headings(
+    n_nodes: int,
+    n_headings: int = 2,
+    overlap: float = 0.1,
+    coverage: float = 1.0,
+    seed: int = 0,
+) -> Dict[str, Set[str]]:
+    """
+    Split papers into synthetic MeSH headings with a controllable amount of overlap
+
+    Arguments
+    ---------
+    n_nodes: The number of papers to assign
+    n_headings: The number of headings to create
+    overlap: The fraction of assigned papers that also belong to a second heading
+    coverage: The fraction of papers that belong to any heading. The rest only show
+              up in the citation data, like most of COCI does
+    seed: The random seed used to assign headings
+
+    Returns
+    -------
+    heading_to_dois: A dict mapping heading names to the dois of their papers
+    """
+    rng = np.random.default_rng(seed)
+    primary = rng.integers(n_headings, size=n_nodes)
+    is_assigned = rng.random(n_nodes) < coverage
+    # Papers in multiple headings get a second heading different from their first
+    is_shared = rng.random(n_nodes) < overlap
+    secondary = (primary + rng.integers(1, max(n_headings, 2), size=n_nodes)) % (
+        n_headings
+    )
+
+    heading_to_dois = {}
+    for heading_idx in range(n_headings):
+        members = (primary == heading_idx) | (is_shared & (secondary == heading_idx))
+        members &= is_assigned
+        heading_to_dois[synthetic_heading_name(heading_idx)] = set(
+            synthetic_doi(idx) for idx in np.flatnonzero(members).tolist()
+        )
+    return heading_to_dois
+
+
+def write_coci_files(
+    out_dir: str,
+    citing: np.ndarray,
+    cited: np.ndarray,
+    edges_per_file: int = 1000000,
+):
+    """
+    Write citations as csv files with the same columns as the COCI dump
+
+    Arguments
+    ---------
+    out_dir: The directory to write the csv files to
+    citing: The index of the citing paper for each edge
+    cited: The index of the cited paper for each edge
+    edges_per_file: The maximum number of citations to write to each file
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for file_idx, start in enumerate(range(0, len(citing), edges_per_file)):
+        chunk_citing = citing[start : start + edges_per_file].tolist()
+        chunk_cited = cited[start : start + edges_per_file].tolist()
+        citation_df = pd.DataFrame(
+            {
+                "oci": [
+                    f"{source}-{target}"
+                    for source, target in zip(chunk_citing, chunk_cited)
+                ],
+                "citing": [synthetic_doi(idx) for idx in chunk_citing],
+                "cited": [synthetic_doi(idx) for idx in chunk_cited],
+                "creation": "2020-01-01",
+                "timespan": "P1Y",
+                "journal_sc": "no",
+                "author_sc": "no",
+            }
+        )
+        citation_df.to_csv(
+            os.path.join(out_dir, f"synthetic_{file_idx}.csv"), index=False
+        )
+
+
+def write_pubmed_xml(
+    out_path: str, dois: Iterable[str], n_journals: int = 50, seed: int = 0
+):
+    """
+    Write a heading's papers as an xzipped efetch file readable by `parse_metadata`
+
+    Arguments
+    ---------
+    out_path: The path of the .xml.xz file to write
+    dois: The dois of the papers in the heading
+    n_journals: The number of journals to spread the papers across. Journal sizes
+                follow a Zipf distribution like real journals do
+    seed: The random seed used to assign papers to journals
+    """
+    rng = np.random.default_rng(seed)
+    journal_weights = 1 / np.arange(1, n_journals + 1)
+    journal_weights /= journal_weights.sum()
+
+    dois = sorted(dois)
+    journals = rng.choice(n_journals, size=len(dois), p=journal_weights)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with lzma.open(out_path, "wt") as out_file:
+        out_file.write("<PubmedArticleSet>\n")
+        for doi, journal in zip(dois, journals.tolist()):
+            # The paper index doubles as a pmid so pmids match across headings
+            pmid = doi.rsplit(".", 1)[-1]
+            out_file.write(
+                "<PubmedArticle><MedlineCitation>"
+                f"<PMID>{pmid}</PMID>"
+                f"<Article><ArticleTitle>Synthetic article {pmid}</ArticleTitle></Article>"
+                "<MedlineJournalInfo>"
+                f"<MedlineTA>Synthetic J {journal}</MedlineTA>"
+                "</MedlineJournalInfo>"
+                "</MedlineCitation><PubmedData><ArticleIdList>"
+                f'<ArticleId IdType="pubmed">{pmid}</ArticleId>'
+                f'<ArticleId IdType="doi">{doi}</ArticleId>'
+                "</ArticleIdList></PubmedData></PubmedArticle>\n"
+            )
+        out_file.write("</PubmedArticleSet>\n")
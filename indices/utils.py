@@ -1,20 +1,29 @@
+from __future__ import annotations
+
 import collections
-from functools import lru_cache
 import glob
 import os
 import pickle as pkl
 from typing import List, Dict, Union, Tuple, Set
 
-import lxml.etree
-import networkx as nx
-import numpy as np
-import pandas as pd
-from pubmedpy.efetch import extract_identifiers
-from pubmedpy.xml import iter_extract_elems
-from tqdm import tqdm
+import rank_counter
+import serving
+import shuffle_store
+from cache import cached_by_files, cached_call, file_fingerprint
+from lazy import lazy_import
+
+# These are only loaded when a function that uses them runs, so scripts that just
+# need the lightweight helpers start quickly
+etree = lazy_import("lxml.etree")
+nx = lazy_import("networkx")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+efetch = lazy_import("pubmedpy.efetch")
+pubmedpy_xml = lazy_import("pubmedpy.xml")
+tqdm = lazy_import("tqdm")
 
 
-def extract_all(elem: lxml.etree._Element) -> dict:
+def extract_all(elem: etree._Element) -> dict:
     """
     Extract a dictionary of all supported fields from a <PubmedArticle> XML element
 
@@ -25,7 +34,7 @@ def extract_all(elem: lxml.etree._Element) -> dict:
     https://github.com/dhimmel/pubmedpy/blob/main/pubmedpy/efetch.py
     """
     result = collections.OrderedDict()
-    result.update(extract_identifiers(elem))
+    result.update(efetch.extract_identifiers(elem))
     result["journal"] = elem.findtext("MedlineCitation/MedlineJournalInfo/MedlineTA")
     result["title"] = elem.findtext("MedlineCitation/Article/ArticleTitle")
     return result
@@ -58,11 +67,11 @@ def parse_metadata(file_path: str) -> pd.DataFrame:
     else:
         articles = []
         # generator of XML PubmedArticle elements
-        article_elems = iter_extract_elems(file_path, tag="PubmedArticle")
+        article_elems = pubmedpy_xml.iter_extract_elems(file_path, tag="PubmedArticle")
 
         seen_pmids = set()
         i = 0
-        for elem in tqdm(article_elems):
+        for elem in tqdm.tqdm(article_elems):
             # Example efetch XML for <PubmedArticle> at https://github.com/dhimmel/pubmedpy/blob/f554a06e13e24d661dc5ff93ad07179fb3d7f0af/pubmedpy/data/efetch.xml
             result = extract_all(elem)
 
@@ -106,7 +115,7 @@ def build_graphs(
     """
     heading_to_graph = {heading: nx.DiGraph() for heading in heading_to_dois.keys()}
 
-    for file_path in tqdm(glob.glob(f"{coci_dir}/*")):
+    for file_path in tqdm.tqdm(glob.glob(f"{coci_dir}/*")):
         citation_list = pd.read_csv(file_path)
         for heading, dois in heading_to_dois.items():
             for citing, cited in zip(citation_list["citing"], citation_list["cited"]):
@@ -145,7 +154,7 @@ def parse_mesh_headings(
 
     headings = []
     heading_to_dois = {}
-    for metadata_path in tqdm(metadata_files):
+    for metadata_path in tqdm.tqdm(metadata_files):
         print(metadata_path)
         heading = os.path.basename(metadata_path)
         heading = heading.split(".")[0]
@@ -161,7 +170,22 @@ def parse_mesh_headings(
 
 
 def calculate_percentiles(true_vals, doi_to_shuffled_metrics):
-    dois, pageranks = [], []
+    """
+    Find where each paper's true metric value falls among its values in the shuffled
+    networks
+
+    Arguments
+    ---------
+    true_vals: A mapping between dois and their metric value in the true network
+    doi_to_shuffled_metrics: A mapping between dois and their sorted metric values from
+                             the shuffled networks
+
+    Returns
+    -------
+    result_df: A dataframe with the columns doi, pagerank, percentile, and count, where
+               count is the number of shuffled networks the paper was present in
+    """
+    dois, pageranks, counts = [], [], []
     for doi, pagerank in true_vals.items():
         if pagerank is not None:
             dois.append(doi)
@@ -171,33 +195,172 @@ def calculate_percentiles(true_vals, doi_to_shuffled_metrics):
     for doi in dois:
         if doi not in doi_to_shuffled_metrics:
             percentiles.append(None)
+            counts.append(None)
             continue
 
         shuffled_metrics = doi_to_shuffled_metrics[doi]
         # If the node is unshuffleable for some reason, its percentile isn't meaningful
-        if len(set(shuffled_metrics)) == 1:
+        if len(set(shuffled_metrics)) <= 1:
             percentiles.append(None)
+            counts.append(len(shuffled_metrics))
             continue
         true_val = true_vals[doi]
 
-        percentile = np.searchsorted(shuffled_metrics, true_val) / 100
+        # Papers can be missing from some shuffles, so normalize by the number of
+        # shuffles the paper actually appeared in
+        percentile = np.searchsorted(shuffled_metrics, true_val) / len(shuffled_metrics)
         percentiles.append(percentile)
+        counts.append(len(shuffled_metrics))
 
     result_df = pd.DataFrame(
-        {"doi": dois, "pagerank": pageranks, "percentile": percentiles}
+        {"doi": dois, "pagerank": pageranks, "percentile": percentiles, "count": counts}
     )
     return result_df
 
 
-@lru_cache(2)
+def calculate_matrix_percentiles(true_vals, dois, matrix):
+    """
+    Calculate the same percentiles as `calculate_percentiles` from a matrix of shuffle
+    results, like the ones in a shuffle_store.ShuffleStore
+
+    Arguments
+    ---------
+    true_vals: A mapping between dois and their metric value in the true network
+    dois: The doi of each row of `matrix`
+    matrix: A (dois x shuffles) float32 matrix of metric values, with NaN where a paper
+            wasn't in a shuffled network
+
+    Returns
+    -------
+    result_df: A dataframe with the columns doi, pagerank, percentile, and count
+    """
+    doi_to_row = {doi: row for row, doi in enumerate(dois)}
+    result_dois, pageranks = [], []
+    for doi, pagerank in true_vals.items():
+        if pagerank is not None:
+            result_dois.append(doi)
+            pageranks.append(pagerank)
+
+    rows = np.array([doi_to_row.get(doi, -1) for doi in result_dois], dtype=np.int64)
+    if len(matrix) == 0:
+        matrix = np.full((1, matrix.shape[1]), np.nan, dtype=np.float32)
+    # Papers without a row are looked up in row 0, then marked missing below
+    values = matrix[np.maximum(rows, 0)]
+    present = ~np.isnan(values)
+    counts = present.sum(axis=1)
+    mins = np.where(present, values, np.inf).min(axis=1, initial=np.inf)
+    maxes = np.where(present, values, -np.inf).max(axis=1, initial=-np.inf)
+    # Compare at the precision the shuffles are stored at. NaNs are never less than
+    # anything, so missing shuffles aren't counted
+    true_values = np.array(pageranks, dtype=np.float32)
+    n_below = (values < true_values[:, None]).sum(axis=1)
+
+    percentiles, result_counts = [], []
+    for row, count, low, high, below in zip(
+        rows.tolist(), counts.tolist(), mins.tolist(), maxes.tolist(), n_below.tolist()
+    ):
+        if row == -1 or count == 0:
+            percentiles.append(None)
+            result_counts.append(None)
+        elif low == high:
+            # If the node is unshuffleable for some reason, its percentile isn't
+            # meaningful
+            percentiles.append(None)
+            result_counts.append(count)
+        else:
+            percentiles.append(below / count)
+            result_counts.append(count)
+
+    result_df = pd.DataFrame(
+        {
+            "doi": result_dois,
+            "pagerank": pageranks,
+            "percentile": percentiles,
+            "count": result_counts,
+        }
+    )
+    return result_df
+
+
+def _load_shuffle_matrix(store_path, shuffle_to_path):
+    """Read a split heading's shuffle store, adding the results not compacted yet"""
+    dois, matrix, shuffles = shuffle_store.ShuffleStore(store_path).load()
+    doi_to_row = {doi: row for row, doi in enumerate(dois)}
+
+    extra_columns = []
+    stored_shuffles = set(shuffles)
+    for shuffle, path in sorted(shuffle_to_path.items()):
+        if shuffle in stored_shuffles:
+            continue
+        with open(path, "rb") as in_file:
+            result = pkl.load(in_file)
+        for doi in result:
+            if doi not in doi_to_row:
+                doi_to_row[doi] = len(doi_to_row)
+        extra_columns.append(result)
+
+    if len(extra_columns) == 0:
+        return dois, matrix
+
+    full_matrix = np.full(
+        (len(doi_to_row), matrix.shape[1] + len(extra_columns)), np.nan, np.float32
+    )
+    full_matrix[: len(dois), : matrix.shape[1]] = matrix
+    for j, result in enumerate(extra_columns, start=matrix.shape[1]):
+        for doi, value in result.items():
+            if value is not None:
+                full_matrix[doi_to_row[doi], j] = value
+    return list(doi_to_row.keys()), full_matrix
+
+
 def load_single_heading(heading_str, base_dir="output"):
-    heading_shuffled = glob.glob(
-        f"{base_dir}/shuffle_results/{heading_str}*-pagerank.pkl"
+    # Pickled results that haven't been compacted or counted yet. This is the only
+    # time the shuffle results directory is listed
+    shuffle_to_path = rank_counter.find_shuffle_results(base_dir, heading_str)
+
+    # The cached frame only depends on this heading's own files. Pickled results are
+    # never rewritten in place, so their paths are enough to tell when they change
+    # without statting each one
+    fingerprint = (
+        tuple(sorted(shuffle_to_path.items())),
+        file_fingerprint(
+            [
+                os.path.join(
+                    shuffle_store.get_store_path(base_dir, heading_str), "index.json"
+                ),
+                rank_counter.get_counter_path(base_dir, heading_str),
+                f"{base_dir}/{heading_str}-pagerank.pkl",
+            ]
+        ),
+    )
+    return cached_call(
+        (__name__, "load_single_heading", heading_str, base_dir),
+        fingerprint,
+        lambda: _load_single_heading(heading_str, base_dir, shuffle_to_path),
     )
 
+
+def _load_single_heading(heading_str, base_dir, shuffle_to_path):
+    counter_path = rank_counter.get_counter_path(base_dir, heading_str)
+    if os.path.exists(counter_path):
+        # Shuffles that finished after the counter was saved are counted too, whether
+        # they're still pickles or were added to the split heading's store
+        counter = rank_counter.RankCounter.load(counter_path)
+        rank_counter.count_pickles(counter, shuffle_to_path)
+        rank_counter.count_store(counter, base_dir, heading_str)
+        return counter.to_dataframe()
+
+    with open(f"{base_dir}/{heading_str}-pagerank.pkl", "rb") as in_file:
+        true_vals = pkl.load(in_file)
+
+    store_path = shuffle_store.get_store_path(base_dir, heading_str)
+    if os.path.exists(os.path.join(store_path, "index.json")):
+        dois, matrix = _load_shuffle_matrix(store_path, shuffle_to_path)
+        return calculate_matrix_percentiles(true_vals, dois, matrix)
+
     doi_to_shuffled_metrics = {}
 
-    for path in heading_shuffled:
+    for path in shuffle_to_path.values():
         with open(path, "rb") as in_file:
             result = pkl.load(in_file)
             for doi, value in result.items():
@@ -208,27 +371,22 @@ def load_single_heading(heading_str, base_dir="output"):
     for doi, vals in doi_to_shuffled_metrics.items():
         doi_to_shuffled_metrics[doi] = sorted(vals)
 
-    with open(f"{base_dir}/{heading_str}-pagerank.pkl", "rb") as in_file:
-        true_vals = pkl.load(in_file)
-
     heading_df = calculate_percentiles(true_vals, doi_to_shuffled_metrics)
     return heading_df
 
 
-def load_pair_headings(heading1, heading2, base_dir="output"):
-    heading1_df = load_single_heading(f"{heading1}-{heading2}", base_dir)
-    heading2_df = load_single_heading(f"{heading2}-{heading1}", base_dir)
-
-    merged_df = heading1_df.merge(heading2_df, on="doi")
-    merged_df = merged_df.rename(
+def _rename_heading_columns(heading_df: pd.DataFrame, heading: str) -> pd.DataFrame:
+    return heading_df.rename(
         {
-            "pagerank_x": f"{heading1}_pagerank",
-            "pagerank_y": f"{heading2}_pagerank",
-            "percentile_x": f"{heading1}_percentile",
-            "percentile_y": f"{heading2}_percentile",
+            "pagerank": f"{heading}_pagerank",
+            "percentile": f"{heading}_percentile",
+            "count": f"{heading}_count",
         },
         axis="columns",
     )
+
+
+def _add_percentile_differences(merged_df: pd.DataFrame, heading1: str, heading2: str):
     merged_df[f"{heading1}-{heading2}"] = (
         merged_df[f"{heading1}_percentile"] - merged_df[f"{heading2}_percentile"]
     )
@@ -236,12 +394,93 @@ def load_pair_headings(heading1, heading2, base_dir="output"):
         merged_df[f"{heading2}_percentile"] - merged_df[f"{heading1}_percentile"]
     )
 
-    metadata_df = parse_metadata(f"data/pubmed/efetch/{heading1}.xml.xz")
+
+def load_pair_headings(
+    heading1,
+    heading2,
+    base_dir="output",
+    metadata_dir="data/pubmed/efetch",
+    metadata_df=None,
+):
+    """
+    Combine the percentiles of the papers in both halves of a pairwise network
+
+    Arguments
+    ---------
+    heading1: The first heading in the pair
+    heading2: The second heading in the pair
+    base_dir: The directory containing the true and shuffled metric results
+    metadata_dir: The directory containing the efetch metadata for each heading
+    metadata_df: The already-parsed metadata for heading1. If None, it's parsed from
+                 `metadata_dir`
+
+    Returns
+    -------
+    full_df: A dataframe with each heading's pageranks, percentiles, and shuffle counts,
+             the differences between the percentiles, and the papers' metadata
+    """
+    heading1_df = load_single_heading(f"{heading1}-{heading2}", base_dir)
+    heading2_df = load_single_heading(f"{heading2}-{heading1}", base_dir)
+
+    merged_df = _rename_heading_columns(heading1_df, heading1).merge(
+        _rename_heading_columns(heading2_df, heading2), on="doi"
+    )
+    _add_percentile_differences(merged_df, heading1, heading2)
+
+    if metadata_df is None:
+        metadata_df = parse_metadata(f"{metadata_dir}/{heading1}.xml.xz")
     full_df = merged_df.merge(metadata_df, on="doi")
 
     return full_df
 
 
+def load_group_headings(headings: List[str], base_dir="output") -> pd.DataFrame:
+    """
+    Combine the percentiles of the papers in every heading of a group network
+
+    Arguments
+    ---------
+    headings: The group's headings, in the order they appear in the group's name
+    base_dir: The directory containing the true and shuffled metric results
+
+    Returns
+    -------
+    group_df: A dataframe with a row for each paper in any of the headings, and each
+              heading's pageranks, percentiles, and shuffle counts. Papers outside a
+              heading have missing values in its columns
+    """
+    group_df = None
+    for heading in headings:
+        others = "+".join(other for other in headings if other != heading)
+        heading_df = load_single_heading(f"{heading}-{others}", base_dir)
+        heading_df = _rename_heading_columns(heading_df, heading)
+        if group_df is None:
+            group_df = heading_df
+        else:
+            group_df = group_df.merge(heading_df, on="doi", how="outer")
+    return group_df
+
+
+def pair_from_group(
+    group_df: pd.DataFrame, heading1: str, heading2: str, metadata_df: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Pull the dataframe `load_pair_headings` would produce for two headings out of the
+    results of a group containing both of them
+    """
+    columns = [
+        f"{heading}_{column}"
+        for heading in [heading1, heading2]
+        for column in ["pagerank", "percentile", "count"]
+    ]
+    merged_df = group_df[["doi"] + columns].dropna(
+        subset=[f"{heading1}_pagerank", f"{heading2}_pagerank"]
+    )
+    merged_df = merged_df.reset_index(drop=True)
+    _add_percentile_differences(merged_df, heading1, heading2)
+    return merged_df.merge(metadata_df, on="doi")
+
+
 def load_text(file_path: str) -> str:
     """A convenience function for reading in the markdown files used for the site's text"""
     with open(file_path) as in_file:
@@ -263,6 +502,10 @@ def get_heading_names(base_dir="viz_dataframes") -> List[str]:
     """
     Retrieve the names of all MeSH terms we have dataframes for
     """
+    store_path = serving.get_store_path(base_dir)
+    if os.path.exists(store_path):
+        return serving.query_heading_names(store_path)
+
     result_files = glob.glob(f"{base_dir}/percentiles/*.pkl")
 
     headings = set()
@@ -285,6 +528,10 @@ def get_pair_names(heading: str, base_dir="viz_dataframes") -> List[str]:
     """
     Get the names of all headings that have been compared against the given heading
     """
+    store_path = serving.get_store_path(base_dir)
+    if os.path.exists(store_path):
+        return serving.query_pair_names(store_path, heading)
+
     result_files = glob.glob(f"{base_dir}/percentiles/*{heading}*.pkl")
 
     pair_headings = set()
@@ -298,12 +545,34 @@ def get_pair_names(heading: str, base_dir="viz_dataframes") -> List[str]:
     return list(pair_headings)
 
 
+def _pair_paths(kind: str, heading1: str, heading2: str, base_dir: str) -> List[str]:
+    """Get the paths a pair's dataframe could be loaded from, including the store"""
+    return [
+        serving.get_store_path(base_dir),
+        f"{base_dir}/{kind}/{heading1}-{heading2}.pkl",
+        f"{base_dir}/{kind}/{heading2}-{heading1}.pkl",
+    ]
+
+
+def _percentile_paths(heading1, heading2, base_dir="viz_dataframes") -> List[str]:
+    return _pair_paths("percentiles", heading1, heading2, base_dir)
+
+
+def _journal_paths(heading1, heading2, base_dir="viz_dataframes") -> List[str]:
+    return _pair_paths("journals", heading1, heading2, base_dir)
+
+
+@cached_by_files(_percentile_paths)
 def load_percentile_data(
     heading1: str, heading2: str, base_dir="viz_dataframes"
 ) -> pd.DataFrame:
     """
     Load the dataframe containing papers' percentiles and pageranks
     """
+    store_path = serving.get_store_path(base_dir)
+    if os.path.exists(store_path):
+        return serving.query_percentile_data(store_path, heading1, heading2)
+
     path = f"{base_dir}/percentiles/{heading1}-{heading2}.pkl"
     if os.path.exists(path):
         with open(path, "rb") as in_file:
@@ -315,12 +584,17 @@ def load_percentile_data(
     return result_df
 
 
+@cached_by_files(_journal_paths)
 def load_journal_data(
     heading1: str, heading2: str, base_dir="viz_dataframes"
 ) -> pd.DataFrame:
     """
     Load the dataframe containing information about journals across fields
     """
+    store_path = serving.get_store_path(base_dir)
+    if os.path.exists(store_path):
+        return serving.query_journal_data(store_path, heading1, heading2)
+
     path = f"{base_dir}/journals/{heading1}-{heading2}.pkl"
     if os.path.exists(path):
         with open(path, "rb") as in_file:
@@ -0,0 +1,20 @@
+import os
+import pickle as pkl
+import sys
+
+import pytest
+
+# The scripts in indices/ import each other as top-level modules, as they do when run
+# with `python indices/<script>.py`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "indices"))
+
+
+@pytest.fixture
+def write_result():
+    """Pickle a metric result to a path, the way run_metric_on_graph.py saves them"""
+
+    def write(path, node_to_metric):
+        with open(path, "wb") as out_file:
+            pkl.dump(node_to_metric, out_file)
+
+    return write
@@ -0,0 +1,24 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from indices.benchmark import PAGERANK_ENGINES
+
+
+@pytest.mark.parametrize("engine", sorted(PAGERANK_ENGINES))
+def test_pagerank_engines_agree(engine):
+    graph = nx.gnp_random_graph(200, 0.02, directed=True, seed=0)
+    expected = nx.pagerank(graph, tol=1e-12, max_iter=1000)
+
+    result = PAGERANK_ENGINES[engine](graph)
+
+    assert result.keys() == expected.keys()
+    # The engines run at their default tolerances, which for nx.pagerank is an L1
+    # change of 1e-6 per node
+    np.testing.assert_allclose(
+        [result[node] for node in expected], list(expected.values()), atol=1e-4
+    )
+
+
+def test_engines_beyond_networkx_are_registered():
+    assert {"csr", "component", "gmres", "bicgstab"} <= set(PAGERANK_ENGINES)
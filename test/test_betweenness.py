@@ -0,0 +1,58 @@
+import networkx as nx
+import pytest
+
+from indices.betweenness import adaptive_betweenness_centrality, betweenness_centrality
+
+
+def make_graph():
+    graph = nx.gnp_random_graph(60, 0.08, seed=1, directed=True)
+    graph.add_edge("source", 0)
+    graph.add_edge(59, "sink")
+    return graph
+
+
+def test_exact_betweenness():
+    graph = make_graph()
+    expected = nx.betweenness_centrality(graph)
+
+    result = betweenness_centrality(graph)
+
+    for node, value in expected.items():
+        assert result[node] == pytest.approx(value)
+
+
+def test_parallel_betweenness():
+    graph = make_graph()
+    expected = nx.betweenness_centrality(graph)
+
+    result = betweenness_centrality(graph, workers=2)
+
+    for node, value in expected.items():
+        assert result[node] == pytest.approx(value)
+
+
+def test_sampled_betweenness_is_deterministic():
+    graph = make_graph()
+
+    assert betweenness_centrality(graph, k=10, seed=0) == betweenness_centrality(
+        graph, k=10, seed=0
+    )
+
+
+def test_adaptive_betweenness_within_epsilon():
+    graph = make_graph()
+    expected = nx.betweenness_centrality(graph)
+
+    result = adaptive_betweenness_centrality(
+        graph, epsilon=0.05, delta=0.1, initial_pivots=10, seed=0
+    )
+
+    for node, value in expected.items():
+        assert abs(result[node] - value) <= 0.05
+
+
+def test_tiny_graph():
+    graph = nx.DiGraph()
+    graph.add_edge(1, 2)
+
+    assert betweenness_centrality(graph) == {1: 0.0, 2: 0.0}
@@ -0,0 +1,85 @@
+import os
+import pickle as pkl
+
+import numpy as np
+import pandas as pd
+
+from indices.cache import ByteLRUCache, cached_by_files, get_size
+
+
+def make_df(n_rows):
+    return pd.DataFrame({"value": np.arange(n_rows, dtype=np.float64)})
+
+
+def test_evicts_least_recently_used_by_bytes():
+    size = get_size(make_df(100))
+    cache = ByteLRUCache(int(size * 2.5))
+
+    cache.put("a", make_df(100))
+    cache.put("b", make_df(100))
+    assert cache.get("a")[0]
+    cache.put("c", make_df(100))
+
+    # b was used least recently, so it's the one evicted
+    assert not cache.get("b")[0]
+    assert cache.get("a")[0]
+    assert cache.get("c")[0]
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+    assert stats["current_bytes"] <= stats["max_bytes"]
+
+
+def test_values_larger_than_cache_are_not_stored():
+    cache = ByteLRUCache(10)
+    cache.put("a", make_df(100))
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["current_bytes"] == 0
+
+
+def test_resize_evicts_entries_that_no_longer_fit():
+    size = get_size(make_df(100))
+    cache = ByteLRUCache(size * 3)
+    for key in ["a", "b", "c"]:
+        cache.put(key, make_df(100))
+    cache.get("a")
+
+    cache.resize(size * 2)
+    assert not cache.get("b")[0]
+    assert cache.get("a")[0] and cache.get("c")[0]
+
+    # A cache with no room stores nothing
+    cache.resize(0)
+    assert cache.stats()["entries"] == 0
+    assert not cache.put("a", make_df(100))
+
+
+def test_changed_files_are_reloaded(tmp_path):
+    path = str(tmp_path / "frame.pkl")
+    cache = ByteLRUCache(10 * 1024**2)
+    n_loads = []
+
+    @cached_by_files(lambda path: [path], cache)
+    def load(path):
+        n_loads.append(path)
+        with open(path, "rb") as in_file:
+            return pkl.load(in_file)
+
+    with open(path, "wb") as out_file:
+        pkl.dump(make_df(10), out_file)
+    assert len(load(path)) == 10
+    assert len(load(path)) == 10
+    assert len(n_loads) == 1
+
+    with open(path, "wb") as out_file:
+        pkl.dump(make_df(20), out_file)
+    # Make sure the modification time changes even on coarse-grained filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert len(load(path)) == 20
+    assert len(n_loads) == 2
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,247 @@
+import json
+import os
+import pickle as pkl
+import threading
+import time
+
+import networkx as nx
+import pytest
+
+from indices import graph_server
+from indices.graph_server import GraphServer, send_request, submit_graphs
+from indices.pagerank import pagerank_with_telemetry
+
+
+def write_graph(path, seed):
+    graph = nx.gnp_random_graph(200, 0.02, directed=True, seed=seed)
+    graph = nx.relabel_nodes(graph, {node: f"10.{node}/doi" for node in graph})
+    graph.add_edge("10.0/doi", "10.0/doi")
+    with open(path, "wb") as out_file:
+        pkl.dump(graph, out_file)
+    return graph
+
+
+def test_handle_runs_pagerank(tmp_path):
+    graph = write_graph(tmp_path / "graph.pkl", seed=0)
+    out_file = str(tmp_path / "graph-pagerank.pkl")
+
+    server = GraphServer(workers=1, max_bytes=1024**2)
+    try:
+        request = {
+            "command": "run",
+            "graph_file": str(tmp_path / "graph.pkl"),
+            "metric": "pagerank",
+            "out_file": out_file,
+        }
+        assert server.handle(request)["status"] == "ok"
+        assert server.handle(request)["status"] == "exists"
+
+        os.remove(out_file)
+        assert server.handle(request)["status"] == "ok"
+        stats = server.handle({"command": "stats"})
+        # The second job reuses the graph already in shared memory
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+    finally:
+        server.close()
+
+    with open(out_file, "rb") as in_file:
+        result = pkl.load(in_file)
+    graph.remove_edges_from(nx.selfloop_edges(graph))
+    expected = nx.pagerank(graph)
+    assert result.keys() == expected.keys()
+    for node in expected:
+        assert result[node] == pytest.approx(expected[node], abs=1e-10)
+
+
+def test_pagerank_options_match_script(tmp_path):
+    graph = write_graph(tmp_path / "graph.pkl", seed=0)
+    graph.remove_edges_from(nx.selfloop_edges(graph))
+    options = {"alpha": 0.6, "tol": 1e-10, "max_iter": 200, "by_component": True}
+
+    server = GraphServer(workers=1)
+    try:
+        request = {
+            "command": "run",
+            "graph_file": str(tmp_path / "graph.pkl"),
+            "metric": "pagerank",
+            "out_file": str(tmp_path / "graph-pagerank.pkl"),
+            "options": options,
+            "telemetry_file": str(tmp_path / "graph-pagerank.telemetry.json"),
+            "telemetry": True,
+        }
+        assert server.handle(request)["status"] == "ok"
+
+        # Graphs neither solver converges on fail, but still record their telemetry
+        request.update(
+            {
+                "out_file": str(tmp_path / "failed-pagerank.pkl"),
+                "options": {
+                    "max_iter": 1,
+                    "fallback": "bicgstab",
+                    "fallback_max_iter": 1,
+                },
+                "telemetry_file": str(tmp_path / "failed-pagerank.telemetry.json"),
+                "telemetry": False,
+            }
+        )
+        assert server.handle(request)["status"] == "error"
+    finally:
+        server.close()
+
+    expected, expected_telemetry = pagerank_with_telemetry(graph, **options)
+    with open(tmp_path / "graph-pagerank.pkl", "rb") as in_file:
+        result = pkl.load(in_file)
+    assert result == pytest.approx(expected, abs=1e-15)
+    with open(tmp_path / "graph-pagerank.telemetry.json") as in_file:
+        telemetry = json.load(in_file)
+    assert telemetry["alpha"] == 0.6
+    assert telemetry["n_components"] == expected_telemetry["n_components"]
+
+    assert not os.path.exists(tmp_path / "failed-pagerank.pkl")
+    with open(tmp_path / "failed-pagerank.telemetry.json") as in_file:
+        assert not json.load(in_file)["converged"]
+
+
+def test_eviction_and_errors(tmp_path):
+    for i in range(3):
+        write_graph(tmp_path / f"graph{i}.pkl", seed=i)
+
+    # Only one graph fits in the cache at a time
+    server = GraphServer(workers=1, max_bytes=12000)
+    try:
+        for i in range(3):
+            response = server.handle(
+                {
+                    "command": "run",
+                    "graph_file": str(tmp_path / f"graph{i}.pkl"),
+                    "metric": "disruption_idx",
+                    "out_file": str(tmp_path / f"graph{i}-disruption_idx.pkl"),
+                }
+            )
+            assert response["status"] == "ok"
+        assert server.handle({"command": "stats"})["evictions"] == 2
+
+        response = server.handle(
+            {
+                "command": "run",
+                "graph_file": str(tmp_path / "missing.pkl"),
+                "metric": "pagerank",
+                "out_file": str(tmp_path / "missing-pagerank.pkl"),
+            }
+        )
+        assert response["status"] == "error"
+    finally:
+        server.close()
+
+
+def test_slow_load_does_not_block_other_graphs(tmp_path, monkeypatch):
+    write_graph(tmp_path / "slow.pkl", seed=0)
+    write_graph(tmp_path / "fast.pkl", seed=1)
+    release_slow = threading.Event()
+    loaded = []
+    load_graph = graph_server.load_graph
+
+    def blocking_load_graph(path):
+        if path.endswith("slow.pkl"):
+            assert release_slow.wait(30)
+        loaded.append(os.path.basename(path))
+        return load_graph(path)
+
+    monkeypatch.setattr(graph_server, "load_graph", blocking_load_graph)
+
+    server = GraphServer(workers=1)
+    shared_graphs = []
+
+    def get_graph(path):
+        shared_graphs.append(server.get_graph(path))
+
+    try:
+        slow_threads = [
+            threading.Thread(target=get_graph, args=(str(tmp_path / "slow.pkl"),))
+            for _ in range(2)
+        ]
+        for thread in slow_threads:
+            thread.start()
+        # The other graph loads while the slow one is still stuck
+        get_graph(str(tmp_path / "fast.pkl"))
+        assert loaded == ["fast.pkl"]
+
+        release_slow.set()
+        for thread in slow_threads:
+            thread.join(30)
+        # Both requests for the slow graph share a single load
+        assert loaded == ["fast.pkl", "slow.pkl"]
+        assert len(shared_graphs) == 3
+    finally:
+        release_slow.set()
+        for shared_graph in shared_graphs:
+            server._unpin(shared_graph)
+        server.close()
+
+
+def test_socket_round_trip(tmp_path):
+    write_graph(tmp_path / "graph.pkl", seed=0)
+    address = str(tmp_path / "server.sock")
+
+    server = GraphServer(workers=2)
+    thread = threading.Thread(target=server.serve, args=(address,))
+    thread.start()
+    # Fail instead of hanging if the server never starts listening
+    deadline = time.monotonic() + 30
+    while not os.path.exists(address):
+        assert thread.is_alive() and time.monotonic() < deadline
+        time.sleep(0.01)
+
+    responses = submit_graphs(
+        address, [str(tmp_path / "graph.pkl")], "pagerank", str(tmp_path)
+    )
+    assert [response["status"] for response in responses] == ["ok"]
+    assert os.path.exists(tmp_path / "graph-pagerank.pkl")
+
+    send_request(address, {"command": "shutdown"})
+    thread.join()
+
+
+def timed_run_metric(meta, metric, out_file, *args):
+    """Stand in for a slow job, recording when it ran instead of its results"""
+    start = time.monotonic()
+    time.sleep(1)
+    with open(out_file, "wb") as out:
+        pkl.dump((start, time.monotonic()), out)
+
+
+def test_submit_runs_jobs_concurrently(tmp_path, monkeypatch):
+    for i in range(2):
+        write_graph(tmp_path / f"graph{i}.pkl", seed=i)
+    # The workers are forked after this, so they run the stand in
+    monkeypatch.setattr(graph_server, "run_metric", timed_run_metric)
+    address = str(tmp_path / "server.sock")
+
+    server = GraphServer(workers=2)
+    thread = threading.Thread(target=server.serve, args=(address,))
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not os.path.exists(address):
+        assert thread.is_alive() and time.monotonic() < deadline
+        time.sleep(0.01)
+
+    try:
+        responses = submit_graphs(
+            address,
+            [str(tmp_path / f"graph{i}.pkl") for i in range(2)],
+            "pagerank",
+            str(tmp_path),
+        )
+    finally:
+        send_request(address, {"command": "shutdown"})
+        thread.join()
+    assert [response["status"] for response in responses] == ["ok", "ok"]
+
+    intervals = []
+    for i in range(2):
+        with open(tmp_path / f"graph{i}-pagerank.pkl", "rb") as in_file:
+            intervals.append(pkl.load(in_file))
+    (start1, end1), (start2, end2) = intervals
+    # Each job starts before the other one finishes
+    assert start1 < end2 and start2 < end1
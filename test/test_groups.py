@@ -0,0 +1,120 @@
+import json
+import os
+import pickle as pkl
+
+import networkx as nx
+import pandas as pd
+
+from indices import condense
+from indices.split_pairwise_network import (
+    get_split_names,
+    split_group_network,
+    split_network,
+)
+from indices.utils import load_group_headings, load_pair_headings, pair_from_group
+
+
+def test_split_names():
+    assert get_split_names("a+b") == {"a": "a-b", "b": "b-a"}
+    assert get_split_names("a+b+c-12") == {
+        "a": "a-b+c-12",
+        "b": "b-a+c-12",
+        "c": "c-a+b-12",
+    }
+
+
+def test_split_group_network_matches_pairs():
+    graph = nx.gnp_random_graph(60, 0.1, seed=0, directed=True)
+    heading_to_nodes = {
+        "a": range(0, 30),
+        "b": range(20, 50),
+        "c": range(40, 60),
+    }
+
+    heading_to_network = split_group_network(graph, heading_to_nodes)
+
+    a_network, b_network = split_network(
+        graph, heading_to_nodes["a"], heading_to_nodes["b"]
+    )
+    assert set(heading_to_network["a"].edges) == set(a_network.edges)
+    assert set(heading_to_network["b"].edges) == set(b_network.edges)
+    assert set(heading_to_network["c"].nodes) <= set(range(40, 60))
+
+
+def write_group_results(tmp_path, write_result):
+    """Write the results of an a+b+c group, and of the pairwise pipeline for a and b"""
+    os.makedirs(tmp_path / "shuffle_results")
+    heading_to_dois = {
+        "a": ["1", "2", "3", "4"],
+        "b": ["3", "4", "5"],
+        "c": ["4", "5", "6"],
+    }
+    for heading, dois in heading_to_dois.items():
+        others = "+".join(other for other in "abc" if other != heading)
+        write_result(
+            tmp_path / f"{heading}-{others}-pagerank.pkl",
+            {doi: 0.1 * int(doi) for doi in dois},
+        )
+        for shuffle in range(4):
+            write_result(
+                tmp_path
+                / "shuffle_results"
+                / f"{heading}-{others}-{shuffle}-pagerank.pkl",
+                {doi: 0.1 * ((int(doi) + shuffle) % 5) for doi in dois},
+            )
+    # Results from the pairwise pipeline for a and b, which shouldn't be mixed with
+    # the group's results
+    write_result(tmp_path / "a-b-pagerank.pkl", {"3": 0.3, "4": 0.4})
+    write_result(tmp_path / "b-a-pagerank.pkl", {"3": 0.3, "4": 0.4})
+    for shuffle in range(4):
+        for name in ["a-b", "b-a"]:
+            write_result(
+                tmp_path / "shuffle_results" / f"{name}-{shuffle}-pagerank.pkl",
+                {"3": 0.1 * shuffle, "4": 0.4},
+            )
+
+
+def test_pair_from_group_matches_pair_pipeline(tmp_path, write_result):
+    write_group_results(tmp_path, write_result)
+
+    metadata_df = pd.DataFrame({"doi": ["1", "2", "3", "4", "5", "6"], "x": range(6)})
+    group_df = load_group_headings(["a", "b", "c"], base_dir=str(tmp_path))
+    assert len(group_df) == 6
+
+    pair_df = pair_from_group(group_df, "a", "b", metadata_df)
+    assert sorted(pair_df["doi"]) == ["3", "4"]
+
+    expected_df = load_pair_headings("a", "b", str(tmp_path), metadata_df=metadata_df)
+    assert list(pair_df.columns) == list(expected_df.columns)
+    # Each pipeline only reads its own shuffles
+    assert pair_df["a_count"].tolist() == [4, 4]
+    assert expected_df["a_count"].tolist() == [4, 4]
+    assert (pair_df["a_percentile"] != expected_df["a_percentile"]).any()
+
+
+def test_condense_group_keeps_pairwise_outputs(tmp_path, monkeypatch, write_result):
+    write_group_results(tmp_path / "output", write_result)
+    metadata_df = pd.DataFrame(
+        {"doi": ["1", "2", "3", "4", "5", "6"], "journal": ["j1", "j1", "j2"] * 2}
+    )
+    monkeypatch.setattr(condense, "load_heading_metadata", lambda *_: metadata_df)
+    os.makedirs(tmp_path / "viz_dataframes" / "percentiles")
+    os.makedirs(tmp_path / "viz_dataframes" / "groups")
+    pairwise_path = tmp_path / "viz_dataframes" / "percentiles" / "a-b.pkl"
+    write_result(pairwise_path, "from the pairwise pipeline")
+
+    condense.condense_group(str(tmp_path), ["a", "b", "c"], journal_size_cutoff=0)
+
+    # The pairwise pipeline's output uses a different null distribution, so the
+    # group's version of the pair is written alongside it rather than over it
+    with open(pairwise_path, "rb") as in_file:
+        assert pkl.load(in_file) == "from the pairwise pipeline"
+    for heading1, heading2 in [("a", "b"), ("a", "c"), ("b", "c")]:
+        percentile_path, journal_path = condense.get_out_paths(
+            str(tmp_path), heading1, heading2, "a+b+c"
+        )
+        assert percentile_path.startswith(f"{tmp_path}/viz_dataframes/groups/a+b+c/")
+        assert os.path.exists(journal_path)
+        with open(percentile_path.replace(".pkl", ".manifest.json")) as in_file:
+            assert json.load(in_file)["group"] == "a+b+c"
+    assert os.path.exists(condense.get_group_out_path(str(tmp_path), ["a", "b", "c"]))
@@ -0,0 +1,119 @@
+import os
+import pickle as pkl
+import subprocess
+import sys
+
+import networkx as nx
+
+from indices.hierarchy import compose_parent_graphs
+from indices.synthetic import (
+    assign_headings,
+    make_citation_edges,
+    make_citation_graph,
+    write_coci_files,
+)
+
+
+def heading_edges(graph, dois, include_first_degree):
+    return {
+        (citing, cited)
+        for citing, cited in graph.edges
+        if (citing in dois or cited in dois)
+        and (include_first_degree or (citing in dois and cited in dois))
+    }
+
+
+def test_parent_graph_matches_full_build(tmp_path):
+    citing, cited = make_citation_edges(300, mean_degree=5, seed=4)
+    write_coci_files(str(tmp_path), citing, cited, edges_per_file=200)
+    file_paths = sorted(str(path) for path in tmp_path.iterdir())
+    full_graph = make_citation_graph(300, mean_degree=5, seed=4)
+    child_to_dois = assign_headings(300, n_headings=4, coverage=0.4, seed=4)
+    children = sorted(child_to_dois)
+    parent_to_children = {"parent": children[:3], "other_parent": children[1:]}
+
+    for include_first_degree in [False, True]:
+        child_to_graph = {}
+        for child, dois in child_to_dois.items():
+            child_to_graph[child] = nx.DiGraph(
+                list(heading_edges(full_graph, dois, include_first_degree))
+            )
+
+        parent_to_graph = compose_parent_graphs(
+            parent_to_children,
+            child_to_graph,
+            child_to_dois,
+            file_paths,
+            include_first_degree,
+        )
+
+        for parent, parent_children in parent_to_children.items():
+            dois = set().union(*[child_to_dois[child] for child in parent_children])
+            expected = heading_edges(full_graph, dois, include_first_degree)
+            assert set(parent_to_graph[parent].edges) == expected
+
+
+def test_parent_with_more_than_64_children(tmp_path):
+    citing, cited = make_citation_edges(1000, mean_degree=5, seed=6)
+    write_coci_files(str(tmp_path), citing, cited, edges_per_file=1000)
+    file_paths = sorted(str(path) for path in tmp_path.iterdir())
+    full_graph = make_citation_graph(1000, mean_degree=5, seed=6)
+    child_to_dois = assign_headings(1000, n_headings=70, coverage=0.5, seed=6)
+    child_to_graph = {
+        child: nx.DiGraph(list(heading_edges(full_graph, dois, False)))
+        for child, dois in child_to_dois.items()
+    }
+
+    parent_to_graph = compose_parent_graphs(
+        {"parent": sorted(child_to_dois)}, child_to_graph, child_to_dois, file_paths
+    )
+
+    dois = set().union(*child_to_dois.values())
+    expected = heading_edges(full_graph, dois, False)
+    assert set(parent_to_graph["parent"].edges) == expected
+
+
+def test_missing_child_networks(tmp_path):
+    mesh_file = tmp_path / "mesh_descriptors.txt"
+    with open(mesh_file, "w") as out_file:
+        for heading, tree_number in [
+            ("Parent", "H01"),
+            ("First Child", "H01.100"),
+            ("Second Child", "H01.200"),
+            ("Third Child", "H01.300"),
+        ]:
+            out_file.write(f"*NEWRECORD\nRECTYPE = D\nMH = {heading}\n")
+            out_file.write(f"MN = {tree_number}\nUI = D000000\n\n")
+    network_dir = tmp_path / "networks"
+    network_dir.mkdir()
+    with open(network_dir / "first_child-first_degree.pkl", "wb") as out_file:
+        pkl.dump(nx.DiGraph([("a", "b")]), out_file)
+
+    script = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "indices",
+        "build_parent_heading_networks.py",
+    )
+    command = [
+        sys.executable,
+        script,
+        str(mesh_file),
+        "Parent",
+        "--network_dir",
+        str(network_dir),
+        "--out_dir",
+        str(network_dir),
+        "--include_first_degree",
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "second_child, third_child" in result.stderr
+    assert sorted(os.listdir(network_dir)) == ["first_child-first_degree.pkl"]
+
+    # Partial networks get their own name and record what they're missing
+    subprocess.run(command + ["--allow_partial"], check=True, capture_output=True)
+    assert not os.path.exists(network_dir / "parent-first_degree.pkl")
+    with open(network_dir / "parent-first_degree-partial.pkl", "rb") as in_file:
+        graph = pkl.load(in_file)
+    assert list(graph.edges) == [("a", "b")]
+    assert graph.graph["missing_children"] == ["second_child", "third_child"]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indices.journals import aggregate_journals
+
+
+def make_pair_df(n_papers=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "doi": [f"doi_{i}" for i in range(n_papers)],
+            "title": [f"title {i}" for i in range(n_papers)],
+            "journal": rng.choice([f"journal_{i}" for i in range(30)], n_papers),
+            "a_pagerank": rng.random(n_papers),
+            "a_percentile": rng.random(n_papers),
+            "a_count": rng.integers(90, 101, n_papers),
+        }
+    )
+    # Missing values and papers without journals should be ignored like pandas does
+    df.loc[rng.random(n_papers) < 0.1, "a_percentile"] = np.nan
+    df.loc[rng.random(n_papers) < 0.05, "journal"] = None
+    return df
+
+
+def test_medians_match_pandas():
+    df = make_pair_df()
+    cutoff = 60
+
+    journal_df = aggregate_journals(df, cutoff)
+
+    numeric_columns = ["a_pagerank", "a_percentile", "a_count"]
+    journal_groups = df.groupby("journal")[numeric_columns]
+    expected_df = journal_groups.median()[journal_groups.size() > cutoff]
+
+    assert len(journal_df) > 0
+    assert list(journal_df.index) == list(expected_df.index)
+    for column in numeric_columns:
+        np.testing.assert_allclose(journal_df[column], expected_df[column])
+    assert list(journal_df["journal_title"]) == list(expected_df.index)
+    assert list(journal_df["paper_count"]) == list(
+        journal_groups.size()[journal_groups.size() > cutoff]
+    )
+
+
+def test_quantiles_and_bootstrap():
+    df = make_pair_df()
+
+    journal_df = aggregate_journals(df, 0, quantiles=[0.25, 0.9], n_bootstrap=200)
+
+    expected = df.groupby("journal")["a_pagerank"].quantile(0.9)
+    np.testing.assert_allclose(journal_df["a_pagerank_q0.9"], expected)
+
+    assert (journal_df["a_pagerank_ci_lower"] <= journal_df["a_pagerank"]).all()
+    assert (journal_df["a_pagerank_ci_upper"] >= journal_df["a_pagerank"]).all()
+    assert (journal_df["a_pagerank_ci_lower"] < journal_df["a_pagerank_ci_upper"]).all()
+
+
+def test_all_missing_column():
+    df = make_pair_df()
+    df["a_percentile"] = np.nan
+
+    journal_df = aggregate_journals(df, 0, n_bootstrap=10)
+    assert journal_df["a_percentile"].isna().all()
+    assert journal_df["a_percentile_ci_lower"].isna().all()
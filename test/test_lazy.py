@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from indices.lazy import lazy_import
+
+INDICES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "indices")
+
+
+def test_utils_import_is_lazy():
+    # Run in a new interpreter since the other tests have already loaded pandas
+    code = (
+        "import sys\n"
+        f"sys.path.insert(0, {INDICES_DIR!r})\n"
+        "import utils\n"
+        "assert utils.extract_heading_name('dir/a-b.pkl') == ('a', 'b')\n"
+        "for module in ['pandas.core', 'networkx.classes', 'numpy.linalg', 'tqdm.std']:\n"
+        "    assert module not in sys.modules, module\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_missing_module_fails_on_use():
+    module = lazy_import("a_module_that_does_not_exist.submodule")
+    with pytest.raises(ModuleNotFoundError):
+        module.some_function()
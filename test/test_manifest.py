@@ -0,0 +1,59 @@
+import os
+import pickle as pkl
+
+import numpy as np
+import pandas as pd
+
+from indices.manifest import (
+    build_pair_manifest,
+    get_manifest_path,
+    load_manifest,
+    rows_at_threshold,
+    write_manifest,
+)
+
+
+def test_rows_at_threshold_matches_filter():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "a_count": rng.integers(80, 101, 500).astype(float),
+            "b_count": rng.integers(80, 101, 500).astype(float),
+        }
+    )
+    df.loc[rng.random(500) < 0.1, "b_count"] = np.nan
+
+    manifest = build_pair_manifest(df, "a", "b")
+    assert manifest["overlap"] == 500
+
+    for threshold in [-1, 0, 50, 80, 90, 95, 100, 101, 1000]:
+        expected = ((df["a_count"] >= threshold) & (df["b_count"] >= threshold)).sum()
+        assert rows_at_threshold(manifest, threshold) == expected
+
+
+def test_empty_pair():
+    df = pd.DataFrame({"a_count": [], "b_count": []})
+    manifest = build_pair_manifest(df, "a", "b")
+    assert rows_at_threshold(manifest, 0) == 0
+    assert rows_at_threshold(manifest, 95) == 0
+
+
+def test_manifest_is_stale_after_pickle_changes(tmp_path):
+    percentile_path = str(tmp_path / "a-b.pkl")
+    manifest_path = get_manifest_path(percentile_path)
+    df = pd.DataFrame({"a_count": [100.0, 90.0], "b_count": [100.0, 100.0]})
+    with open(percentile_path, "wb") as out_file:
+        pkl.dump(df, out_file)
+
+    assert load_manifest(manifest_path, percentile_path) is None
+    write_manifest(manifest_path, build_pair_manifest(df, "a", "b"), percentile_path)
+    assert load_manifest(manifest_path, percentile_path)["overlap"] == 2
+
+    # Rewriting the dataframe makes the old manifest out of date, even if the pickle
+    # keeps its size
+    stat = os.stat(percentile_path)
+    os.utime(percentile_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_manifest(manifest_path, percentile_path) is None
+
+    os.remove(percentile_path)
+    assert load_manifest(manifest_path, percentile_path) is None
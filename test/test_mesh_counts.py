@@ -0,0 +1,77 @@
+import threading
+
+from indices.get_mesh_headings import Node, get_headings
+from indices.mesh_counts import CountCache, HeadingCounter
+
+COUNTS = {
+    "root": 50000,
+    "big_child": 30000,
+    "big_grandchild_1": 15000,
+    "big_grandchild_2": 12000,
+    "small_child": 5000,
+    "medium_child": 20000,
+    "tiny_grandchild": 10,
+}
+
+
+def make_tree():
+    nodes = {heading: Node(heading, heading) for heading in COUNTS}
+    for heading, node in nodes.items():
+        node.depth = 1
+    nodes["root"].children = [
+        nodes["big_child"],
+        nodes["small_child"],
+        nodes["medium_child"],
+    ]
+    nodes["big_child"].children = [
+        nodes["big_grandchild_1"],
+        nodes["big_grandchild_2"],
+    ]
+    nodes["medium_child"].children = [nodes["tiny_grandchild"]]
+    return nodes["root"]
+
+
+def make_fetch():
+    fetched = []
+    lock = threading.Lock()
+
+    def fetch(heading):
+        with lock:
+            fetched.append(heading)
+        return COUNTS[heading]
+
+    return fetch, fetched
+
+
+def test_counts_are_cached_between_runs(tmp_path):
+    cache_path = str(tmp_path / "counts.sqlite")
+    fetch, fetched = make_fetch()
+
+    counter = HeadingCounter(CountCache(cache_path), fetch, requests_per_second=100)
+    headings = get_headings(make_tree(), counter, threshold=10000)
+    assert sorted(headings) == ["big_grandchild_1", "big_grandchild_2", "medium_child"]
+    # Every heading is only fetched once, even though children are prefetched
+    assert sorted(fetched) == sorted(set(fetched))
+    assert "tiny_grandchild" in fetched
+
+    # A new run with a different threshold is answered entirely from the cache
+    fetch, fetched = make_fetch()
+    counter = HeadingCounter(CountCache(cache_path), fetch, requests_per_second=100)
+    headings = get_headings(make_tree(), counter, threshold=13000)
+    # Only one grandchild passes, so its parent is used instead
+    assert sorted(headings) == ["big_child", "medium_child"]
+    assert fetched == []
+    assert counter.n_fetched == 0
+
+
+def test_cache_get_many(tmp_path):
+    cache = CountCache(str(tmp_path / "counts.sqlite"))
+    for i in range(1200):
+        cache.put(f"heading_{i}", i)
+    cache.put("heading_0", 5)
+
+    assert len(cache) == 1200
+    counts = cache.get_many([f"heading_{i}" for i in range(1300)])
+    assert len(counts) == 1200
+    assert counts["heading_0"] == 5
+    assert counts["heading_1199"] == 1199
@@ -0,0 +1,85 @@
+import pytest
+
+from indices.get_mesh_headings import build_nodes
+from indices.mesh_tree import load_mesh_tree
+
+DESCRIPTORS = [
+    ("Natural Science Disciplines", ["H01"]),
+    ("Biological Science Disciplines", ["H01.158"]),
+    ("Biology", ["H01.158.273"]),
+    ("Botany", ["H01.158.273.118"]),
+    ("Genetics", ["H01.158.273.343", "H01.158.100"]),
+    ("Chemistry", ["H01.181"]),
+    ("Humanities", ["K01"]),
+    ("Art", ["K01.093"]),
+]
+
+
+@pytest.fixture
+def mesh_file(tmp_path):
+    path = tmp_path / "mesh_descriptors.txt"
+    with open(path, "w") as out_file:
+        for heading, tree_numbers in DESCRIPTORS:
+            out_file.write("*NEWRECORD\nRECTYPE = D\n")
+            out_file.write(f"MH = {heading}\n")
+            for tree_number in tree_numbers:
+                out_file.write(f"MN = {tree_number}\n")
+            out_file.write("UI = D000000\n\n")
+    return str(path)
+
+
+def test_tree_queries(mesh_file):
+    tree = load_mesh_tree(mesh_file)
+    assert len(tree) == 9
+
+    biology = tree.find("H01.158.273")
+    assert tree.heading(biology) == "Biology"
+    assert tree.depth[biology] == 3
+    assert [tree.tree_numbers[node] for node in tree.subtree(biology)] == [
+        "H01.158.273",
+        "H01.158.273.118",
+        "H01.158.273.343",
+    ]
+    assert [tree.heading(node) for node in tree.ancestors(biology)] == [
+        "Biological Science Disciplines",
+        "Natural Science Disciplines",
+    ]
+
+    root = tree.find("H01")
+    assert [tree.tree_numbers[node] for node in tree.children(root)] == [
+        "H01.158",
+        "H01.181",
+    ]
+    assert tree.is_ancestor(root, biology)
+    assert not tree.is_ancestor(biology, root)
+    assert tree.subtree_headings(tree.find("H01.158")) == [
+        "Biological Science Disciplines",
+        "Genetics",
+        "Biology",
+        "Botany",
+    ]
+    assert len(tree.positions("Genetics")) == 2
+    assert [tree.tree_numbers[node] for node in tree.branch_roots()] == ["H01", "K01"]
+
+
+def test_cache_is_reused(mesh_file):
+    tree = load_mesh_tree(mesh_file)
+    cached_tree = load_mesh_tree(mesh_file)
+    assert cached_tree.tree_numbers == tree.tree_numbers
+    assert (cached_tree.subtree_end == tree.subtree_end).all()
+
+
+def test_build_nodes_keeps_shallowest_heading(mesh_file):
+    tree = load_mesh_tree(mesh_file)
+    (root,) = build_nodes(tree, ["H01"])
+
+    biological = root.children[0]
+    assert [child.heading for child in biological.children] == ["Genetics", "Biology"]
+    # Genetics was already added higher in the tree
+    assert [child.heading for child in biological.children[1].children] == ["Botany"]
+
+    roots = build_nodes(tree, ["H01", "K01"])
+    assert [root.heading for root in roots] == [
+        "Natural Science Disciplines",
+        "Humanities",
+    ]
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from indices.metric_store import MetricResults, write_columnar
+
+
+@pytest.fixture
+def results(tmp_path):
+    rng = np.random.default_rng(0)
+    node_to_metric = {
+        f"10.{i}/doi": float(value) for i, value in enumerate(rng.random(1000))
+    }
+    node_to_metric["10.missing/doi"] = None
+    write_columnar(str(tmp_path / "result.cols"), node_to_metric)
+    return node_to_metric, MetricResults(str(tmp_path / "result.cols"))
+
+
+def test_top_k_and_range(results):
+    node_to_metric, metric_results = results
+    valid = {doi: value for doi, value in node_to_metric.items() if value is not None}
+    ranked = sorted(valid.items(), key=lambda item: -item[1])
+
+    top_df = metric_results.top_k(10)
+    assert list(top_df["doi"]) == [doi for doi, _ in ranked[:10]]
+    assert list(top_df["value"]) == [value for _, value in ranked[:10]]
+    assert len(metric_results.top_k(5000)) == len(valid)
+
+    range_df = metric_results.value_range(0.25, 0.5)
+    expected = sorted(value for value in valid.values() if 0.25 <= value <= 0.5)
+    assert list(range_df["value"]) == expected
+
+    batches = list(metric_results.iter_batches(batch_size=300))
+    assert [len(batch) for batch in batches] == [300, 300, 300, 100]
+    assert list(batches[0]["doi"][:10]) == list(top_df["doi"])
+
+
+def test_single_doi_lookup(results):
+    node_to_metric, metric_results = results
+
+    assert len(metric_results) == len(node_to_metric)
+    for doi in ["10.0/doi", "10.500/doi", "10.999/doi"]:
+        assert metric_results.get(doi) == node_to_metric[doi]
+    assert metric_results.get("10.missing/doi") is None
+    assert "10.missing/doi" in metric_results
+    assert metric_results.get("10.1000/doi", default=-1) == -1
+    assert "a_doi_longer_than_any_stored_one" not in metric_results
+
+    assert metric_results.to_dict() == node_to_metric
+
+
+def test_empty_results(tmp_path):
+    write_columnar(str(tmp_path / "empty.cols"), {})
+    metric_results = MetricResults(str(tmp_path / "empty.cols"))
+    assert len(metric_results.top_k(10)) == 0
+    assert metric_results.get("10.0/doi") is None
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indices.overlap import (
+    build_membership_matrix,
+    build_metric_matrix,
+    overlap_counts,
+    pairwise_table,
+    pearson_matrix,
+    spearman_matrix,
+)
+
+
+def make_metrics():
+    rng = np.random.default_rng(0)
+    dois = [f"doi_{i}" for i in range(200)]
+    heading_to_metrics = {}
+    for heading in ["a", "b", "c"]:
+        members = rng.choice(dois, size=120, replace=False)
+        heading_to_metrics[heading] = {doi: rng.random() for doi in members}
+    heading_to_metrics["c"]["doi_0"] = None
+    return heading_to_metrics
+
+
+def test_overlap_counts():
+    heading_to_dois = {"a": {"1", "2", "3"}, "b": {"2", "3", "4"}, "c": {"5"}}
+
+    _, headings, presence = build_membership_matrix(heading_to_dois)
+    counts = overlap_counts(presence)
+
+    assert headings == ["a", "b", "c"]
+    assert counts.tolist() == [[3, 2, 0], [2, 3, 0], [0, 0, 1]]
+
+
+def test_correlations_match_pandas():
+    heading_to_metrics = make_metrics()
+    _, headings, values = build_metric_matrix(heading_to_metrics)
+
+    pearson = pearson_matrix(values)
+    spearman = spearman_matrix(values)
+
+    for i, heading1 in enumerate(headings):
+        for j, heading2 in enumerate(headings):
+            series1 = pd.Series(heading_to_metrics[heading1], dtype=float)
+            series2 = pd.Series(heading_to_metrics[heading2], dtype=float)
+            merged = pd.concat([series1, series2], axis=1, join="inner").dropna()
+
+            assert pearson[i, j] == pytest.approx(merged[0].corr(merged[1]))
+            assert spearman[i, j] == pytest.approx(
+                merged[0].corr(merged[1], method="spearman")
+            )
+
+
+# pandas warns about the constant heading, whose correlations are NaN
+@pytest.mark.filterwarnings("ignore:An input array is constant")
+def test_spearman_with_ties_and_small_overlaps():
+    rng = np.random.default_rng(1)
+    dois = [f"doi_{i}" for i in range(60)]
+    heading_to_metrics = {}
+    for heading, size in [("a", 40), ("b", 30), ("c", 25), ("d", 5)]:
+        members = rng.choice(dois, size=size, replace=False)
+        # Few distinct values, so there are ties within most overlaps
+        heading_to_metrics[heading] = {doi: float(rng.integers(4)) for doi in members}
+    heading_to_metrics["e"] = {doi: 1.0 for doi in dois[:10]}
+    heading_to_metrics["f"] = {dois[0]: 0.5, "doi_only_f": 0.25}
+    _, headings, values = build_metric_matrix(heading_to_metrics)
+
+    spearman = spearman_matrix(values)
+
+    for i, heading1 in enumerate(headings):
+        for j, heading2 in enumerate(headings):
+            series1 = pd.Series(heading_to_metrics[heading1], dtype=float)
+            series2 = pd.Series(heading_to_metrics[heading2], dtype=float)
+            merged = pd.concat([series1, series2], axis=1, join="inner")
+            expected = merged[0].corr(merged[1], method="spearman")
+            if np.isnan(expected):
+                assert np.isnan(spearman[i, j])
+            else:
+                assert spearman[i, j] == pytest.approx(expected)
+
+
+def test_pairwise_table():
+    heading_to_dois = {"a": {"1", "2"}, "b": {"2", "3"}}
+    _, headings, presence = build_membership_matrix(heading_to_dois)
+
+    pairwise_df = pairwise_table(headings, overlap_counts(presence))
+
+    assert pairwise_df.to_dict("records") == [
+        {"heading1": "a", "heading2": "b", "overlap_count": 1, "paper_overlap": 1 / 3}
+    ]
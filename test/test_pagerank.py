@@ -0,0 +1,170 @@
+import json
+import os
+import pickle
+import subprocess
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from indices.pagerank import (
+    FallbackFailedConvergence,
+    component_pagerank,
+    graph_to_csr,
+    pagerank,
+    pagerank_with_telemetry,
+)
+
+
+def make_fragmented_graph():
+    """A graph with a few large components, many small ones, and an isolated node"""
+    graph = nx.DiGraph()
+    for i, size in enumerate([300, 150, 80, 2, 2, 3, 5, 10, 40]):
+        component = nx.gnp_random_graph(size, 4 / size, directed=True, seed=i)
+        graph.update(nx.relabel_nodes(component, lambda node: f"{i}-{node}"))
+    graph.add_node("isolated")
+    return graph
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_component_pagerank_matches_networkx(workers):
+    graph = make_fragmented_graph()
+    expected = nx.pagerank(graph, tol=1e-12, max_iter=1000)
+
+    result = pagerank(
+        graph,
+        by_component=True,
+        small_size=20,
+        workers=workers,
+        tol=1e-10,
+        max_iter=1000,
+    )
+
+    assert result.keys() == expected.keys()
+    np.testing.assert_allclose(
+        list(result.values()), list(expected.values()), rtol=1e-7, atol=1e-12
+    )
+
+
+def test_component_pagerank_single_component():
+    graph = nx.gnp_random_graph(100, 0.05, directed=True, seed=0)
+    nodes, indptr, indices = graph_to_csr(graph)
+    expected = nx.pagerank(graph, tol=1e-12, max_iter=1000)
+
+    # Solving the whole graph directly or iteratively gives the same result
+    for small_size in [0, 1000]:
+        scores = component_pagerank(
+            indptr, indices, small_size=small_size, tol=1e-10, max_iter=1000
+        )
+        np.testing.assert_allclose(
+            scores, [expected[node] for node in nodes], rtol=1e-7, atol=1e-12
+        )
+
+
+@pytest.mark.parametrize("fallback", ["gmres", "bicgstab"])
+@pytest.mark.parametrize("by_component", [False, True])
+def test_pagerank_falls_back_when_power_iteration_fails(fallback, by_component):
+    graph = make_fragmented_graph()
+    expected = nx.pagerank(graph, tol=1e-12, max_iter=1000)
+
+    # Power iteration needs over 100 iterations to reach this tolerance, but the
+    # Krylov solvers don't
+    result, telemetry = pagerank_with_telemetry(
+        graph,
+        max_iter=50,
+        tol=1e-10,
+        fallback=fallback,
+        by_component=by_component,
+        small_size=20,
+    )
+
+    assert telemetry["fallback"] == fallback
+    assert telemetry["converged"]
+    assert result.keys() == expected.keys()
+    np.testing.assert_allclose(
+        list(result.values()), list(expected.values()), rtol=1e-6, atol=1e-12
+    )
+
+    with pytest.raises(nx.PowerIterationFailedConvergence):
+        pagerank_with_telemetry(
+            graph, max_iter=2, fallback=None, by_component=by_component
+        )
+
+
+@pytest.mark.parametrize("by_component", [False, True])
+def test_pagerank_raises_when_fallback_fails(by_component):
+    graph = make_fragmented_graph()
+
+    with pytest.raises(FallbackFailedConvergence) as error:
+        pagerank_with_telemetry(
+            graph,
+            max_iter=3,
+            tol=1e-12,
+            fallback="bicgstab",
+            fallback_max_iter=1,
+            by_component=by_component,
+            small_size=20,
+        )
+
+    telemetry = error.value.telemetry
+    assert not telemetry["converged"]
+    assert telemetry["fallback"] == "bicgstab"
+    assert telemetry["fallback_max_iter"] == 1
+    assert telemetry["wall_time_s"] > 0
+
+
+def test_run_metric_skips_unconverged_graphs(tmp_path):
+    graph_path = str(tmp_path / "graph.pkl")
+    with open(graph_path, "wb") as out_file:
+        pickle.dump(make_fragmented_graph(), out_file)
+
+    script = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "indices", "run_metric_on_graph.py"
+    )
+    result = subprocess.run(
+        [
+            sys.executable,
+            script,
+            graph_path,
+            "--out_dir",
+            str(tmp_path),
+            "--max_iter",
+            "3",
+            "--tol",
+            "1e-12",
+            "--fallback",
+            "bicgstab",
+            "--fallback_max_iter",
+            "1",
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    # The graph's scores aren't written, but the record of why is, even without
+    # --telemetry
+    assert result.returncode == 1
+    assert "graph.pkl" in result.stderr
+    assert not os.path.exists(tmp_path / "graph-pagerank.pkl")
+    with open(tmp_path / "graph-pagerank.telemetry.json") as in_file:
+        telemetry = json.load(in_file)
+    assert telemetry["file"] == graph_path
+    assert not telemetry["converged"]
+
+
+def test_pagerank_telemetry():
+    graph = make_fragmented_graph()
+
+    result, telemetry = pagerank_with_telemetry(graph)
+
+    np.testing.assert_allclose(
+        list(result.values()), list(nx.pagerank(graph).values()), atol=1e-8
+    )
+    assert telemetry["n_nodes"] == len(graph)
+    assert telemetry["n_edges"] == len(graph.edges)
+    assert telemetry["converged"]
+    assert telemetry["fallback"] is None
+    assert telemetry["iterations"] == len(telemetry["residuals"])
+    assert telemetry["residuals"][-1] < len(graph) * 1e-6
+    assert telemetry["wall_time_s"] > 0
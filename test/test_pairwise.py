@@ -0,0 +1,158 @@
+import itertools
+import os
+
+import networkx as nx
+
+from indices.pairwise import (
+    build_doi_masks,
+    build_pair_graphs,
+    extract_pair_graph,
+    heading_pair_masks,
+    index_coci_files,
+    load_union_graph,
+    pack_work_units,
+    route_pairs,
+    union_pair_edges,
+)
+from indices.synthetic import (
+    assign_headings,
+    make_citation_graph,
+    make_citation_edges,
+    write_coci_files,
+)
+
+
+def test_pack_work_units():
+    pair_to_bytes = {"a+b": 6, "a+c": 5, "b+c": 4, "c+d": 20}
+
+    work_units = pack_work_units(pair_to_bytes, budget=10)
+
+    assert work_units == [["c+d"], ["a+b", "b+c"], ["a+c"]]
+
+
+def test_pair_graphs_match_brute_force(tmp_path):
+    citing, cited = make_citation_edges(300, mean_degree=5, seed=2)
+    write_coci_files(str(tmp_path), citing, cited, edges_per_file=200)
+    full_graph = make_citation_graph(300, mean_degree=5, seed=2)
+    heading_to_dois = assign_headings(300, n_headings=3, coverage=0.6, seed=2)
+
+    heading_to_bit, doi_to_mask = build_doi_masks(heading_to_dois)
+    file_paths = sorted(str(path) for path in tmp_path.iterdir())
+    file_to_mask_counts = index_coci_files(file_paths, doi_to_mask)
+    heading_pairs = list(itertools.combinations(sorted(heading_to_dois), 2))
+    pair_to_mask = heading_pair_masks(heading_pairs, heading_to_bit)
+    pair_to_edges, pair_to_files = route_pairs(file_to_mask_counts, pair_to_mask)
+
+    pair_to_graph = {}
+
+    def on_finished(pair, graph):
+        pair_to_graph[pair] = graph
+
+    build_pair_graphs(pair_to_mask, pair_to_files, doi_to_mask, on_finished)
+
+    for heading1, heading2 in heading_pairs:
+        pair = f"{heading1}+{heading2}"
+        dois = heading_to_dois[heading1] | heading_to_dois[heading2]
+        expected = nx.DiGraph(full_graph.subgraph(dois))
+        expected.remove_nodes_from(list(nx.isolates(expected)))
+
+        assert set(pair_to_graph[pair].edges) == set(expected.edges)
+        assert pair_to_edges[pair] == len(expected.edges)
+
+
+def test_union_graph_matches_pair_graphs(tmp_path):
+    coci_dir = tmp_path / "coci"
+    coci_dir.mkdir()
+    citing, cited = make_citation_edges(300, mean_degree=5, seed=3)
+    write_coci_files(str(coci_dir), citing, cited, edges_per_file=200)
+    heading_to_dois = assign_headings(300, n_headings=4, coverage=0.5, seed=3)
+
+    heading_to_bit, doi_to_mask = build_doi_masks(heading_to_dois)
+    file_paths = sorted(str(path) for path in coci_dir.iterdir())
+    heading_pairs = list(itertools.combinations(sorted(heading_to_dois), 2))
+    pair_to_mask = heading_pair_masks(heading_pairs, heading_to_bit)
+    file_to_mask_counts = index_coci_files(file_paths, doi_to_mask)
+
+    for include_first_degree in [False, True]:
+        pair_to_edges, pair_to_files = route_pairs(
+            file_to_mask_counts, pair_to_mask, include_first_degree
+        )
+        pair_to_graph = {}
+
+        def on_finished(pair, graph):
+            pair_to_graph[pair] = graph
+
+        build_pair_graphs(
+            pair_to_mask, pair_to_files, doi_to_mask, on_finished, include_first_degree
+        )
+
+        union_path = str(tmp_path / f"union-{include_first_degree}.pkl")
+        union = load_union_graph(
+            union_path, file_paths, heading_to_bit, doi_to_mask, include_first_degree
+        )
+        assert (
+            union_pair_edges(union, pair_to_mask, include_first_degree) == pair_to_edges
+        )
+        for pair, pair_mask in pair_to_mask.items():
+            graph = extract_pair_graph(union, pair_mask, include_first_degree)
+            assert set(graph.edges) == set(pair_to_graph[pair].edges)
+
+        # The saved graph is reused as long as it was built from the same inputs
+        modified = os.path.getmtime(union_path)
+        reloaded = load_union_graph(
+            union_path, file_paths, heading_to_bit, doi_to_mask, include_first_degree
+        )
+        assert os.path.getmtime(union_path) == modified
+        assert reloaded["dois"] == union["dois"]
+        rebuilt = load_union_graph(
+            union_path,
+            file_paths[:1],
+            heading_to_bit,
+            doi_to_mask,
+            include_first_degree,
+        )
+        assert len(rebuilt["citing"]) < len(union["citing"])
+
+
+def test_more_than_64_headings(tmp_path):
+    coci_dir = tmp_path / "coci"
+    coci_dir.mkdir()
+    citing, cited = make_citation_edges(1000, mean_degree=5, seed=5)
+    write_coci_files(str(coci_dir), citing, cited, edges_per_file=1000)
+    full_graph = make_citation_graph(1000, mean_degree=5, seed=5)
+    heading_to_dois = assign_headings(1000, n_headings=70, overlap=0.3, seed=5)
+
+    heading_to_bit, doi_to_mask = build_doi_masks(heading_to_dois)
+    assert max(doi_to_mask.values()).bit_length() > 64
+    file_paths = sorted(str(path) for path in coci_dir.iterdir())
+    # Pairs of headings in the first word, across words, and in the second word
+    headings = sorted(heading_to_dois, key=heading_to_bit.get)
+    heading_pairs = [
+        (headings[0], headings[1]),
+        (headings[0], headings[69]),
+        (headings[63], headings[64]),
+        (headings[65], headings[69]),
+    ]
+    pair_to_mask = heading_pair_masks(heading_pairs, heading_to_bit)
+
+    file_to_mask_counts = index_coci_files(file_paths, doi_to_mask)
+    pair_to_edges, pair_to_files = route_pairs(file_to_mask_counts, pair_to_mask)
+    pair_to_graph = {}
+
+    def on_finished(pair, graph):
+        pair_to_graph[pair] = graph
+
+    build_pair_graphs(pair_to_mask, pair_to_files, doi_to_mask, on_finished)
+    union = load_union_graph(
+        str(tmp_path / "union.pkl"), file_paths, heading_to_bit, doi_to_mask
+    )
+
+    for heading1, heading2 in heading_pairs:
+        pair = f"{heading1}+{heading2}"
+        dois = heading_to_dois[heading1] | heading_to_dois[heading2]
+        expected = set(full_graph.subgraph(dois).edges)
+
+        assert len(expected) > 0
+        assert set(pair_to_graph[pair].edges) == expected
+        assert pair_to_edges[pair] == len(expected)
+        assert set(extract_pair_graph(union, pair_to_mask[pair]).edges) == expected
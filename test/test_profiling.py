@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from indices import profiling
+from indices.profiling import configure_profiling, profile_phase
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("INDICES_PROFILE", raising=False)
+    monkeypatch.delenv("INDICES_PROFILE_DIR", raising=False)
+    configure_profiling(argparse.Namespace(profile=True, profile_dir=str(tmp_path)))
+    yield tmp_path
+    configure_profiling(argparse.Namespace(profile=False, profile_dir=None))
+
+
+def read_records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+
+
+def test_phase_record(profile_dir, capsys):
+    with profile_phase("compute", file="graph.pkl"):
+        sum(range(1000))
+
+    (record,) = read_records(capsys)
+    assert record["phase"] == "compute"
+    assert record["file"] == "graph.pkl"
+    assert record["pid"] == os.getpid()
+    for key in ["wall_time_s", "cpu_time_s", "peak_rss_mb", "tracemalloc_peak_mb"]:
+        assert record[key] >= 0
+    assert os.path.exists(record["profile_path"])
+    assert not tracemalloc.is_tracing()
+
+
+def test_nested_phases(profile_dir, capsys):
+    with profile_phase("compute"):
+        with profile_phase("save"):
+            pass
+        # The inner phase mustn't stop the outer phase's tracing or profiling
+        assert tracemalloc.is_tracing()
+        assert profiling._PROFILER_ACTIVE
+        data = [bytes(1000) for _ in range(100)]
+    del data
+
+    inner, outer = read_records(capsys)
+    assert inner["phase"] == "save"
+    assert "profile_path" not in inner
+    assert outer["phase"] == "compute"
+    assert outer["tracemalloc_peak_mb"] > 0.09
+    assert os.path.exists(outer["profile_path"])
+    assert not tracemalloc.is_tracing()
+    assert not profiling._PROFILER_ACTIVE
+
+
+def test_nested_phase_keeps_outer_peak_rss(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("INDICES_PROFILE", raising=False)
+    monkeypatch.delenv("INDICES_PROFILE_DIR", raising=False)
+    configure_profiling(argparse.Namespace(profile=True, profile_dir=None))
+    try:
+        with profile_phase("compute"):
+            data = np.ones(300 * 1024**2 // 8)
+            del data
+            # The inner phase resets the kernel's peak, which the outer one still needs
+            with profile_phase("save"):
+                pass
+    finally:
+        configure_profiling(argparse.Namespace(profile=False, profile_dir=None))
+
+    inner, outer = read_records(capsys)
+    assert outer["peak_rss_mb"] > 300
+    assert outer["peak_rss_mb"] >= inner["peak_rss_mb"]
+    assert profiling._PEAK_RSS_STACK == []
+
+
+def test_reserved_fields_are_rejected():
+    with pytest.raises(ValueError):
+        with profile_phase("load", script="other"):
+            pass
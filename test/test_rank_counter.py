@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indices.rank_counter import (
+    RankCounter,
+    add_shuffle,
+    count_shuffles,
+    get_counter_path,
+)
+from indices.shuffle_store import ShuffleStore, get_store_path
+from indices.utils import (
+    calculate_matrix_percentiles,
+    calculate_percentiles,
+    load_single_heading,
+)
+
+
+def make_shuffles(dois, n_shuffles, seed=0):
+    rng = np.random.default_rng(seed)
+    shuffles = []
+    for _ in range(n_shuffles):
+        # Papers drop out of some shuffles, and the last paper never changes. Values
+        # are float32 so results read back from a shuffle store are unchanged
+        present = [doi for doi in dois[:-1] if rng.random() < 0.9]
+        values = rng.random(len(present)).astype(np.float32)
+        result = dict(zip(present, values.tolist()))
+        result[dois[-1]] = 0.5
+        shuffles.append(result)
+    return shuffles
+
+
+def expected_percentiles(true_vals, shuffles):
+    doi_to_shuffled_metrics = {}
+    for result in shuffles:
+        for doi, value in result.items():
+            doi_to_shuffled_metrics.setdefault(doi, []).append(value)
+    doi_to_shuffled_metrics = {
+        doi: sorted(values) for doi, values in doi_to_shuffled_metrics.items()
+    }
+    return calculate_percentiles(true_vals, doi_to_shuffled_metrics)
+
+
+def test_counter_matches_calculate_percentiles(tmp_path):
+    dois = [f"10.{i}/x" for i in range(40)]
+    true_vals = dict(zip(dois, np.random.default_rng(1).random(40).tolist()))
+    true_vals["10.0/x"] = None
+    shuffles = make_shuffles(dois, 30)
+
+    first_half, second_half = RankCounter(true_vals), RankCounter(true_vals)
+    for shuffle, result in enumerate(shuffles):
+        counter = first_half if shuffle < 15 else second_half
+        assert counter.update(shuffle, result)
+    assert not first_half.update(0, shuffles[0])
+
+    second_half.save(str(tmp_path / "second.ranks.npz"))
+    first_half.merge(RankCounter.load(str(tmp_path / "second.ranks.npz")))
+    with pytest.raises(ValueError):
+        first_half.merge(second_half)
+
+    pd.testing.assert_frame_equal(
+        first_half.to_dataframe(), expected_percentiles(true_vals, shuffles)
+    )
+
+
+def test_pickled_and_stored_shuffles_tie_the_same():
+    # The first shuffle's value is only below the true value at float64
+    true_vals = {"10.1/x": 0.1, "10.2/x": 0.5}
+    shuffles = [
+        {"10.1/x": 0.1 - 1e-12, "10.2/x": 0.25},
+        {"10.1/x": 0.05, "10.2/x": 1.0},
+    ]
+    dois = list(true_vals)
+    matrix = np.array(
+        [[result[doi] for result in shuffles] for doi in dois], dtype=np.float32
+    )
+
+    from_pickles, from_store = RankCounter(true_vals), RankCounter(true_vals)
+    for shuffle, result in enumerate(shuffles):
+        from_pickles.update(shuffle, result)
+    from_store.update_columns([0, 1], dois, matrix)
+
+    expected_df = calculate_matrix_percentiles(true_vals, dois, matrix)
+    assert expected_df["percentile"].tolist() == [0.5, 0.5]
+    pd.testing.assert_frame_equal(from_pickles.to_dataframe(), expected_df)
+    pd.testing.assert_frame_equal(from_store.to_dataframe(), expected_df)
+
+
+def test_load_single_heading_reads_counter(tmp_path, write_result):
+    (tmp_path / "shuffle_results").mkdir()
+    dois = [f"10.{i}/x" for i in range(40)]
+    true_vals = dict(zip(dois, np.random.default_rng(2).random(40).tolist()))
+    write_result(tmp_path / "a-b-pagerank.pkl", true_vals)
+    shuffles = make_shuffles(dois, 12, seed=2)
+
+    def write_shuffle(shuffle):
+        write_result(
+            tmp_path / "shuffle_results" / f"a-b-{shuffle}-pagerank.pkl",
+            shuffles[shuffle],
+        )
+
+    for shuffle in range(10):
+        write_shuffle(shuffle)
+    counter = count_shuffles(str(tmp_path), "a-b", delete=True)
+    assert counter.shuffles == set(range(10))
+    assert sorted(p.name for p in (tmp_path / "shuffle_results").iterdir()) == [
+        "a-b-pagerank.ranks.npz",
+        "a-b-pagerank.ranks.npz.lock",
+    ]
+
+    # Shuffles that finish later are counted when the heading is loaded
+    write_shuffle(10)
+    write_shuffle(11)
+    pd.testing.assert_frame_equal(
+        load_single_heading("a-b", str(tmp_path)),
+        expected_percentiles(true_vals, shuffles),
+    )
+
+
+def test_counter_includes_store_columns(tmp_path, write_result):
+    (tmp_path / "shuffle_results").mkdir()
+    dois = [f"10.{i}/x" for i in range(40)]
+    true_vals = dict(zip(dois, np.random.default_rng(3).random(40).tolist()))
+    write_result(tmp_path / "a-b-pagerank.pkl", true_vals)
+    shuffles = make_shuffles(dois, 10, seed=3)
+
+    counter = RankCounter(true_vals)
+    for shuffle in range(5):
+        counter.update(shuffle, shuffles[shuffle])
+    counter.save(get_counter_path(str(tmp_path), "a-b"))
+    # The store overlaps the counter, and its overlapping shuffles aren't recounted
+    store = ShuffleStore(get_store_path(str(tmp_path), "a-b"))
+    for shuffle in range(3, 10):
+        store.append(shuffle, shuffles[shuffle])
+
+    expected_df = expected_percentiles(true_vals, shuffles)
+    pd.testing.assert_frame_equal(
+        load_single_heading("a-b", str(tmp_path)), expected_df
+    )
+
+    counter = count_shuffles(str(tmp_path), "a-b")
+    assert counter.shuffles == set(range(10))
+    pd.testing.assert_frame_equal(counter.to_dataframe(), expected_df)
+
+
+def add_shuffle_job(counter_path, true_path, shuffle, seed):
+    dois = [f"10.{i}/x" for i in range(40)]
+    return add_shuffle(
+        counter_path, true_path, shuffle, make_shuffles(dois, 1, seed)[0]
+    )
+
+
+def test_concurrent_add_shuffle(tmp_path, write_result):
+    dois = [f"10.{i}/x" for i in range(40)]
+    true_vals = dict(zip(dois, np.random.default_rng(4).random(40).tolist()))
+    true_path = str(tmp_path / "a-b-pagerank.pkl")
+    write_result(true_path, true_vals)
+    counter_path = str(tmp_path / "a-b-pagerank.ranks.npz")
+
+    # Without the lock, jobs finishing together would overwrite each other's counts
+    n_shuffles = 24
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        counted = list(
+            executor.map(
+                add_shuffle_job,
+                [counter_path] * n_shuffles,
+                [true_path] * n_shuffles,
+                range(n_shuffles),
+                range(n_shuffles),
+            )
+        )
+    assert all(counted)
+    assert not add_shuffle_job(counter_path, true_path, 0, 0)
+
+    counter = RankCounter.load(counter_path)
+    assert counter.shuffles == set(range(n_shuffles))
+    shuffles = [make_shuffles(dois, 1, seed)[0] for seed in range(n_shuffles)]
+    pd.testing.assert_frame_equal(
+        counter.to_dataframe(), expected_percentiles(true_vals, shuffles)
+    )
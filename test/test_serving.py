@@ -0,0 +1,80 @@
+import os
+import pickle as pkl
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indices import serving
+from indices.utils import load_percentile_data
+
+
+def write_dataframes(base_dir, n_papers=20):
+    os.makedirs(os.path.join(base_dir, "percentiles"), exist_ok=True)
+    os.makedirs(os.path.join(base_dir, "journals"), exist_ok=True)
+
+    rng = np.random.default_rng(0)
+    for heading1, heading2 in [("a", "b"), ("a", "c")]:
+        percentile_df = pd.DataFrame(
+            {
+                "doi": [f"doi_{i}" for i in range(n_papers)],
+                "journal": [f"journal_{i % 3}" for i in range(n_papers)],
+                f"{heading1}_pagerank": rng.random(n_papers),
+                f"{heading2}_pagerank": rng.random(n_papers),
+            }
+        )
+        with open(f"{base_dir}/percentiles/{heading1}-{heading2}.pkl", "wb") as out:
+            pkl.dump(percentile_df, out)
+
+        medians = percentile_df.groupby("journal").median(numeric_only=True)
+        medians["journal_title"] = medians.index
+        with open(f"{base_dir}/journals/{heading1}-{heading2}.pkl", "wb") as out:
+            pkl.dump(medians, out)
+
+
+def test_store_round_trip(tmp_path):
+    base_dir = str(tmp_path)
+    write_dataframes(base_dir)
+    serving.build_store(base_dir)
+    store_path = serving.get_store_path(base_dir)
+
+    assert sorted(serving.query_heading_names(store_path)) == ["a", "b", "c"]
+    assert sorted(serving.query_pair_names(store_path, "a")) == ["b", "c"]
+    assert serving.query_pair_names(store_path, "b") == ["a"]
+
+    with open(f"{base_dir}/percentiles/a-b.pkl", "rb") as in_file:
+        expected_df = pkl.load(in_file)
+    # Pairs can be requested in either order
+    result_df = serving.query_percentile_data(store_path, "b", "a")
+    pd.testing.assert_frame_equal(result_df, expected_df)
+
+    subset_df = serving.query_percentile_data(
+        store_path, "a", "b", dois=["doi_1", "doi_4"], journal="journal_1"
+    )
+    assert list(subset_df["doi"]) == ["doi_1", "doi_4"]
+
+    with open(f"{base_dir}/journals/a-c.pkl", "rb") as in_file:
+        expected_df = pkl.load(in_file)
+    journal_df = serving.query_journal_data(store_path, "a", "c")
+    pd.testing.assert_frame_equal(journal_df, expected_df)
+
+    with pytest.raises(FileNotFoundError):
+        serving.query_percentile_data(store_path, "b", "c")
+
+
+def test_rebuilt_store_is_reloaded(tmp_path):
+    base_dir = str(tmp_path)
+    write_dataframes(base_dir)
+    serving.build_store(base_dir)
+    assert len(load_percentile_data("a", "b", base_dir)) == 20
+
+    write_dataframes(base_dir, n_papers=30)
+    serving.build_store(base_dir)
+    # Make sure the modification time changes even on coarse-grained filesystems
+    store_path = serving.get_store_path(base_dir)
+    stat = os.stat(store_path)
+    os.utime(store_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # The connection opened before the rebuild still sees the old file, so it can't
+    # be reused
+    assert len(load_percentile_data("a", "b", base_dir)) == 30
@@ -0,0 +1,114 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from indices.shuffle_store import ShuffleStore, compact, get_store_path
+from indices import utils
+from indices.utils import calculate_percentiles, load_single_heading
+
+
+def test_append_and_load(tmp_path):
+    store = ShuffleStore(str(tmp_path / "a-b-pagerank.shuffles"))
+    assert store.append(0, {"x": 0.1, "y": 0.2})
+    assert store.append(3, {"y": 0.3, "z": 0.4, "w": None})
+    assert not store.append(0, {"x": 1.0})
+
+    # Bytes left behind by an interrupted append are ignored and overwritten
+    with open(tmp_path / "a-b-pagerank.shuffles" / "values.f32", "ab") as out_file:
+        out_file.write(b"garbage!")
+    with open(tmp_path / "a-b-pagerank.shuffles" / "dois.txt", "ab") as out_file:
+        out_file.write(b"\npartial")
+    assert store.append(1, {"x": 0.5})
+
+    dois, matrix, shuffles = ShuffleStore(store.path).load()
+    assert dois == ["x", "y", "z", "w"]
+    assert shuffles == [0, 3, 1]
+    expected = np.array(
+        [
+            [0.1, np.nan, 0.5],
+            [0.2, 0.3, np.nan],
+            [np.nan, 0.4, np.nan],
+            [np.nan, np.nan, np.nan],
+        ],
+        dtype=np.float32,
+    )
+    np.testing.assert_array_equal(matrix, expected)
+
+
+def test_store_percentiles_match_pickles(tmp_path, write_result):
+    results_dir = tmp_path / "shuffle_results"
+    results_dir.mkdir()
+    rng = np.random.default_rng(0)
+    dois = [f"10.{i}/x" for i in range(50)]
+    true_vals = {doi: float(value) for doi, value in zip(dois, rng.random(50))}
+    write_result(tmp_path / "a-b-pagerank.pkl", true_vals)
+
+    doi_to_shuffled_metrics = {}
+    for shuffle in range(20):
+        # Papers drop out of some shuffles, and one paper is in none of them
+        present = [doi for doi in dois[:-1] if rng.random() < 0.9]
+        values = rng.random(len(present))
+        result = dict(zip(present, values.astype(np.float32).tolist()))
+        write_result(results_dir / f"a-b-{shuffle}-pagerank.pkl", result)
+        for doi, value in result.items():
+            doi_to_shuffled_metrics.setdefault(doi, []).append(value)
+
+    assert dict(compact(str(results_dir), delete=True)) == {"a-b": 20}
+    assert os.listdir(results_dir) == ["a-b-pagerank.shuffles"]
+    assert os.path.exists(get_store_path(str(tmp_path), "a-b"))
+
+    # Results written after compaction are read alongside the store
+    late_result = {doi: 0.5 for doi in dois}
+    write_result(results_dir / "a-b-20-pagerank.pkl", late_result)
+    for doi, values in doi_to_shuffled_metrics.items():
+        doi_to_shuffled_metrics[doi] = sorted(values + [0.5])
+    doi_to_shuffled_metrics[dois[-1]] = [0.5]
+    expected_df = calculate_percentiles(true_vals, doi_to_shuffled_metrics)
+
+    result_df = load_single_heading("a-b", str(tmp_path))
+
+    pd.testing.assert_frame_equal(
+        result_df, expected_df, check_dtype=False, check_exact=False
+    )
+
+
+def test_load_single_heading_lists_results_once(tmp_path, monkeypatch, write_result):
+    results_dir = tmp_path / "shuffle_results"
+    results_dir.mkdir()
+    write_result(tmp_path / "c-d-pagerank.pkl", {"x": 0.5, "y": 0.25})
+    store = ShuffleStore(get_store_path(str(tmp_path), "c-d"))
+    store.append(0, {"x": 0.25, "y": 0.5})
+    store.append(1, {"x": 0.75, "y": 0.125})
+
+    patterns = []
+    real_glob = glob.glob
+
+    def counting_glob(pattern, *args, **kwargs):
+        patterns.append(pattern)
+        return real_glob(pattern, *args, **kwargs)
+
+    monkeypatch.setattr(glob, "glob", counting_glob)
+    loads = []
+    real_load = utils._load_single_heading
+
+    def counting_load(*args):
+        loads.append(args[0])
+        return real_load(*args)
+
+    monkeypatch.setattr(utils, "_load_single_heading", counting_load)
+
+    assert list(load_single_heading("c-d", str(tmp_path))["count"]) == [2, 2]
+    assert len(patterns) == 1
+    # Results for other headings don't invalidate the cached frame
+    write_result(results_dir / "a-b-0-pagerank.pkl", {"x": 0.5})
+    load_single_heading("c-d", str(tmp_path))
+    assert len(patterns) == 2
+    assert loads == ["c-d"]
+
+    # A new result for the heading is picked up on the next load
+    write_result(results_dir / "c-d-2-pagerank.pkl", {"x": 0.125})
+    assert list(load_single_heading("c-d", str(tmp_path))["count"]) == [3, 2]
+    assert len(patterns) == 3
+    assert loads == ["c-d", "c-d"]
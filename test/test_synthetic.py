@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indices.synthetic import (
+    assign_headings,
+    make_citation_edges,
+    make_citation_graph,
+    synthetic_doi,
+    write_coci_files,
+    write_pubmed_xml,
+)
+from indices.utils import build_graphs, parse_mesh_headings, parse_metadata
+
+
+def test_citations_point_backwards():
+    citing, cited = make_citation_edges(500, mean_degree=5, seed=1)
+
+    assert len(citing) > 0
+    assert np.all(cited < citing)
+
+
+def test_graph_is_deterministic():
+    graph1 = make_citation_graph(200, distribution="poisson", seed=3)
+    graph2 = make_citation_graph(200, distribution="poisson", seed=3)
+
+    assert set(graph1.edges) == set(graph2.edges)
+
+
+def test_heading_overlap():
+    heading_to_dois = assign_headings(1000, n_headings=2, overlap=0.2, seed=0)
+    heading1, heading2 = heading_to_dois.values()
+
+    assert len(heading1 | heading2) == 1000
+    assert 100 < len(heading1 & heading2) < 300
+
+
+def expected_heading_edges(graph, dois):
+    return set(graph.subgraph(dois).edges)
+
+
+def test_coci_files_build_heading_graphs(tmp_path):
+    citing, cited = make_citation_edges(300, mean_degree=5, seed=4)
+    write_coci_files(str(tmp_path), citing, cited, edges_per_file=250)
+    full_graph = make_citation_graph(300, mean_degree=5, seed=4)
+    heading_to_dois = assign_headings(300, n_headings=2, coverage=0.7, seed=4)
+
+    assert len(os.listdir(tmp_path)) == -(-len(citing) // 250)
+    heading_to_graph = build_graphs(str(tmp_path), heading_to_dois)
+
+    for heading, dois in heading_to_dois.items():
+        edges = expected_heading_edges(full_graph, dois)
+        assert len(edges) > 0
+        assert set(heading_to_graph[heading].edges) == edges
+
+
+def test_pubmed_xml_parses(tmp_path):
+    pytest.importorskip("pubmedpy")
+    heading_to_dois = assign_headings(200, n_headings=2, seed=5)
+    for i, (heading, dois) in enumerate(heading_to_dois.items()):
+        write_pubmed_xml(str(tmp_path / f"{heading}.xml.xz"), dois, seed=i)
+
+    heading, dois = next(iter(heading_to_dois.items()))
+    article_df = parse_metadata(str(tmp_path / f"{heading}.xml.xz"))
+    assert set(article_df["doi"]) == dois
+    assert article_df["journal"].str.startswith("Synthetic J").all()
+    assert (
+        article_df["pmid"].astype(str) == article_df["doi"].str.rsplit(".").str[-1]
+    ).all()
+
+    assert parse_mesh_headings(str(tmp_path)) == heading_to_dois
+
+
+def test_generate_synthetic_data(tmp_path):
+    script = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "indices",
+        "generate_synthetic_data.py",
+    )
+    subprocess.run(
+        [
+            sys.executable,
+            script,
+            "--data_dir",
+            str(tmp_path / "data"),
+            "--config_file",
+            str(tmp_path / "config.json"),
+            "--n_articles",
+            "200",
+            "--n_headings",
+            "2",
+            "--edges_per_file",
+            "300",
+            "--n_shuffles",
+            "5",
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+    with open(tmp_path / "config.json") as in_file:
+        config = json.load(in_file)
+    assert config["coci_dir"] == str(tmp_path / "data" / "coci")
+    assert config["n_shuffles"] == 5
+    headings = config["headings"]
+    assert sorted(os.listdir(tmp_path / "data" / "pubmed" / "efetch")) == sorted(
+        f"{heading}.xml.xz" for heading in headings
+    )
+
+    # The citations are the same ones the library functions generate
+    citation_df = pd.concat(
+        pd.read_csv(tmp_path / "data" / "coci" / name)
+        for name in sorted(os.listdir(tmp_path / "data" / "coci"))
+    )
+    assert list(citation_df.columns[:3]) == ["oci", "citing", "cited"]
+    citing, cited = make_citation_edges(200, 10)
+    assert set(zip(citation_df["citing"], citation_df["cited"])) == {
+        (synthetic_doi(source), synthetic_doi(target))
+        for source, target in zip(citing.tolist(), cited.tolist())
+    }
+
+    heading_to_dois = assign_headings(200, 2, 0.1, 0.5)
+    assert list(heading_to_dois) == headings
+    heading_to_graph = build_graphs(config["coci_dir"], heading_to_dois)
+    full_graph = make_citation_graph(200, 10)
+    for heading, dois in heading_to_dois.items():
+        assert set(heading_to_graph[heading].edges) == expected_heading_edges(
+            full_graph, dois
+        )
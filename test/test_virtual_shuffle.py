@@ -0,0 +1,72 @@
+import pickle as pkl
+
+import networkx as nx
+import pytest
+
+from indices.shuffle_graph import (
+    get_swap_params,
+    graph_base_name,
+    graph_hash,
+    load_graph,
+    shuffle_graph,
+    write_virtual_shuffle,
+)
+from indices.split_pairwise_network import split_group_network
+
+
+def write_graph(path, graph):
+    with open(path, "wb") as out_file:
+        pkl.dump(graph, out_file)
+    return str(path)
+
+
+def test_virtual_shuffle_matches_pickled_shuffle(tmp_path, monkeypatch):
+    graph = nx.gnp_random_graph(80, 0.08, seed=1, directed=True)
+    graph = nx.relabel_nodes(graph, {node: f"10.{node}/x" for node in graph.nodes})
+    source_path = write_graph(tmp_path / "a+b.pkl", graph)
+    heading_path = write_graph(
+        tmp_path / "a.pkl", graph.subgraph([f"10.{i}/x" for i in range(40)]).copy()
+    )
+
+    with open(source_path, "rb") as in_file:
+        source = pkl.load(in_file)
+    nswap, max_tries = get_swap_params(source)
+    params = {"source_hash": graph_hash(source), "nswap": nswap, "max_tries": max_tries}
+
+    shuffle_dir = tmp_path / "shuffles"
+    shuffle_dir.mkdir()
+    virtual_path = str(shuffle_dir / "a+b-3.shuffle.json")
+    write_virtual_shuffle(virtual_path, source_path, 126, **params)
+    split_path = str(shuffle_dir / "a-b-3.shuffle.json")
+    write_virtual_shuffle(split_path, source_path, 126, heading_path, **params)
+
+    assert graph_base_name(virtual_path) == "a+b-3"
+    expected = shuffle_graph(source, seed=126)
+
+    n_swaps = []
+    directed_edge_swap = nx.directed_edge_swap
+
+    def counting_swap(*args, **kwargs):
+        n_swaps.append(kwargs["seed"])
+        return directed_edge_swap(*args, **kwargs)
+
+    monkeypatch.setattr(nx, "directed_edge_swap", counting_swap)
+
+    shuffled = load_graph(virtual_path)
+    assert list(shuffled.edges) == list(expected.edges)
+    # The kept shuffle can't be changed through the graphs handed out
+    shuffled.remove_edges_from(list(shuffled.edges))
+
+    with open(heading_path, "rb") as in_file:
+        heading_nodes = pkl.load(in_file).nodes
+    expected_split = split_group_network(expected, {"a": heading_nodes})["a"]
+    assert list(load_graph(split_path).edges) == list(expected_split.edges)
+    # Splits of the same shuffle reuse its edge swaps
+    assert n_swaps == [126]
+
+    # Changing the source network invalidates its virtual shuffles, even though it's
+    # cached
+    graph.add_edge("10.0/x", "10.79/x")
+    write_graph(tmp_path / "a+b.pkl", graph)
+    with pytest.raises(ValueError):
+        load_graph(virtual_path)